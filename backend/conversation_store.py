@@ -0,0 +1,162 @@
+"""
+Per-session conversation history for follow-up questions
+
+Each session keeps only its most recent exchanges, and sessions that go
+idle are evicted, so memory stays flat however many users are active.
+History lives in process memory by default, or in Redis (through the
+client from results_cache.py) so it is shared across workers.
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Session used by callers that don't identify one
+DEFAULT_SESSION_ID = "default"
+
+# Messages kept per session (a question and its SQL are two messages)
+DEFAULT_MAX_MESSAGES = 6
+
+# Sessions kept in process memory before the least recently used is dropped
+DEFAULT_MAX_SESSIONS = 1000
+
+# Sessions untouched for this long are evicted (1 hour)
+DEFAULT_IDLE_SECONDS = 60 * 60
+
+
+class InMemoryConversationStore:
+    """Thread-safe LRU of session histories with per-session caps and idle eviction"""
+
+    def __init__(
+        self,
+        max_messages: int = DEFAULT_MAX_MESSAGES,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        idle_seconds: float = DEFAULT_IDLE_SECONDS
+    ):
+        self.max_messages = max_messages
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        # session_id -> (messages, last access time), least recently used first
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict_idle(self, now: float):
+        """Drop idle sessions; they sit at the least recently used end"""
+        while self._sessions:
+            session_id, (_, last_access) = next(iter(self._sessions.items()))
+            if now - last_access < self.idle_seconds:
+                break
+            del self._sessions[session_id]
+
+    def get(self, session_id: str) -> List[Dict[str, str]]:
+        """Get a copy of the session's messages, oldest first"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                return []
+            self._sessions[session_id] = (entry[0], now)
+            self._sessions.move_to_end(session_id)
+            return list(entry[0])
+
+    def append(self, session_id: str, messages: List[Dict[str, str]]):
+        """Add messages to a session, keeping only the most recent max_messages"""
+        now = time.monotonic()
+        with self._lock:
+            self._evict_idle(now)
+            history = self._sessions.pop(session_id, ([], now))[0]
+            history = (history + messages)[-self.max_messages:]
+            self._sessions[session_id] = (history, now)
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def clear(self, session_id: str):
+        """Forget one session's history"""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Get the number of live sessions"""
+        with self._lock:
+            self._evict_idle(time.monotonic())
+            return {
+                "backend": "memory",
+                "sessions": len(self._sessions),
+                "max_sessions": self.max_sessions
+            }
+
+
+class RedisConversationStore:
+    """Session histories as capped Redis lists that expire when idle"""
+
+    def __init__(
+        self,
+        client,
+        max_messages: int = DEFAULT_MAX_MESSAGES,
+        idle_seconds: float = DEFAULT_IDLE_SECONDS
+    ):
+        self.client = client
+        self.max_messages = max_messages
+        self.idle_seconds = int(idle_seconds)
+
+    def _get_key(self, session_id: str) -> str:
+        """Generate Redis key for a session"""
+        return f"conversation:{session_id}"
+
+    def get(self, session_id: str) -> List[Dict[str, str]]:
+        """Get the session's messages, oldest first"""
+        key = self._get_key(session_id)
+        pipeline = self.client.pipeline()
+        pipeline.lrange(key, 0, -1)
+        pipeline.expire(key, self.idle_seconds)
+        messages, _ = pipeline.execute()
+        return [json.loads(message) for message in messages]
+
+    def append(self, session_id: str, messages: List[Dict[str, str]]):
+        """Add messages to a session, keeping only the most recent max_messages"""
+        key = self._get_key(session_id)
+        pipeline = self.client.pipeline()
+        pipeline.rpush(key, *[json.dumps(message) for message in messages])
+        pipeline.ltrim(key, -self.max_messages, -1)
+        pipeline.expire(key, self.idle_seconds)
+        pipeline.execute()
+
+    def clear(self, session_id: str):
+        """Forget one session's history"""
+        self.client.delete(self._get_key(session_id))
+
+    def stats(self) -> Dict[str, int]:
+        """Get the backend name (Redis expires sessions itself)"""
+        return {"backend": "redis"}
+
+
+def create_conversation_store():
+    """
+    Create the conversation store configured by environment variables
+
+    CONVERSATION_STORE selects "memory" (default) or "redis"; Redis falls
+    back to memory if results_cache.py couldn't connect.
+    CONVERSATION_MAX_MESSAGES, CONVERSATION_MAX_SESSIONS and
+    CONVERSATION_IDLE_SECONDS set the caps.
+    """
+    backend = os.getenv("CONVERSATION_STORE", "memory").lower()
+    max_messages = int(os.getenv("CONVERSATION_MAX_MESSAGES", str(DEFAULT_MAX_MESSAGES)))
+    max_sessions = int(os.getenv("CONVERSATION_MAX_SESSIONS", str(DEFAULT_MAX_SESSIONS)))
+    idle_seconds = float(os.getenv("CONVERSATION_IDLE_SECONDS", str(DEFAULT_IDLE_SECONDS)))
+
+    if backend == "redis":
+        import results_cache
+
+        if results_cache.is_redis_available():
+            return RedisConversationStore(results_cache.redis_client, max_messages, idle_seconds)
+        logger.warning("Redis not available for conversation history. Falling back to in-memory store.")
+    elif backend != "memory":
+        raise ValueError(f"Unknown CONVERSATION_STORE: {backend}")
+
+    return InMemoryConversationStore(max_messages, max_sessions, idle_seconds)
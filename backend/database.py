@@ -1,22 +1,441 @@
 """
 DuckDB database connection and query execution
 """
+import asyncio
 import duckdb
+import functools
+import logging
+import math
 import os
 import json
-from typing import List, Dict, Any
+import queue
+import secrets
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import List, Dict, Any, Callable, Hashable, Iterator, Optional
 from pathlib import Path
 
+import sqlglot
+from sqlglot import exp
+
+from rollups import BASE_TABLE, MAP_COLUMNS, ROLLUP_TABLE_PREFIX, parse_rollup_tables, rewrite_for_rollup
+
+logger = logging.getLogger(__name__)
+
+# Default byte budget for cached query results
+DEFAULT_RESULT_CACHE_BYTES = 64 * 1024 * 1024
+
+# Expressions whose result changes between executions of the same SQL
+NONDETERMINISTIC_EXPRESSIONS = (exp.Rand, exp.CurrentDate, exp.CurrentTime, exp.CurrentTimestamp)
+
+# Statement types allowed at the top level of a user/LLM query
+READ_ONLY_STATEMENTS = (exp.Select, exp.SetOperation)
+
+# Nodes that write, change configuration or touch other databases
+FORBIDDEN_EXPRESSIONS = (
+    exp.Insert, exp.Update, exp.Delete, exp.Merge, exp.Drop, exp.Create,
+    exp.Alter, exp.Command, exp.Pragma, exp.Set, exp.Copy, exp.Attach,
+    exp.Detach, exp.Use
+)
+
+# Table functions that read arbitrary files or run nested SQL
+FORBIDDEN_FUNCTIONS = {
+    "read_csv", "read_csv_auto", "read_parquet", "parquet_scan", "read_json",
+    "read_json_auto", "read_ndjson", "read_text", "read_blob", "st_read",
+    "glob", "query", "query_table", "sniff_csv"
+}
+
+# Schemas a query may qualify table names with
+QUERYABLE_SCHEMAS = {"", "main"}
+
+# Default byte budget for results retained behind pagination cursors
+DEFAULT_CURSOR_BYTES = 256 * 1024 * 1024
+
+# Default seconds a cursor survives without being read
+DEFAULT_CURSOR_TTL_SECONDS = 10 * 60
+
+# How long a Parquet data version is trusted before the partitions are
+# re-scanned for changes
+DATA_VERSION_CHECK_SECONDS = 1.0
+
+# Default wall-clock budget for a single query
+DEFAULT_QUERY_TIMEOUT_SECONDS = 30.0
+
+# Nutrient rate columns used for prescription passes
+NUTRIENT_RATE_COLUMNS = ["N_to_apply", "P_to_apply", "K_to_apply"]
+
+# Named, parameterized statements for the service's own hot queries. Each is
+# parsed once per connection and executed with bound $parameters.
+STATEMENTS = {
+    "count_hexes": "SELECT COUNT(*) as count FROM agricultural_hexes",
+    "field_names": """
+        SELECT DISTINCT field_name
+        FROM agricultural_hexes
+        WHERE field_name IS NOT NULL
+        ORDER BY field_name
+    """,
+    # Hexes come back in h3_index order so rows line up with cached footprints
+    "field_hexes": """
+        SELECT DISTINCT h3_index
+        FROM agricultural_hexes
+        WHERE field_name = $field_name
+        ORDER BY h3_index
+    """,
+    # Every nutrient's rate per hex in one scan of the field
+    "field_rates": f"""
+        SELECT
+            h3_index,
+            {', '.join(f'AVG({column}) as {column}' for column in NUTRIENT_RATE_COLUMNS)}
+        FROM agricultural_hexes
+        WHERE field_name = $field_name
+        GROUP BY h3_index
+        ORDER BY h3_index
+    """
+}
+
+
+def format_hex_id(h3_index: int) -> str:
+    """Render a UINT64 H3 index in its canonical hex-string form"""
+    return format(h3_index, "x")
+
+
+@functools.lru_cache(maxsize=1024)
+def _parse_sql(sql: str) -> tuple:
+    """
+    Parse DuckDB SQL into its statements, memoized on the raw SQL text
+
+    The returned trees are shared between callers; copy before modifying.
+    """
+    return tuple(statement for statement in sqlglot.parse(sql, dialect="duckdb") if statement is not None)
+
+
+def _sort_in_lists(node: exp.Expression) -> exp.Expression:
+    """Put literal IN (...) lists in a canonical order"""
+    if isinstance(node, exp.In) and node.expressions and all(isinstance(e, exp.Literal) for e in node.expressions):
+        node.set("expressions", sorted(node.expressions, key=lambda e: (e.is_string, e.this)))
+    return node
+
+
+def normalize_sql(sql: str) -> Optional[str]:
+    """
+    Canonicalize a query for use as a cache key
+
+    Whitespace and keyword casing are normalized by regenerating the SQL from
+    its syntax tree, and literal IN lists are sorted. Identifier casing is
+    kept because DuckDB uses it for result column names.
+
+    Returns:
+        The normalized SQL, or None if the query can't be parsed or is not
+        deterministic (and so must not be cached)
+    """
+    try:
+        statements = _parse_sql(sql)
+    except sqlglot.errors.ParseError:
+        return None
+
+    if len(statements) != 1:
+        return None
+    tree = statements[0]
+    if tree.find(*NONDETERMINISTIC_EXPRESSIONS) or tree.find(exp.TableSample):
+        return None
+
+    return tree.copy().transform(_sort_in_lists).sql(dialect="duckdb")
+
+
+def _visible_ctes(node: exp.Expression) -> set:
+    """Lowercased names of the CTEs a table reference can resolve to"""
+    names = set()
+    parent = node.parent
+    while parent is not None:
+        if isinstance(parent, exp.Query):
+            names.update(cte.alias.lower() for cte in parent.ctes)
+        parent = parent.parent
+    return names
+
+
+def _check_table(table: exp.Table):
+    """
+    Only allow FROM/JOIN items naming agricultural_hexes, a rollup table or a CTE
+
+    Table functions and string "table names" (which DuckDB reads as file
+    paths) are rejected.
+
+    Raises:
+        Exception: if the table reference isn't allowed
+    """
+    if not isinstance(table.this, exp.Identifier):
+        raise Exception(f"SQL contains forbidden table function: {table.this.sql(dialect='duckdb')}")
+    if table.catalog or table.db.lower() not in QUERYABLE_SCHEMAS:
+        raise Exception(f"SQL may not read other databases or schemas: {table.sql(dialect='duckdb')}")
+
+    name = table.name.lower()
+    if name == BASE_TABLE or parse_rollup_tables([name]):
+        return
+    if not table.db and name in _visible_ctes(table):
+        return
+    raise Exception(f"SQL may only read {BASE_TABLE} and its rollup tables, not: {table.name}")
+
+
+def _as_subquery(sql: str) -> str:
+    """
+    Query text to embed as FROM (...)
+
+    Regenerated from its parse tree, so a trailing "-- comment" or semicolon
+    can't swallow the closing parenthesis. SQL sqlglot can't parse keeps its
+    text, minus the semicolon, and ends on its own line.
+    """
+    try:
+        # A comment after the semicolon parses as a statement of its own
+        statements = [s for s in _parse_sql(sql) if not isinstance(s, exp.Semicolon)]
+    except sqlglot.errors.ParseError:
+        statements = []
+    if len(statements) == 1:
+        return statements[0].sql(dialect="duckdb")
+    return sql.strip().rstrip(";") + "\n"
+
+
+def _uses_geometry(sql: str) -> bool:
+    """
+    Check whether a query may touch geometry (and so needs the spatial extension)
+
+    True for ST_* functions, the geometry column and SELECT *. Queries that
+    can't be parsed are assumed to need it.
+    """
+    try:
+        statements = _parse_sql(sql)
+    except sqlglot.errors.ParseError:
+        return True
+
+    for statement in statements:
+        for node in statement.walk():
+            if isinstance(node, exp.Star) and not isinstance(node.parent, exp.Count):
+                return True
+            if isinstance(node, exp.Column) and node.name.lower() == "geometry":
+                return True
+            if isinstance(node, exp.Func):
+                function_name = node.name if isinstance(node, exp.Anonymous) else node.sql_name()
+                if function_name.lower().startswith("st_"):
+                    return True
+    return False
+
+
+def _estimate_size(value: Any) -> int:
+    """Approximate memory footprint of a query result in bytes"""
+    if hasattr(value, "nbytes"):
+        return value.nbytes
+
+    size = sys.getsizeof(value)
+    for row in value:
+        size += sys.getsizeof(row)
+        for item in row.values():
+            size += sys.getsizeof(item)
+    return size
+
+
+class QueryResultCache:
+    """Thread-safe LRU cache of query results bounded by total size in bytes"""
+
+    def __init__(self, max_bytes: int = DEFAULT_RESULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value for key (marking it recently used) or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key: Hashable, value: Any):
+        """Store a value, evicting least recently used entries to stay in budget"""
+        size = _estimate_size(value)
+        if size > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            self._entries[key] = (value, size)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted_size) = self._entries.popitem(last=False)
+                self.current_bytes -= evicted_size
+
+    def clear(self):
+        """Drop every cached result"""
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache size and hit/miss counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self.current_bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+class ResultCursorStore:
+    """
+    Query results retained for paginated reads, bounded by bytes and idle time
+
+    Results are kept as Arrow tables, so a page is a zero-copy slice. A
+    cursor expires ttl_seconds after it was last read; when the byte budget
+    is exceeded the least recently read cursors are dropped first.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_CURSOR_BYTES, ttl_seconds: float = DEFAULT_CURSOR_TTL_SECONDS):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.current_bytes = 0
+        # cursor -> (table, last read time), least recently read first
+        self._cursors = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        """Drop cursors idle longer than the TTL; they sit at the front"""
+        while self._cursors:
+            cursor, (table, last_read) = next(iter(self._cursors.items()))
+            if now - last_read < self.ttl_seconds:
+                break
+            del self._cursors[cursor]
+            self.current_bytes -= table.nbytes
+
+    def open(self, table: "pyarrow.Table") -> Optional[str]:
+        """
+        Retain a result and return a cursor token for it
+
+        Returns:
+            The cursor, or None if the result alone exceeds the byte budget
+        """
+        if table.nbytes > self.max_bytes:
+            return None
+
+        cursor = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            self._cursors[cursor] = (table, now)
+            self.current_bytes += table.nbytes
+            while self.current_bytes > self.max_bytes:
+                _, (evicted, _) = self._cursors.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+        return cursor
+
+    def get(self, cursor: str) -> Optional["pyarrow.Table"]:
+        """Return the retained result for a cursor (renewing its TTL) or None if it expired"""
+        now = time.monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._cursors.get(cursor)
+            if entry is None:
+                return None
+            self._cursors[cursor] = (entry[0], now)
+            self._cursors.move_to_end(cursor)
+            return entry[0]
+
+    def close(self, cursor: str) -> bool:
+        """Release a cursor before it expires"""
+        with self._lock:
+            entry = self._cursors.pop(cursor, None)
+            if entry is None:
+                return False
+            self.current_bytes -= entry[0].nbytes
+            return True
+
+    def clear(self):
+        """Release every cursor"""
+        with self._lock:
+            self._cursors.clear()
+            self.current_bytes = 0
+
 
 class DatabaseConnection:
-    def __init__(self, db_path: str = None):
-        """Initialize database connection"""
+    def __init__(
+        self,
+        db_path: str = None,
+        pool_size: int = 0,
+        result_cache_bytes: int = DEFAULT_RESULT_CACHE_BYTES,
+        query_timeout: float = DEFAULT_QUERY_TIMEOUT_SECONDS,
+        memory_limit: Optional[str] = None,
+        threads: Optional[int] = None,
+        parquet_dir: Optional[str] = None,
+        lazy_spatial: bool = False,
+        extension_directory: Optional[str] = None,
+        cursor_bytes: int = DEFAULT_CURSOR_BYTES,
+        cursor_ttl: float = DEFAULT_CURSOR_TTL_SECONDS
+    ):
+        """
+        Initialize database connection
+
+        Args:
+            db_path: Path to the DuckDB database file
+            pool_size: Number of pooled read-only cursors. 0 keeps a single
+                read-write connection shared by all callers.
+            result_cache_bytes: Memory budget for cached query results. 0
+                disables the cache.
+            query_timeout: Seconds a query may run before it is interrupted.
+                0 disables the timeout.
+            memory_limit: DuckDB memory_limit (e.g. "2GB"). DuckDB applies it
+                to the whole database, so it caps all concurrent queries.
+            threads: DuckDB worker threads, shared by all concurrent queries
+            parquet_dir: Directory of hive-partitioned Parquet files written by
+                load_geojson.py --storage parquet. When set, agricultural_hexes
+                is a view over the partitions and db_path is not used.
+            lazy_spatial: Skip installing the spatial extension and only load
+                it if it is already present in the extension directory. When
+                it isn't, the server still starts and geometry queries fail.
+            extension_directory: Directory holding pre-provisioned DuckDB
+                extensions
+            cursor_bytes: Memory budget for results retained behind
+                pagination cursors
+            cursor_ttl: Seconds a pagination cursor survives without being read
+        """
         if db_path is None:
             # Default to parent directory
             db_path = str(Path(__file__).parent.parent / "agricultural_data.db")
 
         self.db_path = db_path
+        self.pool_size = pool_size
+        self.query_timeout = query_timeout
+        self.memory_limit = memory_limit
+        self.threads = threads
+        self.parquet_dir = parquet_dir
+        self.lazy_spatial = lazy_spatial
+        self.extension_directory = extension_directory
+        self.timings = {}
         self.conn = None
+        self._pool = None
+        self._executor = None
+        self._connect_lock = threading.RLock()
+        self._query_lock = threading.Lock()
+        # Dedicated cursors of open result streams, and a condition that's
+        # notified as each one closes
+        self._streams = set()
+        self._streams_closed = threading.Condition()
+        self._spatial_loaded = False
+        self._prepared = {}
+        self._data_version = None
+        self._data_version_checked = -math.inf
+        self._schema_snapshot = None
+        self.result_cache = QueryResultCache(result_cache_bytes) if result_cache_bytes > 0 else None
+        self.result_cursors = ResultCursorStore(cursor_bytes, cursor_ttl)
 
         # Load schema configuration
         schema_config_path = Path(__file__).parent / "schema_config.json"
@@ -28,23 +447,296 @@ class DatabaseConnection:
 
     def connect(self):
         """Connect to DuckDB database"""
-        if self.conn is None:
-            self.conn = duckdb.connect(self.db_path, read_only=False)
-            if os.getenv("ENVIRONMENT", None) == "production":
-                current_directory = os.getenv("HOME", "/tmp")
-                self.conn.execute(f"SET home_directory='{current_directory}';")
-                self.conn.execute(f"SET secret_directory='{current_directory}/secrets_dir';")
-                self.conn.execute(f"SET extension_directory='{current_directory}/extensions_dir';")
-            # Load spatial extension
-            self.conn.install_extension("spatial");
-            self.conn.load_extension("spatial");
+        with self._connect_lock:
+            if self.conn is None:
+                started = time.perf_counter()
+                config = {}
+                if self.memory_limit:
+                    config["memory_limit"] = self.memory_limit
+                if self.threads:
+                    config["threads"] = self.threads
+                if self.parquet_dir:
+                    # The data lives in Parquet files, DuckDB only holds the view
+                    self.conn = duckdb.connect(":memory:", config=config)
+                else:
+                    self.conn = duckdb.connect(self.db_path, read_only=self.pool_size > 0, config=config)
+                self._data_version = self._storage_signature()
+                self._data_version_checked = time.monotonic()
+                if os.getenv("ENVIRONMENT", None) == "production":
+                    current_directory = os.getenv("HOME", "/tmp")
+                    self.conn.execute(f"SET home_directory='{current_directory}';")
+                    self.conn.execute(f"SET secret_directory='{current_directory}/secrets_dir';")
+                    self.conn.execute(f"SET extension_directory='{current_directory}/extensions_dir';")
+                if self.extension_directory:
+                    self.conn.execute(f"SET extension_directory='{self.extension_directory}';")
+
+                # Spatial has to be loaded before the lockdown below, since
+                # DuckDB won't load extensions afterwards
+                self._spatial_loaded = False
+                if self.lazy_spatial:
+                    # Never install on the startup path; use what's provisioned
+                    try:
+                        self._load_spatial()
+                    except duckdb.Error as e:
+                        logger.warning("Spatial extension not available, geometry queries will fail: %s", e)
+                else:
+                    self.conn.install_extension("spatial");
+                    self._load_spatial()
+
+                # Filters on field_name prune the scan to that field's partition
+                if self.parquet_dir:
+                    partitions = str(Path(self.parquet_dir).resolve() / "*" / "*.parquet")
+                    self.conn.execute(f"""
+                        CREATE VIEW agricultural_hexes AS
+                        SELECT * FROM read_parquet('{partitions}', hive_partitioning = true);
+                    """)
+
+                self._restrict_external_access()
+
+                # Cursors share the underlying database instance (and its loaded
+                # extensions) but can each run a query concurrently
+                if self.pool_size > 0:
+                    self._pool = queue.Queue(maxsize=self.pool_size)
+                    for _ in range(self.pool_size):
+                        self._pool.put(self.conn.cursor())
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(self.pool_size, 1),
+                    thread_name_prefix="duckdb"
+                )
+                self.timings["connect_seconds"] = time.perf_counter() - started
         return self.conn
 
+    def _load_spatial(self):
+        """Load the spatial extension into the database"""
+        started = time.perf_counter()
+        self.conn.load_extension("spatial");
+        self._spatial_loaded = True
+        self.timings["spatial_load_seconds"] = time.perf_counter() - started
+
+    def _restrict_external_access(self):
+        """
+        Stop queries from reading or writing files outside the database
+
+        Only the Parquet partitions stay readable. The setting covers the
+        whole database instance, so every pooled cursor, and it can't be
+        switched back on while the database is open.
+        """
+        if self.parquet_dir:
+            allowed = str(Path(self.parquet_dir).resolve()) + os.sep
+            self.conn.execute(f"SET allowed_directories = [{exp.Literal.string(allowed).sql(dialect='duckdb')}];")
+        self.conn.execute("SET enable_external_access = false;")
+
+    def _ensure_spatial(self, sql: str):
+        """
+        Refuse a geometry query when the spatial extension couldn't be loaded
+
+        Raises:
+            Exception: if the query uses geometry and spatial isn't loaded
+        """
+        self.connect()
+        if self._spatial_loaded or not _uses_geometry(sql):
+            return
+        raise Exception("The spatial extension is not available, so geometry can't be queried")
+
+    @contextmanager
+    def cursor(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """
+        Check out a connection for the duration of a query
+
+        In pool mode this blocks until one of the read-only cursors is free and
+        returns it to the pool afterwards. Otherwise the single shared
+        connection is handed out one caller at a time.
+        """
+        # Read together so a concurrent reload can't mix old and new state
+        with self._connect_lock:
+            conn = self.connect()
+            pool, query_lock = self._pool, self._query_lock
+        if pool is None:
+            with query_lock:
+                yield conn
+            return
+
+        cursor = pool.get()
+        try:
+            yield cursor
+        finally:
+            pool.put(cursor)
+
+    @contextmanager
+    def _execution_guard(self, conn: duckdb.DuckDBPyConnection) -> Iterator[None]:
+        """
+        Interrupt the query running on conn if it exceeds the time budget
+
+        Raises:
+            TimeoutError: if the query was interrupted
+        """
+        if not self.query_timeout:
+            yield
+            return
+
+        finished = threading.Event()
+
+        def interrupt():
+            if not finished.is_set():
+                conn.interrupt()
+
+        timer = threading.Timer(self.query_timeout, interrupt)
+        timer.daemon = True
+        timer.start()
+        try:
+            yield
+        except duckdb.InterruptException:
+            logger.warning("Query interrupted after %ss", self.query_timeout)
+            raise TimeoutError(f"Query exceeded the {self.query_timeout:g}s time limit")
+        finally:
+            finished.set()
+            timer.cancel()
+
+    async def run_in_executor(self, func: Callable, *args, **kwargs):
+        """
+        Run a blocking database call on the worker pool
+
+        Args:
+            func: Callable that performs the database work
+            *args, **kwargs: Arguments passed through to func
+
+        Returns:
+            Whatever func returns
+        """
+        with self._connect_lock:
+            self.connect()
+            executor = self._executor
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, functools.partial(func, *args, **kwargs))
+
+    async def execute_query_async(self, sql: str) -> List[Dict[str, Any]]:
+        """Async variant of execute_query that does not block the event loop"""
+        return await self.run_in_executor(self.execute_query, sql)
+
     def close(self):
-        """Close database connection"""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        """Close database connection, waiting for queries still running on it"""
+        with self._connect_lock:
+            retired = self._detach()
+        self._retire(*retired)
+
+    def _detach(self) -> tuple:
+        """
+        Take the connection, cursor pool and executor out of service
+
+        The caller holds _connect_lock. Nothing is closed here: queries
+        already running keep what they checked out, and the next connect()
+        opens fresh ones.
+
+        Returns:
+            (conn, pool, executor, query_lock, streams, streams_closed) for _retire
+        """
+        retired = (self.conn, self._pool, self._executor, self._query_lock, self._streams, self._streams_closed)
+        self.conn = None
+        self._pool = None
+        self._executor = None
+        self._query_lock = threading.Lock()
+        self._streams = set()
+        self._streams_closed = threading.Condition()
+        return retired
+
+    def _retire(self, conn, pool, executor, query_lock, streams, streams_closed):
+        """Close a detached connection once the queries and streams using it have finished"""
+        if executor:
+            executor.shutdown(wait=True)
+
+        # Closing the connection would close the streams' cursors under them
+        with streams_closed:
+            streams_closed.wait_for(lambda: not streams)
+
+        # Every pooled cursor is back once the queries holding them finish
+        connections = [pool.get() for _ in range(self.pool_size)] if pool else []
+        with query_lock:
+            for connection in connections + ([conn] if conn else []):
+                self._prepared.pop(id(connection), None)
+                connection.close()
+
+    def _storage_signature(self) -> str:
+        """Fingerprint the stored data so a rebuilt database gets a new version"""
+        if self.parquet_dir:
+            stats = [f.stat() for f in Path(self.parquet_dir).glob("*/*.parquet")]
+            if not stats:
+                return "empty"
+            latest = max(stat.st_mtime_ns for stat in stats)
+            total_size = sum(stat.st_size for stat in stats)
+            return f"{len(stats):x}-{latest:x}-{total_size:x}"
+        if self.db_path == ":memory:" or not os.path.exists(self.db_path):
+            return "memory"
+        stat = os.stat(self.db_path)
+        return f"{stat.st_mtime_ns:x}-{stat.st_size:x}"
+
+    def get_data_version(self) -> str:
+        """
+        Get an identifier for the currently loaded data
+
+        It changes whenever the table is reloaded, so anything derived from
+        the data (schema stats, cached results) can be keyed by it.
+        """
+        self.connect()
+        if self.parquet_dir:
+            # Partitions can be added or rewritten while we're connected, but
+            # globbing them on every cache lookup is too slow, so a version
+            # is reused for DATA_VERSION_CHECK_SECONDS
+            now = time.monotonic()
+            if now - self._data_version_checked >= DATA_VERSION_CHECK_SECONDS:
+                self._data_version = self._storage_signature()
+                self._data_version_checked = now
+        return self._data_version
+
+    def reload(self, db_path: Optional[str] = None):
+        """
+        Reconnect after the loader has rebuilt the database
+
+        New queries go to a fresh connection as soon as it is open; queries
+        already running finish on the old one, which is closed in the
+        background afterwards. Drops every cache derived from the previous
+        data version.
+
+        While this process has a database file open, DuckDB keeps it locked
+        and hands the same instance back for that path, so the loader writes
+        a new file and db_path switches to it.
+
+        Args:
+            db_path: Database file to serve from now on; None reopens the
+                current one (or re-reads PARQUET_DIR)
+        """
+        if db_path is not None:
+            if self.parquet_dir:
+                raise ValueError("A database path can't be set when serving PARQUET_DIR")
+            if not os.path.exists(db_path):
+                raise FileNotFoundError(f"Database not found: {db_path}")
+
+        with self._connect_lock:
+            previous_path = self.db_path
+            retired = self._detach()
+            try:
+                if db_path is not None:
+                    self.db_path = db_path
+                self._schema_snapshot = None
+                if self.result_cache:
+                    self.result_cache.clear()
+                self.result_cursors.clear()
+                self.connect()
+            except Exception:
+                self.db_path = previous_path
+                raise
+            finally:
+                threading.Thread(
+                    target=self._retire, args=retired, name="duckdb-retire", daemon=True
+                ).start()
+
+    def _result_cache_key(self, kind: str, sql: str) -> Optional[tuple]:
+        """Cache key for a query result, or None if it shouldn't be cached"""
+        if self.result_cache is None:
+            return None
+        normalized = normalize_sql(sql)
+        if normalized is None:
+            return None
+        return (kind, self.get_data_version(), normalized)
 
     def execute_query(self, sql: str) -> List[Dict[str, Any]]:
         """
@@ -53,20 +745,173 @@ class DatabaseConnection:
         Args:
             sql: SQL query string
 
+        Returns:
+            List of dictionaries with column names as keys. Results may be
+            served from the result cache, so treat them as read-only.
+        """
+        cache_key = self._result_cache_key("rows", sql)
+        if cache_key is not None:
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        self._ensure_spatial(sql)
+        try:
+            with self.cursor() as conn, self._execution_guard(conn):
+                result = conn.execute(sql).fetchall()
+                columns = [desc[0] for desc in conn.description]
+            rows = [dict(zip(columns, row)) for row in result]
+        except Exception as e:
+            raise Exception(f"Query execution failed: {str(e)}")
+
+        if cache_key is not None:
+            self.result_cache.put(cache_key, rows)
+        return rows
+
+    def execute_arrow(self, sql: str) -> "pyarrow.Table":
+        """
+        Execute a SQL query and return results as a columnar Arrow table
+
+        Avoids building a Python object per row, which dominates the cost of
+        large map queries.
+
+        Args:
+            sql: SQL query string
+
+        Returns:
+            pyarrow.Table with one column per result column
+        """
+        cache_key = self._result_cache_key("arrow", sql)
+        if cache_key is not None:
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                return cached
+
+        self._ensure_spatial(sql)
+        try:
+            with self.cursor() as conn, self._execution_guard(conn):
+                table = conn.execute(sql).fetch_arrow_table()
+        except Exception as e:
+            raise Exception(f"Query execution failed: {str(e)}")
+
+        if cache_key is not None:
+            self.result_cache.put(cache_key, table)
+        return table
+
+    def stream_arrow(self, sql: str, batch_size: int) -> Iterator["pyarrow.RecordBatch"]:
+        """
+        Execute a SQL query and yield its results as Arrow record batches
+
+        Batches are read from DuckDB as they're consumed, so the full result
+        is never held in memory. A stream lasts as long as its consumer keeps
+        reading, so it runs on a cursor of its own rather than one from the
+        pool (or the shared connection's lock) and can't starve other
+        queries; fetch it on any thread except the database executor. The
+        cursor is closed when the generator is exhausted or closed, and the
+        time limit applies to each fetch rather than the whole stream.
+
+        Args:
+            sql: SQL query string
+            batch_size: Maximum rows per batch
+
+        Yields:
+            pyarrow.RecordBatch objects in result order
+        """
+        cache_key = self._result_cache_key("arrow", sql)
+        if cache_key is not None:
+            cached = self.result_cache.get(cache_key)
+            if cached is not None:
+                yield from cached.to_batches(max_chunksize=batch_size)
+                return
+
+        self._ensure_spatial(sql)
+        with self._stream_cursor() as conn:
+            try:
+                with self._execution_guard(conn):
+                    reader = conn.execute(sql).fetch_record_batch(batch_size)
+            except Exception as e:
+                raise Exception(f"Query execution failed: {str(e)}")
+
+            while True:
+                try:
+                    with self._execution_guard(conn):
+                        batch = reader.read_next_batch()
+                except StopIteration:
+                    return
+                except Exception as e:
+                    raise Exception(f"Query execution failed: {str(e)}")
+                yield batch
+
+    @contextmanager
+    def _stream_cursor(self) -> Iterator[duckdb.DuckDBPyConnection]:
+        """Open a cursor for one result stream; its connection isn't retired until it closes"""
+        with self._connect_lock:
+            conn = self.connect().cursor()
+            streams, streams_closed = self._streams, self._streams_closed
+            with streams_closed:
+                streams.add(conn)
+        try:
+            yield conn
+        finally:
+            conn.close()
+            with streams_closed:
+                streams.discard(conn)
+                streams_closed.notify_all()
+
+    async def execute_arrow_async(self, sql: str) -> "pyarrow.Table":
+        """Async variant of execute_arrow that does not block the event loop"""
+        return await self.run_in_executor(self.execute_arrow, sql)
+
+    def _prepare(self, conn: duckdb.DuckDBPyConnection, name: str) -> "duckdb.Statement":
+        """Get the parsed form of a registered statement for this connection"""
+        prepared = self._prepared.setdefault(id(conn), {})
+        if name not in prepared:
+            if name not in STATEMENTS:
+                raise ValueError(f"Unknown statement: {name}")
+            prepared[name] = conn.extract_statements(STATEMENTS[name])[0]
+        return prepared[name]
+
+    def execute_statement(self, name: str, params: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Execute a registered statement from STATEMENTS with bound parameters
+
+        Values are bound rather than interpolated, so field names containing
+        quotes or spaces need no escaping.
+
+        Args:
+            name: Key in STATEMENTS
+            params: Values for the statement's $parameters
+
         Returns:
             List of dictionaries with column names as keys
         """
-        conn = self.connect()
         try:
-            result = conn.execute(sql).fetchall()
-            columns = [desc[0] for desc in conn.description]
+            with self.cursor() as conn, self._execution_guard(conn):
+                result = conn.execute(self._prepare(conn, name), params or {}).fetchall()
+                columns = [desc[0] for desc in conn.description]
             return [dict(zip(columns, row)) for row in result]
+        except ValueError:
+            raise
         except Exception as e:
             raise Exception(f"Query execution failed: {str(e)}")
 
     def get_schema_info(self) -> Dict[str, Any]:
-        """Get database schema information including rich metadata for prompt context"""
-        conn = self.connect()
+        """
+        Get database schema information including rich metadata for prompt context
+
+        The table stats are computed once per data version and served from a
+        snapshot afterwards. Treat the returned dictionary as read-only.
+        """
+        version = self.get_data_version()
+        snapshot = self._schema_snapshot
+        if snapshot is None or snapshot[0] != version:
+            with self.cursor() as conn:
+                snapshot = (version, self._build_schema_info(conn))
+            self._schema_snapshot = snapshot
+        return snapshot[1]
+
+    def _build_schema_info(self, conn: duckdb.DuckDBPyConnection) -> Dict[str, Any]:
+        """Query table stats and combine them with the schema config"""
 
         # Get sample data stats
         stats_sql = """
@@ -87,6 +932,14 @@ class DatabaseConnection:
         field_names_result = conn.execute(field_names_sql).fetchall()
         field_names = [row[0] for row in field_names_result]
 
+        # Find pre-aggregated rollup tables built by the loader
+        rollup_tables_sql = f"""
+        SELECT table_name
+        FROM information_schema.tables
+        WHERE table_name LIKE '{ROLLUP_TABLE_PREFIX}%';
+        """
+        rollups = parse_rollup_tables(row[0] for row in conn.execute(rollup_tables_sql).fetchall())
+
         # Build result with database stats
         result = {
             "table_name": "agricultural_hexes",
@@ -98,7 +951,8 @@ class DatabaseConnection:
                 "avg_K": stats[4],
                 "avg_N": stats[5]
             },
-            "field_names": field_names
+            "field_names": field_names,
+            "rollups": rollups
         }
 
         # If schema config exists, use rich metadata; otherwise fallback to basic info
@@ -120,28 +974,244 @@ class DatabaseConnection:
 
         return result
 
+    def get_rollups(self) -> Dict[int, str]:
+        """Get the available rollup tables keyed by H3 resolution"""
+        return self.get_schema_info().get("rollups", {})
+
+    def route_query(self, sql: str) -> str:
+        """
+        Rewrite a field-level aggregate query to read from the coarsest rollup
+
+        Queries that a rollup can't answer (see rollups.rewrite_for_rollup)
+        are returned unchanged.
+
+        Args:
+            sql: Validated SQL query over agricultural_hexes
+
+        Returns:
+            SQL to execute
+        """
+        rollups = self.get_rollups()
+        if not rollups:
+            return sql
+
+        try:
+            statements = _parse_sql(sql)
+        except sqlglot.errors.ParseError:
+            return sql
+        if len(statements) != 1:
+            return sql
+
+        rewritten = rewrite_for_rollup(statements[0], rollups[min(rollups)])
+        return rewritten.sql(dialect="duckdb") if rewritten is not None else sql
+
+    def describe_query(self, sql: str) -> List[Dict[str, str]]:
+        """
+        Get the result columns of a query without running it
+
+        Returns:
+            List of {"name", "type"} dictionaries (DuckDB type names), in order
+        """
+        # Drop any statement terminator; the query is embedded in another
+        sql = sql.strip().rstrip(";")
+        return [
+            {"name": row["column_name"], "type": row["column_type"]}
+            for row in self.execute_query(f"DESCRIBE {sql}")
+        ]
+
+    def sample_points(self, sql: str, x_column: str, y_column: str, max_points: int) -> Dict[str, Any]:
+        """
+        Draw up to max_points (x, y) pairs from a query's results inside DuckDB
+
+        Rows where either value is NULL are dropped before a reservoir sample,
+        so only the sampled points ever leave DuckDB.
+
+        Args:
+            sql: Query producing the points
+            x_column: Result column for x values
+            y_column: Result column for y values
+            max_points: Maximum number of pairs to return
+
+        Returns:
+            Dictionary with "x" and "y" lists of floats and "total_points",
+            the number of non-NULL pairs before sampling
+        """
+        sql = _as_subquery(sql)
+        x = exp.to_identifier(x_column, quoted=True).sql(dialect="duckdb")
+        y = exp.to_identifier(y_column, quoted=True).sql(dialect="duckdb")
+        points = (
+            f"SELECT {x}::DOUBLE AS x, {y}::DOUBLE AS y FROM ({sql}) AS scatter_source "
+            f"WHERE {x} IS NOT NULL AND {y} IS NOT NULL"
+        )
+
+        table = self.execute_arrow(f"SELECT x, y FROM ({points}) AS points USING SAMPLE reservoir({int(max_points)} ROWS)")
+
+        # A sample smaller than the reservoir already holds every point
+        total_points = table.num_rows
+        if total_points >= max_points:
+            total_points = self.execute_query(f"SELECT COUNT(*) AS count FROM ({points}) AS points")[0]["count"]
+
+        return {
+            "x": table.column("x").to_pylist(),
+            "y": table.column("y").to_pylist(),
+            "total_points": total_points
+        }
+
+    def bin_points(self, sql: str, x_column: str, y_column: str, x_bins: int, y_bins: int) -> Optional[Dict[str, Any]]:
+        """
+        Summarize a query's (x, y) pairs as a 2D histogram inside DuckDB
+
+        One statement computes the count grid over equal-width bins spanning
+        the data range, Pearson and Spearman correlation (average ranks for
+        ties) and the least-squares fit y = slope * x + intercept. The
+        payload size depends only on the bin counts.
+
+        Args:
+            sql: Query producing the points
+            x_column: Result column for x values
+            y_column: Result column for y values
+            x_bins: Number of bins along x
+            y_bins: Number of bins along y
+
+        Returns:
+            Dictionary with "counts" (y_bins rows of x_bins counts), "x_edges",
+            "y_edges", "total_points", "pearson", "spearman", "slope" and
+            "intercept", or None if no row has both values
+        """
+        sql = _as_subquery(sql)
+        x = exp.to_identifier(x_column, quoted=True).sql(dialect="duckdb")
+        y = exp.to_identifier(y_column, quoted=True).sql(dialect="duckdb")
+        x_bins, y_bins = int(x_bins), int(y_bins)
+
+        rows = self.execute_query(f"""
+            WITH points AS (
+                SELECT {x}::DOUBLE AS x, {y}::DOUBLE AS y FROM ({sql}) AS scatter_source
+                WHERE {x} IS NOT NULL AND {y} IS NOT NULL
+            ),
+            ranked AS (
+                SELECT
+                    x,
+                    y,
+                    rank() OVER (ORDER BY x) + (COUNT(*) OVER (PARTITION BY x) - 1) / 2.0 AS rank_x,
+                    rank() OVER (ORDER BY y) + (COUNT(*) OVER (PARTITION BY y) - 1) / 2.0 AS rank_y
+                FROM points
+            ),
+            stats AS (
+                SELECT
+                    COUNT(*) AS total_points,
+                    MIN(x) AS x_min, MAX(x) AS x_max,
+                    MIN(y) AS y_min, MAX(y) AS y_max,
+                    corr(y, x) AS pearson,
+                    corr(rank_y, rank_x) AS spearman,
+                    regr_slope(y, x) AS slope,
+                    regr_intercept(y, x) AS intercept
+                FROM ranked
+            ),
+            grid AS (
+                SELECT
+                    LEAST(COALESCE(FLOOR((x - x_min) / NULLIF(x_max - x_min, 0) * {x_bins}), 0), {x_bins} - 1)::INTEGER AS bin_x,
+                    LEAST(COALESCE(FLOOR((y - y_min) / NULLIF(y_max - y_min, 0) * {y_bins}), 0), {y_bins} - 1)::INTEGER AS bin_y,
+                    COUNT(*) AS count
+                FROM points, stats
+                GROUP BY ALL
+            )
+            SELECT
+                total_points, x_min, x_max, y_min, y_max, pearson, spearman, slope, intercept,
+                grid.bin_x, grid.bin_y, grid.count
+            FROM stats LEFT JOIN grid ON true
+        """)
+
+        stats = rows[0]
+        if not stats["total_points"]:
+            return None
+
+        counts = [[0] * x_bins for _ in range(y_bins)]
+        for row in rows:
+            counts[row["bin_y"]][row["bin_x"]] = row["count"]
+
+        x_width = (stats["x_max"] - stats["x_min"]) / x_bins
+        y_width = (stats["y_max"] - stats["y_min"]) / y_bins
+        return {
+            "counts": counts,
+            "x_edges": [stats["x_min"] + i * x_width for i in range(x_bins + 1)],
+            "y_edges": [stats["y_min"] + i * y_width for i in range(y_bins + 1)],
+            "total_points": stats["total_points"],
+            # Undefined (NaN) when either variable is constant
+            **{
+                key: None if stats[key] is None or math.isnan(stats[key]) else stats[key]
+                for key in ("pearson", "spearman", "slope", "intercept")
+            }
+        }
+
+    def get_map_hexes(self, field_name: Optional[str] = None, resolution: Optional[int] = None) -> "pyarrow.Table":
+        """
+        Get hexes for map display, served from the smallest table that has them
+
+        Args:
+            field_name: Optional field to restrict to
+            resolution: Coarsest H3 resolution the map needs. The smallest
+                rollup at or finer than it is used; None (or no such rollup)
+                reads the full-resolution table.
+
+        Returns:
+            pyarrow.Table with MAP_COLUMNS
+        """
+        rollups = self.get_rollups()
+        candidates = [res for res in rollups if resolution is not None and res >= resolution]
+
+        if candidates:
+            table_name = rollups[min(candidates)]
+            columns = ", ".join(MAP_COLUMNS)
+        else:
+            table_name = BASE_TABLE
+            columns = ", ".join("1 as hex_count" if col == "hex_count" else col for col in MAP_COLUMNS)
+
+        sql = f"SELECT {columns} FROM {table_name}"
+        if field_name is not None:
+            sql += f" WHERE field_name = {exp.Literal.string(field_name).sql(dialect='duckdb')}"
+        return self.execute_arrow(sql)
+
     def validate_sql(self, sql: str) -> bool:
         """
         Validate SQL query (basic safety checks)
 
+        The query is parsed as DuckDB SQL and must be a single read-only
+        statement. Keywords are checked structurally, so identifiers such as
+        last_update are not mistaken for UPDATE statements. It may only read
+        agricultural_hexes, the rollup tables and its own CTEs; DuckDB also
+        refuses file access on the server's connections (see connect).
+
         Args:
             sql: SQL query to validate
 
         Returns:
             True if valid, raises exception otherwise
         """
-        sql_lower = sql.lower().strip()
+        try:
+            statements = _parse_sql(sql)
+        except sqlglot.errors.ParseError as e:
+            raise Exception(f"SQL could not be parsed: {str(e)}")
+
+        if len(statements) != 1:
+            raise Exception("Exactly one SQL statement is allowed")
 
-        # Block dangerous operations
-        dangerous_keywords = ['drop', 'delete', 'truncate', 'alter', 'create', 'insert', 'update']
-        for keyword in dangerous_keywords:
-            if keyword in sql_lower:
-                raise Exception(f"SQL contains forbidden keyword: {keyword}")
+        tree = statements[0]
 
-        # Must be a SELECT statement
-        if not sql_lower.startswith('select'):
+        # Must be a SELECT statement (optionally with CTEs or set operations)
+        if not isinstance(tree, READ_ONLY_STATEMENTS):
             raise Exception("Only SELECT queries are allowed")
 
+        # Block dangerous operations anywhere in the tree
+        for node in tree.walk():
+            if isinstance(node, FORBIDDEN_EXPRESSIONS):
+                raise Exception(f"SQL contains forbidden operation: {node.key.upper()}")
+            if isinstance(node, exp.Table):
+                _check_table(node)
+            if isinstance(node, exp.Func):
+                function_name = (node.name if isinstance(node, exp.Anonymous) else node.sql_name()).lower()
+                if function_name in FORBIDDEN_FUNCTIONS:
+                    raise Exception(f"SQL contains forbidden function: {function_name}")
+
         return True
 
 
@@ -153,5 +1223,23 @@ def get_db() -> DatabaseConnection:
     global _db_instance
     if _db_instance is None:
         db_path = os.getenv("DATABASE_PATH", None)
-        _db_instance = DatabaseConnection(db_path)
+        pool_size = int(os.getenv("DATABASE_POOL_SIZE", "0"))
+        result_cache_bytes = int(os.getenv("QUERY_CACHE_BYTES", str(DEFAULT_RESULT_CACHE_BYTES)))
+        query_timeout = float(os.getenv("QUERY_TIMEOUT_SECONDS", str(DEFAULT_QUERY_TIMEOUT_SECONDS)))
+        threads = os.getenv("DUCKDB_THREADS", None)
+        cursor_bytes = int(os.getenv("RESULT_CURSOR_BYTES", str(DEFAULT_CURSOR_BYTES)))
+        cursor_ttl = float(os.getenv("RESULT_CURSOR_TTL_SECONDS", str(DEFAULT_CURSOR_TTL_SECONDS)))
+        _db_instance = DatabaseConnection(
+            db_path,
+            pool_size=pool_size,
+            result_cache_bytes=result_cache_bytes,
+            query_timeout=query_timeout,
+            memory_limit=os.getenv("DUCKDB_MEMORY_LIMIT", None),
+            threads=int(threads) if threads else None,
+            parquet_dir=os.getenv("PARQUET_DIR", None),
+            lazy_spatial=os.getenv("DUCKDB_LAZY_SPATIAL", "false").lower() in ("1", "true", "yes"),
+            extension_directory=os.getenv("DUCKDB_EXTENSION_DIRECTORY", None),
+            cursor_bytes=cursor_bytes,
+            cursor_ttl=cursor_ttl
+        )
     return _db_instance
@@ -0,0 +1,155 @@
+"""
+Per-field footprint geometry for prescription maps
+
+A field's boundary and hex edge topology depend only on which hexes the
+field has, not on any nutrient, so they are computed once per field and
+data version and shared by every pass and every request. Footprints live
+in an in-memory LRU and, if FOOTPRINT_CACHE_DIR is set, are also spilled
+to disk so they survive restarts and are shared between workers.
+"""
+import hashlib
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Hashable, Optional
+import logging
+
+import numpy as np
+from shapely.geometry import Polygon
+
+from zoning import HexEdges
+
+logger = logging.getLogger(__name__)
+
+# Fields kept in memory before the least recently used is dropped
+DEFAULT_FOOTPRINT_CACHE_SIZE = 64
+
+
+@dataclass
+class FieldFootprint:
+    """Geometry that depends only on a field's set of hexes"""
+    h3_indices: np.ndarray            # UINT64 hexes in h3_index order
+    boundary: Polygon                 # Convex hull of the field's cells
+    edges: Optional[HexEdges] = None  # Built on the first zoned request
+
+
+class FootprintCache:
+    """Thread-safe LRU of field footprints with an optional on-disk spill"""
+
+    def __init__(self, max_entries: int = DEFAULT_FOOTPRINT_CACHE_SIZE, spill_dir: Optional[str] = None):
+        self.max_entries = max_entries
+        self.spill_dir = Path(spill_dir) if spill_dir else None
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        if self.spill_dir:
+            self.spill_dir.mkdir(parents=True, exist_ok=True)
+
+    def _spill_prefix(self, field_name: str) -> str:
+        """File name prefix for a field (field names may hold any character)"""
+        return hashlib.sha1(field_name.encode("utf-8")).hexdigest()[:16]
+
+    def _spill_path(self, field_name: str, version: str) -> Path:
+        """Spill file for one field at one data version"""
+        return self.spill_dir / f"{self._spill_prefix(field_name)}-{version}.pkl"
+
+    def get(self, field_name: str, version: str) -> Optional[FieldFootprint]:
+        """Return the field's footprint for this data version, or None"""
+        key = (field_name, version)
+        with self._lock:
+            footprint = self._entries.get(key)
+            if footprint is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return footprint
+
+        footprint = self._read_spill(field_name, version)
+        with self._lock:
+            if footprint is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        self._remember(key, footprint)
+        return footprint
+
+    def put(self, field_name: str, version: str, footprint: FieldFootprint):
+        """Store a footprint in memory and, if configured, on disk"""
+        self._remember((field_name, version), footprint)
+        self._write_spill(field_name, version, footprint)
+
+    def _remember(self, key: Hashable, footprint: FieldFootprint):
+        """Add to the in-memory LRU, evicting the least recently used"""
+        with self._lock:
+            self._entries[key] = footprint
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def _read_spill(self, field_name: str, version: str) -> Optional[FieldFootprint]:
+        """Load a spilled footprint, ignoring missing or unreadable files"""
+        if not self.spill_dir:
+            return None
+        try:
+            with open(self._spill_path(field_name, version), "rb") as f:
+                return pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable footprint for {field_name}: {e}")
+            return None
+
+    def _write_spill(self, field_name: str, version: str, footprint: FieldFootprint):
+        """Spill a footprint to disk, replacing the field's older versions"""
+        if not self.spill_dir:
+            return
+        path = self._spill_path(field_name, version)
+        try:
+            # Write then rename so other workers never read a partial file
+            temp_path = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+            with open(temp_path, "wb") as f:
+                pickle.dump(footprint, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, path)
+            for stale in self.spill_dir.glob(f"{self._spill_prefix(field_name)}-*.pkl"):
+                if stale != path:
+                    stale.unlink(missing_ok=True)
+        except OSError as e:
+            logger.warning(f"Failed to spill footprint for {field_name}: {e}")
+
+    def clear(self):
+        """Drop every in-memory footprint (spilled files are keyed by version)"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache size and hit/miss counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "spill_dir": str(self.spill_dir) if self.spill_dir else None,
+                "hits": self.hits,
+                "misses": self.misses
+            }
+
+
+# Singleton instance, shared by every PrescriptionService
+_footprint_cache = None
+
+def get_footprint_cache() -> FootprintCache:
+    """
+    Get or create the footprint cache singleton
+
+    FOOTPRINT_CACHE_SIZE sets how many fields are kept in memory, and
+    FOOTPRINT_CACHE_DIR enables the on-disk spill.
+    """
+    global _footprint_cache
+    if _footprint_cache is None:
+        _footprint_cache = FootprintCache(
+            max_entries=int(os.getenv("FOOTPRINT_CACHE_SIZE", str(DEFAULT_FOOTPRINT_CACHE_SIZE))),
+            spill_dir=os.getenv("FOOTPRINT_CACHE_DIR", None)
+        )
+    return _footprint_cache
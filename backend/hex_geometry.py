@@ -0,0 +1,53 @@
+"""
+Bulk geometry for sets of H3 cells
+
+Cell boundaries come out as one coordinate array ready for shapely's array
+constructors, and the outline of a set of cells comes straight from H3's
+cells-to-shape routine, so no shapely object is built per cell.
+"""
+from itertools import chain
+from typing import List
+
+import h3.api.basic_int as h3
+import numpy as np
+import shapely
+from shapely.geometry import shape
+
+
+def cell_boundaries(cells: List[int]) -> np.ndarray:
+    """
+    Get the vertices of every cell as one array
+
+    Args:
+        cells: H3 indices (UINT64), all at one resolution
+
+    Returns:
+        (n, sides, 2) array of (lon, lat) vertices in H3's winding order;
+        cells with fewer vertices than the most in the set (pentagons, or
+        hexes without distortion vertices) repeat their last one
+    """
+    boundaries = list(map(h3.cell_to_boundary, cells))
+    sides = max(map(len, boundaries))
+
+    # Fill the array straight from the vertex tuples unless padding is needed
+    if min(map(len, boundaries)) < sides:
+        boundaries = [boundary + boundary[-1:] * (sides - len(boundary)) for boundary in boundaries]
+    flat = np.fromiter(
+        chain.from_iterable(chain.from_iterable(boundaries)),
+        dtype=float,
+        count=len(boundaries) * sides * 2
+    )
+    return flat.reshape(-1, sides, 2)[:, :, ::-1]
+
+
+def cells_outline(cells: List[int]) -> shapely.Geometry:
+    """
+    Dissolve a set of cells into their outline
+
+    Args:
+        cells: H3 indices (UINT64), all at one resolution
+
+    Returns:
+        Polygon or MultiPolygon (with holes) in (lon, lat)
+    """
+    return shape(h3.cells_to_h3shape(cells).__geo_interface__)
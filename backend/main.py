@@ -1,20 +1,42 @@
 """
 FastAPI backend for agricultural hex query system
 """
+import asyncio
+import multiprocessing
+import time
+
+# Taken before the heavy imports below so the startup report covers them
+_import_started = time.perf_counter()
+
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from contextlib import aclosing
 from fastapi import FastAPI, HTTPException
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import Response, StreamingResponse
 from pydantic import BaseModel
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Union
+import json
 import os
+from decimal import Decimal
+from pathlib import Path
+import pyarrow as pa
 from dotenv import load_dotenv
 
-from query_service import QueryService
-from database import get_db
-from prescription_service import PrescriptionService
+from query_service import AsyncQueryService, DEFAULT_SCATTER_BINS, DEFAULT_STREAM_PAGE_SIZE, MAX_PAGE_SIZE
+from conversation_store import DEFAULT_SESSION_ID
+from database import get_db, format_hex_id
 
 # Load environment variables
 load_dotenv()
 
+# Cold-start timings in seconds, filled in as startup progresses
+startup_report: Dict[str, Any] = {
+    "imports_seconds": round(time.perf_counter() - _import_started, 4)
+}
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Agricultural Hex Query API",
@@ -39,18 +61,94 @@ async def startup_event():
     """Initialize services on startup"""
     global query_service
     try:
-        query_service = QueryService()
+        started = time.perf_counter()
+        query_service = AsyncQueryService()
+        startup_report["query_service_seconds"] = round(time.perf_counter() - started, 4)
         print("✓ Query service initialized")
+
+        # Warm the schema snapshot so the first question doesn't pay for it
+        started = time.perf_counter()
+        db = get_db()
+        await db.run_in_executor(db.get_schema_info)
+        startup_report["schema_warmup_seconds"] = round(time.perf_counter() - started, 4)
+        startup_report.update({name: round(seconds, 4) for name, seconds in db.timings.items()})
         print("✓ Database connected")
+
+        # Opt-in; when enabled, footprints are built off the startup path
+        # so they don't delay readiness
+        schedule_footprint_warmup()
     except Exception as e:
         print(f"✗ Failed to initialize: {str(e)}")
         raise
 
+    startup_report["total_seconds"] = round(time.perf_counter() - _import_started, 4)
+    print(f"✓ Startup complete in {startup_report['total_seconds']:.3f}s: {startup_report}")
+
+
+def warm_prescription_footprints():
+    """Cache every field's prescription footprint for the current data version"""
+    try:
+        from prescription_service import PrescriptionService
+
+        started = time.perf_counter()
+        field_count = PrescriptionService().warm_footprints()
+        print(f"✓ Prescription footprints warmed for {field_count} fields in {time.perf_counter() - started:.3f}s")
+    except Exception as e:
+        print(f"✗ Failed to warm prescription footprints: {str(e)}")
+
+
+def schedule_footprint_warmup():
+    """
+    Warm prescription footprints on a worker thread if FOOTPRINT_WARMUP is on
+
+    Off by default: warming imports geopandas, shapely and h3 and builds every
+    field's geometry, which the lazy prescription import otherwise avoids.
+    The warmed footprints live in this process; the spawned batch workers
+    only reuse them through the FOOTPRINT_CACHE_DIR spill.
+    """
+    if os.getenv("FOOTPRINT_WARMUP", "false").lower() in ("1", "true", "yes"):
+        asyncio.get_running_loop().run_in_executor(None, warm_prescription_footprints)
+
+
+# Worker processes for batch prescription maps, started on the first batch
+prescription_pool = None
+
+
+def get_prescription_pool() -> ProcessPoolExecutor:
+    """
+    Get or create the process pool for batch prescription maps
+
+    PRESCRIPTION_WORKERS sets its size (default: one per core). Workers are
+    spawned rather than forked so they don't inherit DuckDB's threads, and
+    never open the database themselves.
+    """
+    global prescription_pool
+    if prescription_pool is None:
+        workers = int(os.getenv("PRESCRIPTION_WORKERS", "0")) or os.cpu_count()
+        prescription_pool = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("spawn")
+        )
+    return prescription_pool
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release database connections, worker threads and worker processes"""
+    get_db().close()
+    if prescription_pool:
+        prescription_pool.shutdown(wait=False, cancel_futures=True)
+
 
 # Request/Response models
 class QueryRequest(BaseModel):
     question: str
     include_context: Optional[bool] = False
+    session_id: str = DEFAULT_SESSION_ID
+    hex_id_format: Optional[str] = "string"
+    scatter_mode: str = "points"
+    scatter_bins: int = DEFAULT_SCATTER_BINS
+    page_size: Optional[int] = None  # Opt-in cursor mode: rows in the first page
 
 class QueryResponse(BaseModel):
     question: str
@@ -58,12 +156,31 @@ class QueryResponse(BaseModel):
     field_name: Optional[str] = None
     sql: Optional[str] = None
     results: List[Dict[str, Any]]
-    hex_ids: List[str]
+    hex_ids: List[Union[str, int]]
     count: int
     summary: str
     view_type: Optional[str] = None
     column_metadata: Optional[Dict[str, Dict[str, str]]] = None
     scatter_plot_data: Optional[Dict[str, Any]] = None
+    cursor: Optional[str] = None
+    next_offset: Optional[int] = None
+    truncated: bool = False  # Only the first page was returned; the rest couldn't be kept
+
+class ResultPageResponse(BaseModel):
+    cursor: str
+    offset: int
+    results: List[Dict[str, Any]]
+    hex_ids: List[Union[str, int]]
+    count: int
+    next_offset: Optional[int] = None
+
+class PrescriptionScenario(BaseModel):
+    zones: int = 1
+    zoning_method: str = "quantile"
+
+class PrescriptionBatchRequest(BaseModel):
+    field_names: List[str]
+    scenarios: List[PrescriptionScenario] = [PrescriptionScenario()]
 
 class HealthResponse(BaseModel):
     status: str
@@ -76,6 +193,141 @@ class SchemaResponse(BaseModel):
     stats: Dict[str, Any]
 
 
+HEX_ID_FORMATS = ("string", "int")
+
+# "points" sends sampled points, "density" a count grid with fit statistics
+SCATTER_MODES = ("points", "density")
+
+# Upper bound on density grid bins per axis
+MAX_SCATTER_BINS = 500
+
+# Zone break methods (mirrors zoning.ZONING_METHODS, repeated here so the
+# endpoint can validate without importing shapely) and the zone cap per pass
+ZONING_METHODS = ("quantile", "jenks", "kmeans")
+MAX_PRESCRIPTION_ZONES = 20
+
+# Upper bound on fields x scenarios in one batch prescription request
+MAX_PRESCRIPTION_BATCH_JOBS = 500
+
+
+def _validate_zoning(zones: int, zoning_method: str):
+    """Reject zoning parameters the prescription service can't use"""
+    if not 1 <= zones <= MAX_PRESCRIPTION_ZONES:
+        raise HTTPException(status_code=400, detail=f"zones must be between 1 and {MAX_PRESCRIPTION_ZONES}")
+    if zoning_method not in ZONING_METHODS:
+        raise HTTPException(status_code=400, detail=f"Unknown zoning_method: {zoning_method}")
+
+
+def _scatter_bins(request: QueryRequest) -> Optional[int]:
+    """
+    Bins per axis for a density scatter plot, or None for sampled points
+
+    Raises:
+        ValueError: Unknown scatter_mode or out-of-range scatter_bins
+    """
+    if request.scatter_mode not in SCATTER_MODES:
+        raise ValueError(f"Unknown scatter_mode: {request.scatter_mode}")
+    if request.scatter_mode == "points":
+        return None
+    if not 1 <= request.scatter_bins <= MAX_SCATTER_BINS:
+        raise ValueError(f"scatter_bins must be between 1 and {MAX_SCATTER_BINS}")
+    return request.scatter_bins
+
+
+def _format_hex_ids(
+    results: Optional[List[Dict[str, Any]]],
+    hex_ids: Optional[List[Union[int, str]]],
+    hex_id_format: str
+) -> tuple:
+    """
+    Convert UINT64 H3 indexes to strings at the API edge
+
+    Hex ids are stored and processed as integers; clients get the canonical
+    string form unless they ask for "int". Note that JavaScript numbers can't
+    represent UINT64 H3 indexes exactly.
+
+    Returns:
+        Tuple of (results, hex_ids) in the requested format
+    """
+    if hex_id_format not in HEX_ID_FORMATS:
+        raise ValueError(f"Unknown hex_id_format: {hex_id_format}")
+
+    # Prescription and scatter responses, and empty results, carry no ids
+    results, hex_ids = results or [], hex_ids or []
+    if hex_id_format == "int" or not (results or hex_ids):
+        return results, hex_ids
+
+    hex_ids = [_format_hex_id(h) for h in hex_ids]
+    if results and 'h3_index' in results[0]:
+        results = [{**row, 'h3_index': _format_hex_id(row['h3_index'])} for row in results]
+    return results, hex_ids
+
+
+def _format_hex_id(h3_index: Union[int, str, None]) -> Optional[str]:
+    """String form of one H3 index; NULLs and ids that are already strings pass through"""
+    if h3_index is None or isinstance(h3_index, str):
+        return h3_index
+    return format_hex_id(h3_index)
+
+
+def _format_arrow_hex_ids(table: pa.Table, hex_id_format: str) -> pa.Table:
+    """Arrow counterpart of _format_hex_ids for columnar responses"""
+    if hex_id_format not in HEX_ID_FORMATS:
+        raise ValueError(f"Unknown hex_id_format: {hex_id_format}")
+
+    if hex_id_format == "int" or 'h3_index' not in table.column_names:
+        return table
+
+    index = table.column_names.index('h3_index')
+    hex_strings = pa.array(
+        [_format_hex_id(h) for h in table.column(index).to_pylist()],
+        type=pa.string()
+    )
+    return table.set_column(index, 'h3_index', hex_strings)
+
+
+class ColumnarJSONResponse(Response):
+    """
+    JSON response that encodes an Arrow table column by column
+
+    The body has the shape {"columns": {name: [values...]}, "count": n, ...extra}
+    and is built without ever materializing a dict per row.
+    """
+    media_type = "application/json"
+
+    def __init__(self, table: pa.Table, **extra: Any):
+        self.table = table
+        self.extra = extra
+        super().__init__(content=None)
+
+    def render(self, content: Any) -> bytes:
+        columns = []
+        for name, column in zip(self.table.column_names, self.table.columns):
+            columns.append(f"{json.dumps(name)}: {self._encode_column(column)}")
+
+        parts = [f"{json.dumps(key)}: {json.dumps(value, default=self._encode_value)}" for key, value in self.extra.items()]
+        parts.append(f'"columns": {{{", ".join(columns)}}}')
+        parts.append(f'"count": {self.table.num_rows}')
+        return ("{" + ", ".join(parts) + "}").encode("utf-8")
+
+    @staticmethod
+    def _encode_column(column: pa.ChunkedArray) -> str:
+        """Encode one column as a JSON array"""
+        # Null-free numeric columns convert in bulk through NumPy
+        if (pa.types.is_integer(column.type) or pa.types.is_floating(column.type)) and column.null_count == 0:
+            values = column.to_numpy().tolist()
+        else:
+            values = column.to_pylist()
+        return json.dumps(values, default=ColumnarJSONResponse._encode_value)
+
+    @staticmethod
+    def _encode_value(value: Any) -> Any:
+        """Fallback encoder for values json can't handle natively (decimals, dates)"""
+        if isinstance(value, Decimal):
+            return float(value)
+        return str(value)
+
+
 # Endpoints
 @app.get("/", response_model=Dict[str, str])
 async def root():
@@ -95,12 +347,18 @@ async def get_config():
     }
 
 
+@app.get("/startup")
+async def get_startup_report():
+    """Cold-start timings for this worker (imports, service init, DB connect)"""
+    return startup_report
+
+
 @app.get("/health", response_model=HealthResponse)
 async def health_check():
     """Health check endpoint"""
     try:
         db = get_db()
-        result = db.execute_query("SELECT COUNT(*) as count FROM agricultural_hexes")
+        result = await db.run_in_executor(db.execute_statement, "count_hexes")
         total_hexes = result[0]['count']
 
         return {
@@ -117,19 +375,71 @@ async def get_schema():
     """Get database schema information"""
     try:
         db = get_db()
-        schema_info = db.get_schema_info()
+        schema_info = await db.run_in_executor(db.get_schema_info)
         return schema_info
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to get schema: {str(e)}")
 
 
+@app.get("/api/hexes")
+async def get_map_hexes(
+    field_name: Optional[str] = None,
+    resolution: Optional[int] = None,
+    hex_id_format: str = "string"
+):
+    """
+    Get hex values for the map, pre-aggregated when zoomed out
+
+    Args:
+        field_name: Optional field to restrict to
+        resolution: Coarsest H3 resolution the current zoom level needs;
+            omit for full resolution
+
+    Returns:
+        Column arrays of h3_index, field_name, hex_count, area and soil values
+    """
+    try:
+        db = get_db()
+        table = await db.run_in_executor(db.get_map_hexes, field_name, resolution)
+        return ColumnarJSONResponse(_format_arrow_hex_ids(table, hex_id_format))
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Failed to get hexes: {str(e)}")
+
+
+@app.post("/api/reload")
+async def reload_database(database_file: Optional[str] = None):
+    """
+    Reconnect to the database after it has been rebuilt by the loader
+
+    Args:
+        database_file: Name of a database the loader wrote next to the one
+            being served (load_geojson.py --db-path); the API switches to it.
+            Omit to reopen the current database or Parquet partitions.
+    """
+    db = get_db()
+    db_path = None
+    if database_file is not None:
+        database_dir = Path(db.db_path).resolve().parent
+        db_path = database_dir / database_file
+        if db_path.resolve().parent != database_dir:
+            raise HTTPException(status_code=400, detail="database_file must name a file in the database directory")
+
+    try:
+        await run_in_threadpool(db.reload, str(db_path) if db_path else None)
+        await db.run_in_executor(db.get_schema_info)
+        schedule_footprint_warmup()
+        return {"message": "Database reloaded", "data_version": await db.run_in_executor(db.get_data_version)}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Reload failed: {str(e)}")
+
+
 @app.post("/api/query", response_model=QueryResponse)
 async def query_database(request: QueryRequest):
     """
     Execute a natural language query against the database
 
     Args:
-        request: QueryRequest with question and optional context flag
+        request: QueryRequest with question, optional context flag and session id
 
     Returns:
         QueryResponse with results, SQL, and hex IDs for highlighting
@@ -137,22 +447,32 @@ async def query_database(request: QueryRequest):
     if not query_service:
         raise HTTPException(status_code=500, detail="Query service not initialized")
 
+    if request.page_size is not None and not 1 <= request.page_size <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+
     try:
-        # Execute the natural language query
-        result = query_service.execute_natural_language_query(request.question)
+        # Execute the natural language query off the event loop so other
+        # requests keep being served while this one waits on the model
+        result = await query_service.execute_natural_language_query(
+            request.question, request.include_context, request.session_id, _scatter_bins(request), request.page_size
+        )
+        results, hex_ids = _format_hex_ids(result['results'], result['hex_ids'], request.hex_id_format)
 
         return QueryResponse(
             question=result['question'],
             sql=result['sql'],
             intent=result['intent'],
             field_name=result.get('field_name'),
-            results=result['results'],
-            hex_ids=result['hex_ids'],
+            results=results,
+            hex_ids=hex_ids,
             count=result['count'],
             summary=result['summary'],
             view_type=result.get('view_type'),
             column_metadata=result.get('column_metadata'),
-            scatter_plot_data=result.get('scatter_plot_data')
+            scatter_plot_data=result.get('scatter_plot_data'),
+            cursor=result.get('cursor'),
+            next_offset=result.get('next_offset'),
+            truncated=result.get('truncated', False)
         )
 
     except Exception as e:
@@ -166,64 +486,300 @@ async def query_database(request: QueryRequest):
         )
 
 
+@app.get("/api/query/pages/{cursor}", response_model=ResultPageResponse)
+async def get_query_page(cursor: str, offset: int = 0, page_size: int = 1000, hex_id_format: str = "string"):
+    """
+    Fetch a later page of a paginated /api/query result
+
+    Args:
+        cursor: Cursor returned by /api/query when page_size was set
+        offset: Index of the first row to return (next_offset of the previous page)
+        page_size: Maximum number of rows to return
+        hex_id_format: "string" for canonical H3 strings, "int" for UINT64 values
+
+    Returns:
+        ResultPageResponse with the page's rows and hex IDs
+    """
+    if not query_service:
+        raise HTTPException(status_code=500, detail="Query service not initialized")
+    if offset < 0 or not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"offset must be >= 0 and page_size between 1 and {MAX_PAGE_SIZE}")
+    if hex_id_format not in HEX_ID_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown hex_id_format: {hex_id_format}")
+
+    # Converting the slice to Python rows is CPU work; keep it off the event loop
+    page = await run_in_threadpool(query_service.get_result_page, cursor, offset, page_size)
+    if page is None:
+        raise HTTPException(status_code=404, detail="Cursor not found or expired")
+
+    page['results'], page['hex_ids'] = _format_hex_ids(page['results'], page['hex_ids'], hex_id_format)
+    return ResultPageResponse(**page)
+
+
+@app.delete("/api/query/pages/{cursor}")
+async def close_query_cursor(cursor: str):
+    """Release a paginated result before its cursor expires"""
+    db = get_db()
+    if not db.result_cursors.close(cursor):
+        raise HTTPException(status_code=404, detail="Cursor not found or expired")
+    return {"message": "Cursor closed"}
+
+
+def _sse_event(event: str, data: Dict[str, Any]) -> str:
+    """Encode one server-sent event"""
+    return _sse_encoded_event(event, json.dumps(jsonable_encoder(data)))
+
+
+def _sse_encoded_event(event: str, data_json: str) -> str:
+    """Encode one server-sent event whose data is already a JSON string"""
+    return f"event: {event}\ndata: {data_json}\n\n"
+
+
+@app.post("/api/query/stream")
+async def stream_query(request: QueryRequest, page_size: int = DEFAULT_STREAM_PAGE_SIZE):
+    """
+    Execute a natural language query, streaming each stage as server-sent events
+
+    Events arrive in order: intent, sql, results (paged rows with their
+    hex_ids, read from DuckDB as they're sent), then summary with the total
+    count and the remaining QueryResponse fields. A failure ends the stream with an error
+    event.
+
+    Args:
+        request: QueryRequest with question, optional context flag and session id
+        page_size: Rows per results event
+
+    Returns:
+        text/event-stream response
+    """
+    if not query_service:
+        raise HTTPException(status_code=500, detail="Query service not initialized")
+    if request.hex_id_format not in HEX_ID_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unknown hex_id_format: {request.hex_id_format}")
+    if not 1 <= page_size <= MAX_PAGE_SIZE:
+        raise HTTPException(status_code=400, detail=f"page_size must be between 1 and {MAX_PAGE_SIZE}")
+    try:
+        scatter_bins = _scatter_bins(request)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    async def events():
+        try:
+            stream = query_service.stream_natural_language_query(
+                request.question, request.include_context, request.session_id, page_size, scatter_bins
+            )
+            # Closed explicitly so a disconnect releases the streaming cursor
+            async with aclosing(stream):
+                async for event, data in stream:
+                    if event == "results":
+                        data["results"], data["hex_ids"] = _format_hex_ids(
+                            data["results"], data["hex_ids"], request.hex_id_format
+                        )
+                    yield _sse_event(event, data)
+        except Exception as e:
+            error_message = str(e)
+            print(f"Query error: {error_message}")
+            yield _sse_event("error", {"detail": f"Query failed: {error_message}"})
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+@app.get("/api/query/stats")
+async def get_query_stats():
+    """Model token usage (including prompt cache reads and writes) and translation cache counters"""
+    if not query_service:
+        raise HTTPException(status_code=500, detail="Query service not initialized")
+
+    return query_service.usage_stats()
+
+
 @app.post("/api/query/clear-history")
-async def clear_query_history():
-    """Clear conversation history"""
+async def clear_query_history(session_id: str = DEFAULT_SESSION_ID):
+    """Clear one session's conversation history"""
     if not query_service:
         raise HTTPException(status_code=500, detail="Query service not initialized")
 
-    query_service.clear_history()
+    await query_service.clear_history(session_id)
     return {"message": "Conversation history cleared"}
 
 
 @app.post("/api/prescription-map")
-async def create_prescription_map(field_name: str = "North of Road"):
+async def create_prescription_map(
+    field_name: str = "North of Road",
+    zones: int = 1,
+    zoning_method: str = "quantile"
+):
     """
     Create prescription maps for N, P, and K application
 
     Args:
         field_name: Name of the field to create prescriptions for
+        zones: Management zones per pass (1 = whole field at its average rate)
+        zoning_method: How zone breaks are chosen: "quantile", "jenks" or "kmeans"
 
     Returns:
         List of prescription map passes with GeoJSON data
     """
-    try:
-        prescription_service = PrescriptionService()
-        prescription_maps = prescription_service.create_prescription_maps(field_name)
+    _validate_zoning(zones, zoning_method)
 
-        return {
-            "success": True,
-            "prescription_maps": [pm.to_dict() for pm in prescription_maps],
-            "summary": {
-                "total_passes": len(prescription_maps),
-                "field_name": field_name
-            }
-        }
+    try:
+        # The GeoJSON runs to megabytes, so it's encoded in the threadpool
+        # along with the geometry work instead of by FastAPI on the event loop
+        content = await run_in_threadpool(_prescription_map_json, field_name, zones, zoning_method)
+        return Response(content=content, media_type="application/json")
 
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Failed to create prescription map: {str(e)}")
 
 
+def _prescription_map_json(field_name: str, zones: int, zoning_method: str) -> str:
+    """Build a field's prescription maps and encode the /api/prescription-map response"""
+    # Imported on first use: it pulls in geopandas, shapely and h3, which
+    # plain text queries never need
+    from prescription_service import PrescriptionService
+
+    prescription_maps = PrescriptionService().create_prescription_maps(field_name, zones, zoning_method)
+    return json.dumps({
+        "success": True,
+        "prescription_maps": [pm.to_dict() for pm in prescription_maps],
+        "summary": {
+            "total_passes": len(prescription_maps),
+            "field_name": field_name,
+            "zones": zones,
+            "zoning_method": zoning_method
+        }
+    })
+
+
+@app.post("/api/prescription-map/batch")
+async def create_prescription_maps_batch(request: PrescriptionBatchRequest):
+    """
+    Create prescription maps for many fields and scenarios on a process pool
+
+    Every field is combined with every scenario. Each field's rates are read
+    once in this process; the geometry and GeoJSON encoding for each field
+    and scenario then run on the worker pool, so whole-farm runs scale with
+    cores. Results stream back as server-sent events in the order they
+    finish: a result event per field and scenario (the single endpoint's
+    prescription_maps plus field_name, zones and zoning_method) or an error
+    event naming the one that failed, then a done event with the totals.
+
+    Args:
+        request: Field names and zoning scenarios
+
+    Returns:
+        text/event-stream response
+    """
+    job_count = len(request.field_names) * len(request.scenarios)
+    if job_count == 0:
+        raise HTTPException(status_code=400, detail="field_names and scenarios must not be empty")
+    if job_count > MAX_PRESCRIPTION_BATCH_JOBS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"At most {MAX_PRESCRIPTION_BATCH_JOBS} fields x scenarios per batch"
+        )
+    for scenario in request.scenarios:
+        _validate_zoning(scenario.zones, scenario.zoning_method)
+
+    async def build(field_name: str, scenario: PrescriptionScenario, rates_task, version: str):
+        """Build one field and scenario on the pool; returns (failed, event)"""
+        global prescription_pool
+        from prescription_service import build_prescription_maps_json
+
+        try:
+            h3_indices, rates = await rates_task
+            payload = await asyncio.get_running_loop().run_in_executor(
+                get_prescription_pool(),
+                build_prescription_maps_json,
+                field_name, version, h3_indices, rates, scenario.zones, scenario.zoning_method
+            )
+            return False, _sse_encoded_event("result", payload)
+        except Exception as e:
+            if isinstance(e, BrokenProcessPool):
+                # A worker died; start a fresh pool for later jobs
+                prescription_pool = None
+            return True, _sse_event("error", {
+                "field_name": field_name,
+                "zones": scenario.zones,
+                "zoning_method": scenario.zoning_method,
+                "detail": f"Failed to create prescription map: {str(e)}"
+            })
+
+    async def events():
+        tasks = []
+        try:
+            # Imported on first use: it pulls in geopandas, shapely and h3
+            from prescription_service import PrescriptionService
+
+            db = get_db()
+            prescription_service = PrescriptionService()
+            version = await db.run_in_executor(db.get_data_version)
+
+            # Each field's rates are read once and shared by its scenarios
+            for field_name in request.field_names:
+                rates_task = asyncio.ensure_future(
+                    db.run_in_executor(prescription_service.get_field_rates, field_name)
+                )
+                tasks += [
+                    asyncio.ensure_future(build(field_name, scenario, rates_task, version))
+                    for scenario in request.scenarios
+                ]
+
+            failed = 0
+            for finished in asyncio.as_completed(tasks):
+                job_failed, event = await finished
+                failed += job_failed
+                yield event
+            yield _sse_event("done", {"total": len(tasks), "failed": failed})
+        except Exception as e:
+            yield _sse_event("error", {"detail": f"Failed to create prescription maps: {str(e)}"})
+        finally:
+            # Don't leave queued jobs behind if the client went away
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
 @app.post("/api/query/sql")
-async def execute_sql_directly(sql: str):
+async def execute_sql_directly(sql: str, format: str = "rows", hex_id_format: str = "string"):
     """
     Execute SQL directly (for advanced users/debugging)
 
     Args:
         sql: SQL query string
+        format: "rows" for a list of row objects, "columns" for column arrays
+        hex_id_format: "string" for canonical H3 strings, "int" for UINT64 values
 
     Returns:
         Query results
     """
+    if format not in ("rows", "columns"):
+        raise HTTPException(status_code=400, detail=f"Unknown result format: {format}")
+
     try:
         db = get_db()
         db.validate_sql(sql)
-        results = db.execute_query(sql)
+
+        if format == "columns":
+            table = await db.execute_arrow_async(sql)
+            return ColumnarJSONResponse(_format_arrow_hex_ids(table, hex_id_format), sql=sql)
+
+        results = await db.execute_query_async(sql)
 
         # Extract hex_ids if present
         hex_ids = []
         if results and 'h3_index' in results[0]:
             hex_ids = [row['h3_index'] for row in results]
+        results, hex_ids = _format_hex_ids(results, hex_ids, hex_id_format)
 
         return {
             "sql": sql,
@@ -2,13 +2,26 @@
 Prescription map generation service
 """
 import json
-import h3
+import numpy as np
 import geopandas as gpd
-from shapely.geometry import Polygon, MultiPolygon
-from shapely.ops import unary_union
-from typing import List, Dict, Any
-from dataclasses import dataclass
+from shapely.geometry import Polygon
+from typing import List, Dict, Any, Optional, Tuple
+from dataclasses import dataclass, replace
 from database import get_db
+from footprint_cache import FieldFootprint, get_footprint_cache
+from hex_geometry import cell_boundaries, cells_outline
+from zoning import ZONING_METHODS, HexEdges, classify_rates, dissolve_zones, hex_edges
+
+# (pass name, rate column, unit) for each prescription pass, in output order
+NUTRIENT_PASSES = [
+    ("nitrogen pass", "N_to_apply", "lbs/acre"),
+    ("phosphorus pass", "P_to_apply", "lbs/acre"),
+    ("potassium pass", "K_to_apply", "lbs/acre")
+]
+
+# A single zone per pass is the field boundary at the field's average rate
+DEFAULT_ZONE_COUNT = 1
+DEFAULT_ZONING_METHOD = "quantile"
 
 
 @dataclass
@@ -31,97 +44,242 @@ class PrescriptionService:
     def __init__(self):
         self.db = get_db()
 
-    def create_prescription_maps(self, field_name: str) -> List[PrescriptionMap]:
+    def create_prescription_maps(
+        self,
+        field_name: str,
+        zones: int = DEFAULT_ZONE_COUNT,
+        method: str = DEFAULT_ZONING_METHOD
+    ) -> List[PrescriptionMap]:
         """
         Create prescription maps for a given field
 
+        All nutrient rates come from one query, and the field's geometry is
+        shared by every pass and cached across requests.
+
         Args:
             field_name: Name of the field to create prescriptions for
+            zones: Management zones per pass; with more than one, hexes are
+                grouped by rate and each zone is its dissolved hexes
+            method: How zone breaks are chosen: "quantile", "jenks" or "kmeans"
+
+        Returns:
+            List of PrescriptionMap objects (one for N, P, K)
+        """
+        h3_indices, rates = self.get_field_rates(field_name)
+        return self.build_prescription_maps(
+            field_name, self.db.get_data_version(), h3_indices, rates, zones, method
+        )
+
+    def get_field_rates(self, field_name: str) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Get a field's hexes and every nutrient's rate per hex
+
+        Args:
+            field_name: Name of the field
+
+        Returns:
+            (H3 indices as UINT64 in h3_index order, rate array per nutrient
+            column with NaN where a hex has no rate)
+        """
+        # Get h3 indices and every nutrient's rate (bound, not interpolated)
+        result = self.db.execute_statement("field_rates", {"field_name": field_name})
+
+        if not result or len(result) == 0:
+            raise ValueError(f"No data found for field: {field_name}")
+
+        h3_indices = np.fromiter((row['h3_index'] for row in result), dtype=np.uint64, count=len(result))
+        rates = {
+            nutrient_column: np.array([row[nutrient_column] for row in result], dtype=float)
+            for _, nutrient_column, _ in NUTRIENT_PASSES
+        }
+        return h3_indices, rates
+
+    def build_prescription_maps(
+        self,
+        field_name: str,
+        version: str,
+        h3_indices: np.ndarray,
+        rates: Dict[str, np.ndarray],
+        zones: int = DEFAULT_ZONE_COUNT,
+        method: str = DEFAULT_ZONING_METHOD
+    ) -> List[PrescriptionMap]:
+        """
+        Build every pass from rates already fetched; doesn't touch the database
+
+        Args:
+            field_name: Name of the field
+            version: Data version the rates were read at (keys the footprint cache)
+            h3_indices: Hexes from get_field_rates
+            rates: Rate arrays from get_field_rates
+            zones: Management zones per pass
+            method: How zone breaks are chosen
 
         Returns:
             List of PrescriptionMap objects (one for N, P, K)
         """
+        if zones < 1:
+            raise ValueError("zones must be at least 1")
+        if method not in ZONING_METHODS:
+            raise ValueError(f"Unknown zoning method: {method}")
+
+        # Get the geometry shared by all passes
+        footprint = self._field_footprint(field_name, version, h3_indices, with_edges=zones > 1)
+        edges = footprint.edges if zones > 1 else None
+
         # Create prescription maps for each nutrient
-        prescription_maps = []
+        return [
+            self._create_nutrient_pass(
+                rates[nutrient_column], footprint.boundary, edges, pass_name, unit, zones, method
+            )
+            for pass_name, nutrient_column, unit in NUTRIENT_PASSES
+        ]
 
-        # Nitrogen pass
-        prescription_maps.append(
-            self._create_nutrient_pass(field_name, "nitrogen pass", "N_to_apply", "lbs/acre")
-        )
+    def warm_footprints(self) -> int:
+        """
+        Cache the footprint of every field for the current data version
 
-        # Phosphorus pass
-        prescription_maps.append(
-            self._create_nutrient_pass(field_name, "phosphorus pass", "P_to_apply", "lbs/acre")
-        )
+        Returns:
+            Number of fields warmed
+        """
+        version = self.db.get_data_version()
+        fields = [row['field_name'] for row in self.db.execute_statement("field_names")]
+        for field_name in fields:
+            rows = self.db.execute_statement("field_hexes", {"field_name": field_name})
+            h3_indices = np.fromiter((row['h3_index'] for row in rows), dtype=np.uint64, count=len(rows))
+            self._field_footprint(field_name, version, h3_indices, with_edges=False)
+        return len(fields)
 
-        # Potassium pass
-        prescription_maps.append(
-            self._create_nutrient_pass(field_name, "potassium pass", "K_to_apply", "lbs/acre")
-        )
+    def _field_footprint(
+        self,
+        field_name: str,
+        version: str,
+        h3_indices: np.ndarray,
+        with_edges: bool
+    ) -> FieldFootprint:
+        """
+        Get a field's footprint from the cache, building what's missing
 
-        return prescription_maps
+        Args:
+            field_name: Name of the field
+            version: Data version the hexes were read at
+            h3_indices: The field's H3 indices (UINT64) in h3_index order
+            with_edges: Whether the hex edge topology for zoning is needed
+
+        Returns:
+            FieldFootprint for the field at that data version
+        """
+        cache = get_footprint_cache()
+        footprint = cache.get(field_name, version)
+
+        # The cached hexes must line up row for row with this request's rates
+        if footprint is None or not np.array_equal(footprint.h3_indices, h3_indices):
+            footprint = FieldFootprint(
+                h3_indices=h3_indices,
+                boundary=self._field_boundary(h3_indices.tolist())
+            )
+        elif not with_edges or footprint.edges is not None:
+            return footprint
+
+        if with_edges and footprint.edges is None:
+            footprint = replace(footprint, edges=hex_edges(cell_boundaries(h3_indices.tolist())))
+        cache.put(field_name, version, footprint)
+        return footprint
+
+    def _field_boundary(self, h3_indices: List[int]) -> Polygon:
+        """
+        Compute the boundary polygon of a field from its hexes
+
+        Args:
+            h3_indices: H3 indices (UINT64) of the field's hexes
+
+        Returns:
+            Convex hull of the field's cells
+        """
+        return cells_outline(h3_indices).convex_hull
 
     def _create_nutrient_pass(
         self,
-        field_name: str,
+        rates: np.ndarray,
+        rx_map_boundary: Polygon,
+        edges: Optional[HexEdges],
         pass_name: str,
-        nutrient_column: str,
-        unit: str
+        unit: str,
+        zones: int,
+        method: str
     ) -> PrescriptionMap:
         """
-        Create a single nutrient prescription pass with boundary polygon
+        Create a single nutrient prescription pass with one feature per zone
 
         Args:
-            field_name: Name of the field
+            rates: Per-hex rates for this nutrient (NaN where missing)
+            rx_map_boundary: Field boundary shared by all passes
+            edges: Hex edge topology shared by all passes (None for a single zone)
             pass_name: Name of the pass (e.g., "nitrogen pass")
-            nutrient_column: Column name for nutrient data (e.g., "N_to_apply")
             unit: Unit of measurement
+            zones: Number of management zones wanted
+            method: How zone breaks are chosen
 
         Returns:
             PrescriptionMap object
         """
-        # Query to get h3 indices and average nutrient rate
-        sql = f"""
-        SELECT
-            h3_index,
-            AVG({nutrient_column}) as avg_rate
-        FROM agricultural_hexes
-        WHERE field_name = '{field_name}'
-        GROUP BY h3_index
-        """
-
-        result = self.db.execute_query(sql)
+        # Hexes without a rate get no zone
+        has_rate = ~np.isnan(rates)
 
-        if not result or len(result) == 0:
-            raise ValueError(f"No data found for field: {field_name}")
-
-        # Extract h3 indices and calculate average rate
-        h3_indices = [row['h3_index'] for row in result]
-        # Filter out None values when calculating average
-        rates = [row['avg_rate'] for row in result if row['avg_rate'] is not None]
-        avg_rate = sum(rates) / len(rates) if rates else 0
-
-        compacted_h3_indices = h3.compact_cells(h3_indices)
-        h3_boundaries = [h3.cell_to_boundary(hex) for hex in compacted_h3_indices]
-        shapely_polys = []
-        for boundary in h3_boundaries:
-            shapely_polys.append(Polygon([(lon, lat) for lat, lon in boundary]))
-        rx_map_boundary = unary_union(shapely_polys).convex_hull
+        if edges is None or not has_rate.any():
+            zone_rates = [rates[has_rate].mean() if has_rate.any() else 0]
+            geometries = [rx_map_boundary]
+        else:
+            zone_labels = classify_rates(rates[has_rate], zones, method)
+            zone_count = int(zone_labels.max()) + 1
+            zone_rates = np.bincount(zone_labels, weights=rates[has_rate]) / np.bincount(zone_labels)
 
+            # Rate-less hexes are dissolved as an extra zone that is left out
+            labels = np.full(len(rates), zone_count)
+            labels[has_rate] = zone_labels
+            geometries = dissolve_zones(edges, labels)[:zone_count]
 
-        # Create MultiPolygon from all cell polygons
-        # Create GeoDataFrame with the geometry
+        # Create GeoDataFrame with a row per zone, lowest rate first
         gdf = gpd.GeoDataFrame(
-            { 'pass': [pass_name],
-                'zone_number': [1],
-                'rate': [round(avg_rate, 2)],
-                'unit': [unit]
+            { 'pass': [pass_name] * len(geometries),
+                'zone_number': list(range(1, len(geometries) + 1)),
+                'rate': [round(float(rate), 2) for rate in zone_rates],
+                'unit': [unit] * len(geometries)
             },
-            geometry=[rx_map_boundary],
+            geometry=geometries,
             crs='EPSG:4326'
         )
 
-        # Convert to GeoJSON dict
-        geojson = json.loads(gdf.to_json())
+        # Convert to GeoJSON dict directly; coordinates come back as tuples,
+        # which serialize as arrays, so there's no to_json/loads round trip
+        geojson = gdf.to_geo_dict()
 
         return PrescriptionMap(pass_name=pass_name, geojson=geojson)
+
+
+def build_prescription_maps_json(
+    field_name: str,
+    version: str,
+    h3_indices: np.ndarray,
+    rates: Dict[str, np.ndarray],
+    zones: int,
+    method: str
+) -> str:
+    """
+    Build a field's passes and encode them as JSON
+
+    Entry point for process pool workers: the rates are passed in, so the
+    worker never opens the database, and the (large) GeoJSON is encoded on
+    the worker's core rather than the event loop.
+
+    Returns:
+        JSON object with field_name, zones, zoning_method and prescription_maps
+    """
+    prescription_maps = PrescriptionService().build_prescription_maps(
+        field_name, version, h3_indices, rates, zones, method
+    )
+    return json.dumps({
+        "field_name": field_name,
+        "zones": zones,
+        "zoning_method": method,
+        "prescription_maps": [pm.to_dict() for pm in prescription_maps]
+    })
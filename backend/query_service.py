@@ -1,24 +1,238 @@
 """
 Natural Language to SQL query service using Claude
 """
+import asyncio
+import logging
 import os
 import re
-import random
-from typing import Dict, List, Any, Optional
-from anthropic import Anthropic
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Any, AsyncIterator, Callable, Hashable, Iterator, Optional, Tuple
+import pyarrow.compute as pc
+from anthropic import Anthropic, AsyncAnthropic
 from database import get_db
+from conversation_store import DEFAULT_SESSION_ID, create_conversation_store
+
+logger = logging.getLogger(__name__)
+
+# Model used for intent detection and SQL generation
+MODEL = "claude-haiku-4-5"
+
+INTENTS = ["query", "scatter_plot", "prescription_map"]
+
+# Requests that unambiguously ask for a prescription map: the request opens
+# with a creation verb (optionally after "please" or "can you"), followed by
+# at most a pronoun and article or two, then prescription/rx/variable rate
+# wording. Anything looser (questions that merely mention prescriptions)
+# goes to the model.
+PRESCRIPTION_REQUEST_PATTERN = re.compile(
+    r"^\s*(?:please\s+|(?:can|could|would|will)\s+you\s+(?:please\s+)?)?"
+    r"(?:create|make|generate|build|draw|give|get)\s+(?:me\s+)?(?:(?:a|an|the|my|new)\s+){0,2}"
+    r"(?:prescriptions?|rx|variable[- ]rate|vra)\b",
+    re.IGNORECASE
+)
+
+# Most points sent for a scatter plot; larger results are sampled in DuckDB
+SCATTER_MAX_POINTS = 10000
+
+# Default bins per axis for density scatter plots
+DEFAULT_SCATTER_BINS = 50
+
+# DuckDB result types that can be plotted (DECIMAL(p,s) is matched by prefix)
+NUMERIC_TYPES = {
+    "TINYINT", "SMALLINT", "INTEGER", "BIGINT", "HUGEINT", "UTINYINT",
+    "USMALLINT", "UINTEGER", "UBIGINT", "UHUGEINT", "FLOAT", "DOUBLE"
+}
+
+# Rows per results event when streaming query answers
+DEFAULT_STREAM_PAGE_SIZE = 1000
+
+# Largest page a client may ask for, paged or streamed
+MAX_PAGE_SIZE = 10000
+
+# Aggregation prefixes the model puts on result column aliases ("avg_pH")
+AGGREGATE_PREFIXES = ['total_', 'avg_', 'average_', 'sum_', 'min_', 'max_', 'count_']
+
+# Default number of cached question -> SQL translations
+DEFAULT_TRANSLATION_CACHE_SIZE = 512
+
+# Structured output for the combined intent + SQL call
+QUERY_PLAN_TOOL = {
+    "name": "submit_query_plan",
+    "description": "Submit the user's intent, the field they mentioned and the DuckDB SQL that answers their request.",
+    "input_schema": {
+        "type": "object",
+        "properties": {
+            "intent": {
+                "type": "string",
+                "enum": INTENTS,
+                "description": "prescription_map for prescription / rx / variable rate map requests, scatter_plot for plots or charts of one variable against another, otherwise query"
+            },
+            "field_name": {
+                "type": ["string", "null"],
+                "description": "Exact field name from the Valid Field Names list if the user mentioned one, otherwise null"
+            },
+            "sql": {
+                "type": "string",
+                "description": "DuckDB SQL answering the request, without markdown. Empty for prescription_map."
+            }
+        },
+        "required": ["intent", "field_name", "sql"]
+    }
+}
+
+
+class TranslationCache:
+    """Thread-safe LRU cache of question translations bounded by entry count"""
+
+    def __init__(self, max_entries: int = DEFAULT_TRANSLATION_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached translation for key (marking it recently used) or None"""
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any):
+        """Store a translation, evicting the least recently used beyond max_entries"""
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop every cached translation"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, int]:
+        """Get cache size and hit/miss counters"""
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "hits": self.hits,
+                "misses": self.misses
+            }
 
 
 class QueryService:
+    # Anthropic client class; AsyncQueryService swaps in the async client
+    client_class = Anthropic
+
     def __init__(self):
         """Initialize Claude client and database"""
         api_key = os.getenv("ANTHROPIC_API_KEY")
         if not api_key:
             raise ValueError("ANTHROPIC_API_KEY environment variable not set")
 
-        self.client = Anthropic(api_key=api_key)
+        self.client = self.client_class(api_key=api_key)
         self.db = get_db()
-        self.conversation_history = []
+        self.conversations = create_conversation_store()
+
+        cache_size = int(os.getenv("TRANSLATION_CACHE_SIZE", str(DEFAULT_TRANSLATION_CACHE_SIZE)))
+        self.translation_cache = TranslationCache(cache_size) if cache_size > 0 else None
+
+        # Token totals per model call kind, reported by usage_stats
+        self._usage = {}
+        self._usage_lock = threading.Lock()
+
+        # Prompts and lookups derived from the schema of the current data version
+        self._derived = {}
+        self._derived_version = None
+        self._derived_lock = threading.Lock()
+
+    def _for_data_version(self, key: str, build: Callable[[], Any]) -> Any:
+        """
+        Memoize a value derived from the schema until the data version changes
+
+        Args:
+            key: Name of the derived value
+            build: Builds the value when it isn't memoized for this version
+
+        Returns:
+            The memoized or freshly built value
+        """
+        version = self.db.get_data_version()
+        with self._derived_lock:
+            if version != self._derived_version:
+                self._derived = {}
+                self._derived_version = version
+            if key in self._derived:
+                return self._derived[key]
+
+        value = build()
+        with self._derived_lock:
+            if version == self._derived_version:
+                self._derived[key] = value
+        return value
+
+    def _system(self) -> List[Dict[str, Any]]:
+        """
+        System prompt blocks for the query plan call, built once per data version
+
+        The prompt is marked for Anthropic prompt caching so the schema
+        prefix isn't reprocessed on every call.
+
+        Returns:
+            System content blocks for messages.create
+        """
+        prompt = self._for_data_version("plan_prompt", self._build_query_plan_prompt)
+        # claude-haiku-4-5 only caches prefixes of 4096 tokens or more. With
+        # the current schema the tool definition and this prompt come to
+        # about 2k, so the marker is ignored and the cache_read totals on
+        # /api/query/stats stay 0; it takes effect once the schema grows past
+        # the minimum or MODEL moves to one with a lower minimum
+        return [{"type": "text", "text": prompt, "cache_control": {"type": "ephemeral"}}]
+
+    def _log_usage(self, call: str, response: Any):
+        """Log and total token counts, including prompt cache reads and writes, for a model call"""
+        usage = getattr(response, "usage", None)
+        if usage is None:
+            return
+        counts = {
+            "input_tokens": usage.input_tokens,
+            "output_tokens": usage.output_tokens,
+            "cache_read_input_tokens": getattr(usage, 'cache_read_input_tokens', None) or 0,
+            "cache_creation_input_tokens": getattr(usage, 'cache_creation_input_tokens', None) or 0
+        }
+        with self._usage_lock:
+            totals = self._usage.setdefault(call, dict.fromkeys(["calls", *counts], 0))
+            totals["calls"] += 1
+            for key, value in counts.items():
+                totals[key] += value
+
+        logger.info(
+            f"{call} call tokens: input={counts['input_tokens']} output={counts['output_tokens']} "
+            f"cache_read={counts['cache_read_input_tokens']} cache_write={counts['cache_creation_input_tokens']}"
+        )
+
+    def usage_stats(self) -> Dict[str, Any]:
+        """
+        Token usage since startup
+
+        Returns:
+            Dictionary with per call kind totals of calls and tokens
+            (including prompt cache reads and writes) under "model_calls",
+            and the translation cache counters (None when disabled)
+        """
+        with self._usage_lock:
+            model_calls = {call: dict(totals) for call, totals in self._usage.items()}
+        return {
+            "model_calls": model_calls,
+            "translation_cache": self.translation_cache.stats() if self.translation_cache is not None else None
+        }
 
     def _build_system_prompt(self) -> str:
         """Build system prompt with database schema"""
@@ -130,235 +344,491 @@ Return only valid SQL. Do not include markdown code blocks or explanations."""
 
         return sql.strip()
 
-    def natural_language_to_sql(self, question: str, conversation_context: bool = False) -> str:
+    def _normalize_question(self, question: str) -> str:
         """
-        Convert natural language question to SQL using Claude
+        Normalize a question for translation cache lookups
 
-        Args:
-            question: User's natural language question
-            conversation_context: Whether to include conversation history
-
-        Returns:
-            SQL query string
+        Lowercases, collapses whitespace, drops trailing punctuation and
+        rewrites any spelling of a known field name ("north_of_road",
+        "North-of-Road") to the canonical name.
         """
-        messages = []
-
-        # Add conversation history if requested
-        if conversation_context and self.conversation_history:
-            messages.extend(self.conversation_history[-6:])  # Last 3 exchanges
-
-        # Add current question
-        messages.append({
-            "role": "user",
-            "content": question
-        })
-
-        try:
-            response = self.client.messages.create(
-                model="claude-haiku-4-5",
-                max_tokens=1024,
-                system=self._build_system_prompt(),
-                messages=messages
-            )
+        normalized = " ".join(question.lower().split()).rstrip("?.! ")
+        for field_name in self.db.get_schema_info().get('field_names', []):
+            words = [re.escape(word) for word in field_name.lower().split()]
+            pattern = r"\b" + r"[\s_-]*".join(words) + r"\b"
+            normalized = re.sub(pattern, lambda _: field_name, normalized)
+        return normalized
+
+    def _translation_key(self, kind: str, question: str) -> tuple:
+        """Translation cache key: what was cached, schema version, normalized question"""
+        return (kind, self.db.get_data_version(), self._normalize_question(question))
+
+    def _cached_translation(self, kind: str, question: str, history: List[Dict[str, str]]) -> Any:
+        """Cached translation for a question, or None on a miss or when context is in play"""
+        if self.translation_cache is None or history:
+            return None
+        return self.translation_cache.get(self._translation_key(kind, question))
 
-            sql = self._extract_sql(response.content[0].text)
+    def _context(self, session_id: str, conversation_context: bool) -> List[Dict[str, str]]:
+        """The session's recent exchanges if context was requested, otherwise none"""
+        return self.conversations.get(session_id) if conversation_context else []
 
-            # Update conversation history
-            self.conversation_history.append({
+    def _remember_exchange(self, session_id: str, question: str, sql: str):
+        """Update the session's conversation history with a question and its SQL"""
+        self.conversations.append(session_id, [
+            {
                 "role": "user",
                 "content": question
-            })
-            self.conversation_history.append({
+            },
+            {
                 "role": "assistant",
                 "content": sql
-            })
+            }
+        ])
 
-            return sql
+    def _conversation_messages(self, question: str, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+        """Messages for a model call: the session's recent exchanges, then the question"""
+        messages = list(history)
 
-        except Exception as e:
-            raise Exception(f"Failed to generate SQL: {str(e)}")
+        # Add current question
+        messages.append({
+            "role": "user",
+            "content": question
+        })
+        return messages
 
-    def _detect_intent(self, question: str) -> Dict[str, Any]:
+    def _match_field_name(self, text: Optional[str]) -> Optional[str]:
+        """Resolve a field name case-insensitively against the known fields"""
+        if not text:
+            return None
+        field_names = self.db.get_schema_info().get('field_names', [])
+        by_lower = {name.lower(): name for name in field_names}
+        return by_lower.get(text.strip().lower())
+
+    def _classify_intent_locally(self, question: str) -> Optional[Dict[str, Any]]:
         """
-        Detect user intent - whether they want a query, prescription map, or scatter plot
+        Recognize obvious prescription map requests without calling the model
 
         Args:
             question: User's natural language question
 
         Returns:
-            Dictionary with intent and extracted parameters
+            Dictionary with intent and field_name, or None if the request
+            isn't obviously a prescription map request
         """
-        # Get valid field names from schema
-        schema_info = self.db.get_schema_info()
-        field_names = schema_info.get('field_names', [])
-        field_names_text = ", ".join([f"'{name}'" for name in field_names]) if field_names else "No fields defined"
+        if not PRESCRIPTION_REQUEST_PATTERN.search(question):
+            return None
+
+        question_lower = question.lower()
+        field_names = self.db.get_schema_info().get('field_names', [])
+        mentioned = [name for name in field_names if name.lower() in question_lower]
 
-        intent_prompt = f"""You are analyzing user requests to determine their intent.
+        return {
+            "intent": "prescription_map",
+            "field_name": max(mentioned, key=len) if mentioned else None
+        }
 
-Classify the user's request into one of these categories:
+    def _build_query_plan_prompt(self) -> str:
+        """System prompt for the combined intent + SQL call"""
+        return self._build_system_prompt() + """
 
-1. "prescription_map" - User wants to create a prescription map, variable rate application map, or rx map
-   Examples: "create a prescription map", "generate rx map", "make me a prescription", "variable rate application"
+Request Classification:
+Besides writing SQL, classify the request:
+- "prescription_map": the user wants a prescription map, variable rate application map or rx map (no SQL needed)
+- "scatter_plot": the user wants a scatter plot, chart or graph relating two variables (write SQL selecting those two numeric columns)
+- "query": anything else
 
-2. "scatter_plot" - User wants to create a scatter plot, chart, or graph to visualize relationships between variables
-   Examples: "plot yield vs nitrogen", "show me a scatter plot", "chart the relationship", "graph P vs K", "visualize yield and phosphorus"
+Submit the intent, field name and SQL with the submit_query_plan tool."""
 
-3. "query" - User wants to query/search/analyze data
-   Examples: "show me hexes with low P", "what's the average yield", "find areas that need fertilizer"
+    def _cached_plan(self, question: str, history: List[Dict[str, str]]) -> Optional[Dict[str, Any]]:
+        """Cached query plan for a question, or None"""
+        plan = self._cached_translation("plan", question, history)
+        return dict(plan) if plan is not None else None
 
-Valid Field Names (use EXACTLY as shown if mentioned):
-{field_names_text}
+    def _record_plan(self, question: str, intent_info: Dict[str, Any], session_id: str):
+        """
+        Cache a fresh query plan and add its SQL to the conversation history
 
-Respond in this exact format:
-INTENT: <prescription_map or scatter_plot or query>
-FIELD: <exact field name if mentioned, otherwise "all">
+        Called only once the plan has been answered without error, so a plan
+        whose SQL fails validation or execution is neither replayed from the
+        cache nor sent back to the model as context.
 
-Important: If the user mentions a field, use the EXACT field name from the valid list above. Match it case-insensitively but return the exact capitalization.
+        Args:
+            question: User's natural language question
+            intent_info: Plan from _plan_query (or the local shortcut)
+            session_id: Conversation the question belongs to
+        """
+        # The local shortcut's plans have no SQL and aren't cacheable
+        plan = {key: intent_info.get(key) for key in ("intent", "field_name", "sql")}
+        if intent_info.get("cacheable"):
+            self.translation_cache.put(self._translation_key("plan", question), plan)
+        if plan["sql"]:
+            self._remember_exchange(session_id, question, plan["sql"])
+
+    def _start_plan(
+        self,
+        question: str,
+        conversation_context: bool,
+        session_id: str
+    ) -> Tuple[List[Dict[str, str]], Optional[Dict[str, Any]], Optional[Dict[str, Any]]]:
+        """
+        Everything a query plan needs before the model call
 
-User request: """
+        Returns:
+            Tuple of (history, cached plan or None, model call arguments or
+            None when the plan was cached)
+        """
+        history = self._context(session_id, conversation_context)
+        cached_plan = self._cached_plan(question, history)
+        if cached_plan is not None:
+            return history, cached_plan, None
+        return history, None, self._plan_request(question, history)
+
+    def _plan_request(self, question: str, history: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Arguments for the combined intent + SQL call"""
+        return {
+            "model": MODEL,
+            "max_tokens": 1024,
+            "system": self._system(),
+            "messages": self._conversation_messages(question, history),
+            "tools": [QUERY_PLAN_TOOL],
+            "tool_choice": {"type": "tool", "name": QUERY_PLAN_TOOL["name"]}
+        }
 
-        try:
-            response = self.client.messages.create(
-                model="claude-haiku-4-5",
-                max_tokens=256,
-                messages=[{
-                    "role": "user",
-                    "content": intent_prompt + question
-                }]
-            )
+    def _finish_plan(self, response: Any, history: List[Dict[str, str]]) -> Dict[str, Any]:
+        """Validate the submitted query plan (see _record_plan for caching it)"""
+        self._log_usage("plan", response)
+        plan = next((block.input for block in response.content if block.type == "tool_use"), None)
+        if plan is None:
+            raise Exception("Failed to generate SQL: model did not return a query plan")
 
-            response_text = response.content[0].text.strip()
+        intent = plan.get("intent") if plan.get("intent") in INTENTS else "query"
+        sql = self._extract_sql(plan.get("sql") or "") if intent != "prescription_map" else None
+        if intent != "prescription_map" and not sql:
+            raise Exception("Failed to generate SQL: model returned an empty query")
 
-            # Parse response
-            intent = "query"  # default
-            field_name = None
+        return {
+            "intent": intent,
+            "field_name": self._match_field_name(plan.get("field_name")),
+            "sql": sql,
+            # Answers that depended on earlier exchanges aren't reusable
+            "cacheable": self.translation_cache is not None and not history
+        }
 
-            for line in response_text.split('\n'):
-                if line.startswith('INTENT:'):
-                    intent = line.split(':', 1)[1].strip()
-                elif line.startswith('FIELD:'):
-                    field_value = line.split(':', 1)[1].strip()
-                    # Accept any field value that's not 'all', 'none', or empty
-                    if field_value.lower() not in ['all', 'none', '']:
-                        field_name = field_value
+    def _plan_query(
+        self,
+        question: str,
+        conversation_context: bool = False,
+        session_id: str = DEFAULT_SESSION_ID
+    ) -> Dict[str, Any]:
+        """
+        Detect intent and generate SQL with a single model call
 
-            return {
-                "intent": intent,
-                "field_name": field_name
-            }
+        Args:
+            question: User's natural language question
+            conversation_context: Whether to include conversation history
+            session_id: Conversation the question belongs to
+
+        Returns:
+            Dictionary with intent, field_name and sql (None for prescription
+            maps); pass it to _record_plan once it has been answered
+        """
+        history, cached_plan, request = self._start_plan(question, conversation_context, session_id)
+        if cached_plan is not None:
+            return cached_plan
 
+        try:
+            response = self.client.messages.create(**request)
         except Exception as e:
-            # Default to query on error
-            return {
-                "intent": "query",
-                "field_name": None
-            }
+            raise Exception(f"Failed to generate SQL: {str(e)}")
 
-    def execute_natural_language_query(self, question: str) -> Dict[str, Any]:
+        return self._finish_plan(response, history)
+
+    def execute_natural_language_query(
+        self,
+        question: str,
+        conversation_context: bool = False,
+        session_id: str = DEFAULT_SESSION_ID,
+        scatter_bins: Optional[int] = None,
+        page_size: Optional[int] = None
+    ) -> Dict[str, Any]:
         """
         Execute a natural language query end-to-end
 
         Args:
             question: User's natural language question
+            conversation_context: Whether to send the session's recent exchanges
+            session_id: Conversation the question belongs to
+            scatter_bins: Draw scatter plots as a density grid with this many
+                bins per axis instead of sampled points
+            page_size: Return only this many rows; the full result is kept
+                behind the response's cursor for get_result_page
 
         Returns:
             Dictionary with query results and metadata
         """
-        # First, detect the intent
-        intent_info = self._detect_intent(question)
+        # Obvious prescription requests skip the model entirely; everything
+        # else gets intent and SQL from one combined call
+        intent_info = self._classify_intent_locally(question) or self._plan_query(
+            question, conversation_context, session_id
+        )
 
         # If user wants a prescription map, return that intent
         if intent_info["intent"] == "prescription_map":
-            return {
-                "question": question,
-                "intent": "prescription_map",
-                "field_name": intent_info["field_name"] or "North of Road",
-                "sql": None,
-                "results": [],
-                "hex_ids": [],
-                "count": 0,
-                "summary": "I'll create a prescription map for you. This will generate variable rate application maps for nitrogen, phosphorus, and potassium."
-            }
+            response = self._prescription_response(question, intent_info)
+        else:
+            response = self._answer_query(question, intent_info, scatter_bins, page_size)
 
-        # Generate SQL from natural language
-        sql = self.natural_language_to_sql(question)
+        self._record_plan(question, intent_info, session_id)
+        return response
 
+    def _prescription_response(self, question: str, intent_info: Dict[str, Any]) -> Dict[str, Any]:
+        """Response telling the frontend to request a prescription map"""
+        return {
+            "question": question,
+            "intent": "prescription_map",
+            "field_name": intent_info["field_name"] or "North of Road",
+            "sql": None,
+            "results": [],
+            "hex_ids": [],
+            "count": 0,
+            "summary": "I'll create a prescription map for you. This will generate variable rate application maps for nitrogen, phosphorus, and potassium."
+        }
+
+    def _run_sql(self, sql: str) -> List[Dict[str, Any]]:
+        """Validate and execute generated SQL"""
         # Validate SQL
         self.db.validate_sql(sql)
 
-        # Execute query
-        results = self.db.execute_query(sql)
+        # Execute query, reading from a pre-aggregated rollup when one can answer it
+        return self.db.execute_query(self.db.route_query(sql))
 
-        # If user wants a scatter plot, prepare the plot data
+    def _stream_sql(self, sql: str, batch_size: int) -> Iterator["pyarrow.RecordBatch"]:
+        """Validate generated SQL and stream its results (see DatabaseConnection.stream_arrow)"""
+        self.db.validate_sql(sql)
+        return self.db.stream_arrow(self.db.route_query(sql), batch_size)
+
+    def _answer_query(
+        self,
+        question: str,
+        intent_info: Dict[str, Any],
+        scatter_bins: Optional[int] = None,
+        page_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """Run the generated SQL and build the query or scatter plot response"""
         if intent_info["intent"] == "scatter_plot":
-            scatter_plot_data = self._prepare_scatter_plot_data(results)
+            response = self._answer_scatter_plot(question, intent_info, scatter_bins)
+            if response:
+                return response
+
+        if page_size is not None:
+            return self._answer_query_paged(question, intent_info, page_size)
 
-            if scatter_plot_data:
-                # Get column metadata for axis labels
-                column_metadata = {}
-                if results and len(results) > 0:
-                    column_names = list(results[0].keys())
-                    column_metadata = self._get_column_metadata(column_names)
+        results = self._run_sql(intent_info["sql"])
+        return self._build_query_response(question, intent_info, results)
 
-                # Generate labels from metadata
-                x_col_meta = column_metadata.get(scatter_plot_data['x_column'], {})
-                y_col_meta = column_metadata.get(scatter_plot_data['y_column'], {})
+    def _answer_query_paged(self, question: str, intent_info: Dict[str, Any], page_size: int) -> Dict[str, Any]:
+        """
+        Run the generated SQL and respond with its first page
 
-                x_label = x_col_meta.get('display_name', scatter_plot_data['x_column'])
-                y_label = y_col_meta.get('display_name', scatter_plot_data['y_column'])
+        The full result is fetched as an Arrow table and, if it has more rows
+        than one page, retained behind a cursor for get_result_page. Count,
+        summary and field detection still cover every row.
 
-                if x_col_meta.get('unit'):
-                    x_label += f" ({x_col_meta['unit']})"
-                if y_col_meta.get('unit'):
-                    y_label += f" ({y_col_meta['unit']})"
+        Args:
+            question: User's natural language question
+            intent_info: Detected intent with the generated SQL
+            page_size: Rows in the first page
 
-                scatter_plot_data['x_label'] = x_label
-                scatter_plot_data['y_label'] = y_label
-                scatter_plot_data['title'] = f"{y_label} vs {x_label}"
+        Returns:
+            Query response for the first page plus "cursor" and "next_offset"
+            (both None when the first page holds every row) and "truncated",
+            set when the result was too large to keep behind a cursor so only
+            the first page can be read
+        """
+        sql = intent_info["sql"]
+
+        # Validate SQL
+        self.db.validate_sql(sql)
 
-                # Generate summary message
-                num_points = len(scatter_plot_data['data'][scatter_plot_data['x_column']])
-                total_results = len(results)
+        table = self.db.execute_arrow(self.db.route_query(sql))
+
+        field_names = None
+        if 'field_name' in table.column_names:
+            field_names = pc.unique(table.column('field_name')).to_pylist()
+
+        response = self._build_query_response(
+            question, intent_info, table.slice(0, page_size).to_pylist(),
+            count=table.num_rows, field_names=field_names
+        )
+
+        cursor = None
+        if table.num_rows > page_size:
+            cursor = self.db.result_cursors.open(table)
+            if cursor is None:
+                logger.warning(
+                    "Result of %s rows (%s bytes) exceeds the cursor budget; returning only the first page",
+                    table.num_rows, table.nbytes
+                )
+        response["cursor"] = cursor
+        response["next_offset"] = page_size if cursor else None
+        response["truncated"] = table.num_rows > page_size and cursor is None
+        return response
+
+    def get_result_page(self, cursor: str, offset: int, page_size: int) -> Optional[Dict[str, Any]]:
+        """
+        Read a page of a result retained by a paginated query
 
-                if num_points < total_results:
-                    summary = f"Created scatter plot showing the relationship between {scatter_plot_data['x_column']} and {scatter_plot_data['y_column']} (showing {num_points:,} randomly sampled points from {total_results:,} total data points)."
-                else:
-                    summary = f"Created scatter plot showing the relationship between {scatter_plot_data['x_column']} and {scatter_plot_data['y_column']} ({num_points:,} data points)."
-
-                return {
-                    "question": question,
-                    "intent": "scatter_plot",
-                    "field_name": None,
-                    "sql": sql,
-                    "results": results,
-                    "hex_ids": [],
-                    "count": len(results),
-                    "summary": summary,
-                    "view_type": "scatter_plot",
-                    "column_metadata": column_metadata,
-                    "scatter_plot_data": scatter_plot_data
-                }
-            else:
-                # Fallback: not enough numeric data for scatter plot, treat as normal query
-                summary = "I couldn't create a scatter plot from the query results. The data needs at least 2 numeric columns and 2 data points."
-                view_type = self._determine_view_type(results)
-                column_metadata = {}
-                if results and len(results) > 0:
-                    column_names = list(results[0].keys())
-                    column_metadata = self._get_column_metadata(column_names)
-
-                return {
-                    "question": question,
-                    "intent": "query",
-                    "field_name": None,
-                    "sql": sql,
-                    "results": results,
-                    "hex_ids": [],
-                    "count": len(results),
-                    "summary": summary,
-                    "view_type": view_type,
-                    "column_metadata": column_metadata
-                }
+        Args:
+            cursor: Cursor returned with the first page
+            offset: Index of the first row to return
+            page_size: Maximum number of rows to return
+
+        Returns:
+            Dictionary with the page's results and hex_ids, the total count
+            and next_offset (None after the last page), or None if the
+            cursor expired
+        """
+        table = self.db.result_cursors.get(cursor)
+        if table is None:
+            return None
+
+        results = table.slice(offset, page_size).to_pylist()
+        hex_ids = [row['h3_index'] for row in results] if 'h3_index' in table.column_names else []
+        next_offset = offset + page_size if offset + page_size < table.num_rows else None
+
+        return {
+            "cursor": cursor,
+            "offset": offset,
+            "results": results,
+            "hex_ids": hex_ids,
+            "count": table.num_rows,
+            "next_offset": next_offset
+        }
+
+    def _answer_scatter_plot(
+        self,
+        question: str,
+        intent_info: Dict[str, Any],
+        scatter_bins: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        Build a scatter plot response from points sampled or binned inside DuckDB
+
+        The full result set is never fetched; the response carries only the
+        sampled points or the density grid.
+
+        Args:
+            question: User's natural language question
+            intent_info: Detected intent with the generated SQL
+            scatter_bins: Bins per axis for a density grid; None for sampled points
+
+        Returns:
+            Scatter plot response, or None if the query can't be plotted
+        """
+        sql = intent_info["sql"]
+
+        # Validate SQL
+        self.db.validate_sql(sql)
+
+        scatter_plot_data = self._prepare_scatter_plot_data(self.db.route_query(sql), bins=scatter_bins)
+        if not scatter_plot_data:
+            return None
+
+        # Get column metadata for axis labels
+        column_metadata = self._get_column_metadata([scatter_plot_data['x_column'], scatter_plot_data['y_column']])
+
+        # Generate labels from metadata
+        x_col_meta = column_metadata.get(scatter_plot_data['x_column'], {})
+        y_col_meta = column_metadata.get(scatter_plot_data['y_column'], {})
+
+        x_label = x_col_meta.get('display_name', scatter_plot_data['x_column'])
+        y_label = y_col_meta.get('display_name', scatter_plot_data['y_column'])
+
+        if x_col_meta.get('unit'):
+            x_label += f" ({x_col_meta['unit']})"
+        if y_col_meta.get('unit'):
+            y_label += f" ({y_col_meta['unit']})"
+
+        scatter_plot_data['x_label'] = x_label
+        scatter_plot_data['y_label'] = y_label
+        scatter_plot_data['title'] = f"{y_label} vs {x_label}"
+
+        # Generate summary message
+        total_points = scatter_plot_data['total_points']
+        num_points = len(scatter_plot_data['data'][scatter_plot_data['x_column']]) if scatter_plot_data['mode'] == 'points' else total_points
+
+        if scatter_plot_data['mode'] == 'density':
+            pearson = scatter_plot_data['correlation']['pearson']
+            correlation = f", Pearson r = {pearson:.2f}" if pearson is not None else ""
+            summary = f"Created density plot showing the relationship between {scatter_plot_data['x_column']} and {scatter_plot_data['y_column']} ({total_points:,} data points in a {scatter_bins}×{scatter_bins} grid{correlation})."
+        elif num_points < total_points:
+            summary = f"Created scatter plot showing the relationship between {scatter_plot_data['x_column']} and {scatter_plot_data['y_column']} (showing {num_points:,} randomly sampled points from {total_points:,} total data points)."
+        else:
+            summary = f"Created scatter plot showing the relationship between {scatter_plot_data['x_column']} and {scatter_plot_data['y_column']} ({num_points:,} data points)."
+
+        return {
+            "question": question,
+            "intent": "scatter_plot",
+            "field_name": None,
+            "sql": sql,
+            "results": [],
+            "hex_ids": [],
+            "count": total_points,
+            "summary": summary,
+            "view_type": "scatter_plot",
+            "column_metadata": column_metadata,
+            "scatter_plot_data": scatter_plot_data
+        }
+
+    def _build_query_response(
+        self,
+        question: str,
+        intent_info: Dict[str, Any],
+        results: List[Dict],
+        count: Optional[int] = None,
+        field_names: Optional[List[Any]] = None
+    ) -> Dict[str, Any]:
+        """
+        Build the query or scatter plot response for executed SQL
+
+        Args:
+            question: User's natural language question
+            intent_info: Detected intent with the generated SQL
+            results: Rows returned by the SQL (or the first page of them)
+            count: Total number of rows when results is only a page
+            field_names: Distinct field_name values over all rows when
+                results is only a page
+
+        Returns:
+            Dictionary with query results and metadata
+        """
+        sql = intent_info["sql"]
+        if count is None:
+            count = len(results)
+
+        # Scatter plots that could be drawn were answered by _answer_scatter_plot
+        if intent_info["intent"] == "scatter_plot":
+            # Fallback: not enough numeric data for scatter plot, treat as normal query
+            summary = "I couldn't create a scatter plot from the query results. The data needs at least 2 numeric columns and 2 data points."
+            view_type = self._determine_view_type(results, count)
+            column_metadata = {}
+            if results and len(results) > 0:
+                column_names = list(results[0].keys())
+                column_metadata = self._get_column_metadata(column_names)
+
+            return {
+                "question": question,
+                "intent": "query",
+                "field_name": None,
+                "sql": sql,
+                "results": results,
+                "hex_ids": [],
+                "count": count,
+                "summary": summary,
+                "view_type": view_type,
+                "column_metadata": column_metadata
+            }
 
         # Otherwise, continue with normal SQL query flow
         # Extract h3_indexes if present (for map highlighting)
@@ -367,10 +837,10 @@ User request: """
             hex_ids = [row['h3_index'] for row in results]
 
         # Generate summary
-        summary = self._generate_summary(question, results, sql)
+        summary = self._generate_summary(question, results, sql, count)
 
         # Determine which view to use
-        view_type = self._determine_view_type(results)
+        view_type = self._determine_view_type(results, count)
 
         # Get column metadata for display
         column_metadata = {}
@@ -382,7 +852,10 @@ User request: """
         field_name = None
         if results and len(results) > 0 and 'field_name' in results[0]:
             # Check if all results have the same field_name
-            unique_fields = set(row['field_name'] for row in results if 'field_name' in row)
+            if field_names is not None:
+                unique_fields = set(field_names)
+            else:
+                unique_fields = set(row['field_name'] for row in results if 'field_name' in row)
             if len(unique_fields) == 1:
                 field_name = list(unique_fields)[0]
 
@@ -393,7 +866,7 @@ User request: """
             "sql": sql,
             "results": results,
             "hex_ids": hex_ids,
-            "count": len(results),
+            "count": count,
             "summary": summary,
             "view_type": view_type,
             "column_metadata": column_metadata
@@ -431,6 +904,40 @@ User request: """
         else:
             return f"I found {hex_count:,} hexes matching your query."
 
+    def _build_column_metadata_index(self) -> Dict[str, Dict[str, str]]:
+        """
+        Map every name a result column may carry to its display metadata
+
+        Keys are lowercased and cover each configured column's name, its
+        display name (as written and in snake_case) and those names with an
+        aggregation prefix ("avg_P_in_soil" -> "Avg Phosphorus in Soil").
+        Plain names win over prefixed ones when they collide.
+        """
+        columns_config = self.db.get_schema_info().get('columns', [])
+
+        base = []
+        for col_config in columns_config:
+            col_metadata = {
+                'display_name': col_config.get('display_name', col_config['name'].replace('_', ' ').title())
+            }
+            if 'unit' in col_config:
+                col_metadata['unit'] = col_config['unit']
+            display_name = col_metadata['display_name'].lower()
+            base.append(({col_config['name'].lower(), display_name.replace(' ', '_')}, display_name, col_metadata))
+
+        index = {}
+        for prefix in AGGREGATE_PREFIXES:
+            label = prefix.rstrip('_').title()  # "total_" -> "Total"
+            for names, _, col_metadata in base:
+                for name in names:
+                    index.setdefault(prefix + name, {**col_metadata, 'display_name': f"{label} {col_metadata['display_name']}"})
+
+        for names, display_name, col_metadata in base:
+            for name in names | {display_name}:
+                index[name] = col_metadata
+
+        return index
+
     def _get_column_metadata(self, column_names: List[str]) -> Dict[str, Dict[str, str]]:
         """
         Get display metadata for columns based on schema config
@@ -441,41 +948,13 @@ User request: """
         Returns:
             Dictionary mapping column names to their metadata (display_name, unit)
         """
-        schema_info = self.db.get_schema_info()
-        columns_config = schema_info.get('columns', [])
+        index = self._for_data_version("column_metadata", self._build_column_metadata_index)
 
         metadata = {}
         for col_name in column_names:
-            # First try exact match
-            col_config = next((c for c in columns_config if c['name'] == col_name), None)
-
-            # If no exact match, try stripping common aggregation prefixes
-            prefix_used = None
-            if not col_config:
-                # Common SQL aggregation/calculation prefixes
-                prefixes = ['total_', 'avg_', 'average_', 'sum_', 'min_', 'max_', 'count_']
-                base_name = col_name
-                for prefix in prefixes:
-                    if col_name.startswith(prefix):
-                        base_name = col_name[len(prefix):]
-                        prefix_used = prefix.rstrip('_').title()  # "total_" -> "Total"
-                        break
-
-                # Try to find base column after stripping prefix
-                if base_name != col_name:
-                    col_config = next((c for c in columns_config if c['name'] == base_name), None)
-
-            if col_config:
-                base_display_name = col_config.get('display_name', col_name.replace('_', ' ').title())
-                # If we stripped a prefix, add it back to the display name
-                display_name = f"{prefix_used} {base_display_name}" if prefix_used else base_display_name
-
-                col_metadata = {
-                    'display_name': display_name
-                }
-                if 'unit' in col_config:
-                    col_metadata['unit'] = col_config['unit']
-                metadata[col_name] = col_metadata
+            col_metadata = index.get(col_name.lower())
+            if col_metadata:
+                metadata[col_name] = dict(col_metadata)
             else:
                 # Fallback: convert snake_case to Title Case
                 metadata[col_name] = {
@@ -484,45 +963,47 @@ User request: """
 
         return metadata
 
-    def _get_numeric_columns(self, results: List[Dict]) -> List[str]:
+    def _get_numeric_columns(self, columns: List[Dict[str, str]]) -> List[str]:
         """
-        Get list of numeric columns from query results (excluding h3_index and field_name)
+        Get list of numeric columns from a query's result columns (excluding h3_index and field_name)
 
         Args:
-            results: Query results
+            columns: Result columns from DatabaseConnection.describe_query
 
         Returns:
             List of numeric column names
         """
-        if not results or len(results) == 0:
-            return []
-
-        numeric_cols = []
         skip_cols = {'h3_index', 'field_name'}
 
-        for key, value in results[0].items():
-            if key not in skip_cols and isinstance(value, (int, float)):
-                numeric_cols.append(key)
-
-        return numeric_cols
-
-    def _prepare_scatter_plot_data(self, results: List[Dict], max_points: int = 10000) -> Optional[Dict[str, Any]]:
+        return [
+            column['name'] for column in columns
+            if column['name'] not in skip_cols
+            and (column['type'] in NUMERIC_TYPES or column['type'].startswith('DECIMAL'))
+        ]
+
+    def _prepare_scatter_plot_data(
+        self,
+        sql: str,
+        max_points: int = SCATTER_MAX_POINTS,
+        bins: Optional[int] = None
+    ) -> Optional[Dict[str, Any]]:
         """
-        Prepare scatter plot data from query results
+        Prepare scatter plot data for a query
         Uses first two numeric columns automatically
-        Samples data randomly if there are more than max_points for efficient rendering
+        DuckDB drops rows with missing values and either takes a reservoir
+        sample of at most max_points or, with bins, counts points on a
+        bins x bins grid and computes correlation and a least-squares fit
+        line, so the payload stays the same size however many rows match
 
         Args:
-            results: Query results
+            sql: Query whose results are plotted
             max_points: Maximum number of points to include (default: 10000)
+            bins: Bins per axis for a density grid; None for sampled points
 
         Returns:
             Dictionary with scatter plot data or None if insufficient numeric columns
         """
-        if not results or len(results) < 2:
-            return None
-
-        numeric_cols = self._get_numeric_columns(results)
+        numeric_cols = self._get_numeric_columns(self.db.describe_query(sql))
 
         # Need at least 2 numeric columns for scatter plot
         if len(numeric_cols) < 2:
@@ -531,42 +1012,51 @@ User request: """
         x_column = numeric_cols[0]
         y_column = numeric_cols[1]
 
-        # Extract column data
-        data = {
-            x_column: [],
-            y_column: []
-        }
+        if bins is not None:
+            density = self.db.bin_points(sql, x_column, y_column, bins, bins)
+
+            # Need at least 2 data points
+            if not density or density['total_points'] < 2:
+                return None
 
-        for row in results:
-            x_val = row.get(x_column)
-            y_val = row.get(y_column)
+            return {
+                'mode': 'density',
+                'density': {
+                    'counts': density['counts'],
+                    'x_edges': density['x_edges'],
+                    'y_edges': density['y_edges']
+                },
+                'x_column': x_column,
+                'y_column': y_column,
+                'total_points': density['total_points'],
+                'correlation': {
+                    'pearson': density['pearson'],
+                    'spearman': density['spearman']
+                },
+                'fit_line': {
+                    'slope': density['slope'],
+                    'intercept': density['intercept']
+                }
+            }
 
-            # Only include rows with valid numeric values
-            if x_val is not None and y_val is not None:
-                data[x_column].append(float(x_val))
-                data[y_column].append(float(y_val))
+        points = self.db.sample_points(sql, x_column, y_column, max_points)
 
         # Need at least 2 data points
-        if len(data[x_column]) < 2:
+        if points['total_points'] < 2:
             return None
 
-        # Sample data if there are too many points
-        total_points = len(data[x_column])
-        if total_points > max_points:
-            # Random sampling to preserve distribution
-            indices = random.sample(range(total_points), max_points)
-            indices.sort()  # Keep chronological order if there is one
-
-            data[x_column] = [data[x_column][i] for i in indices]
-            data[y_column] = [data[y_column][i] for i in indices]
-
         return {
-            'data': data,
+            'mode': 'points',
+            'data': {
+                x_column: points['x'],
+                y_column: points['y']
+            },
             'x_column': x_column,
-            'y_column': y_column
+            'y_column': y_column,
+            'total_points': points['total_points']
         }
 
-    def _determine_view_type(self, results: List[Dict]) -> Optional[str]:
+    def _determine_view_type(self, results: List[Dict], count: Optional[int] = None) -> Optional[str]:
         """
         Determine the best view based on result structure
 
@@ -575,32 +1065,39 @@ User request: """
         2. If multiple rows → comparison/list → table
         3. Otherwise → None (display in chat only)
 
+        Args:
+            results: Query results (or their first page)
+            count: Total number of rows, if results is only a page
+
         Returns:
             'map', 'table', or None
         """
         if not results:
             return None
+        if count is None:
+            count = len(results)
 
         # Check for spatial data
         if 'h3_index' in results[0]:
             return 'map'
 
         # Check for multiple rows (comparison/list/aggregation)
-        if len(results) > 1:
+        if count > 1:
             return 'table'
 
         # Single value → no special view needed
         return None
 
-    def _generate_summary(self, question: str, results: List[Dict], sql: str) -> str:
-        """Generate a human-readable summary of query results"""
+    def _generate_summary(self, question: str, results: List[Dict], sql: str, count: Optional[int] = None) -> str:
+        """Generate a human-readable summary of query results (count is the total when results is a page)"""
         if not results:
             return "No results found for your query."
 
-        count = len(results)
+        if count is None:
+            count = len(results)
 
         # Check if it's a simple count query
-        if len(results) == 1 and len(results[0]) == 1:
+        if count == 1 and len(results[0]) == 1:
             key = list(results[0].keys())[0]
             value = results[0][key]
             return f"Result: {value:,}" if isinstance(value, (int, float)) else f"Result: {value}"
@@ -622,6 +1119,186 @@ User request: """
         # Default
         return f"Query returned {count:,} results."
 
-    def clear_history(self):
-        """Clear conversation history"""
-        self.conversation_history = []
+    def clear_history(self, session_id: str = DEFAULT_SESSION_ID):
+        """Clear one session's conversation history"""
+        self.conversations.clear(session_id)
+
+
+class AsyncQueryService(QueryService):
+    """
+    QueryService for async callers
+
+    Model calls are awaited through AsyncAnthropic and DuckDB work runs on
+    the database's executor, so the event loop stays free while a question
+    waits on either.
+    """
+    client_class = AsyncAnthropic
+
+    async def _plan_query(
+        self,
+        question: str,
+        conversation_context: bool = False,
+        session_id: str = DEFAULT_SESSION_ID
+    ) -> Dict[str, Any]:
+        """Detect intent and generate SQL with a single model call (see QueryService._plan_query)"""
+        # History, cache keys and the prompt read the conversation store
+        # (Redis) and the schema and data version (DuckDB), so they run on
+        # the executor like the query itself
+        history, cached_plan, request = await self.db.run_in_executor(
+            self._start_plan, question, conversation_context, session_id
+        )
+        if cached_plan is not None:
+            return cached_plan
+
+        try:
+            response = await self.client.messages.create(**request)
+        except Exception as e:
+            raise Exception(f"Failed to generate SQL: {str(e)}")
+
+        return await self.db.run_in_executor(self._finish_plan, response, history)
+
+    async def _plan(self, question: str, conversation_context: bool, session_id: str) -> Dict[str, Any]:
+        """Local prescription shortcut, or the model's query plan"""
+        # The shortcut matches field names from the schema
+        intent_info = await self.db.run_in_executor(self._classify_intent_locally, question)
+        return intent_info or await self._plan_query(question, conversation_context, session_id)
+
+    async def clear_history(self, session_id: str = DEFAULT_SESSION_ID):
+        """Clear one session's conversation history"""
+        await self.db.run_in_executor(self.conversations.clear, session_id)
+
+    async def execute_natural_language_query(
+        self,
+        question: str,
+        conversation_context: bool = False,
+        session_id: str = DEFAULT_SESSION_ID,
+        scatter_bins: Optional[int] = None,
+        page_size: Optional[int] = None
+    ) -> Dict[str, Any]:
+        """
+        Execute a natural language query end-to-end
+
+        Args:
+            question: User's natural language question
+            conversation_context: Whether to send the session's recent exchanges
+            session_id: Conversation the question belongs to
+            scatter_bins: Draw scatter plots as a density grid with this many
+                bins per axis instead of sampled points
+            page_size: Return only this many rows; the full result is kept
+                behind the response's cursor for get_result_page
+
+        Returns:
+            Dictionary with query results and metadata
+        """
+        intent_info = await self._plan(question, conversation_context, session_id)
+
+        if intent_info["intent"] == "prescription_map":
+            response = self._prescription_response(question, intent_info)
+        else:
+            # Validation, execution and response building all touch DuckDB
+            response = await self.db.run_in_executor(self._answer_query, question, intent_info, scatter_bins, page_size)
+
+        await self.db.run_in_executor(self._record_plan, question, intent_info, session_id)
+        return response
+
+    async def stream_natural_language_query(
+        self,
+        question: str,
+        conversation_context: bool = False,
+        session_id: str = DEFAULT_SESSION_ID,
+        page_size: int = DEFAULT_STREAM_PAGE_SIZE,
+        scatter_bins: Optional[int] = None
+    ) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Execute a natural language query, yielding each stage as it completes
+
+        Yields (event, data) pairs in order: "intent", "sql", one or more
+        "results" pages of rows with their hex_ids, then "summary" with the
+        rest of the response, including the total count. Pages are read from
+        DuckDB as they're sent, so the full result is never materialized.
+        Prescription map requests go straight from "intent" to "summary", and
+        scatter plots from "sql" to "summary" (which carries the points).
+
+        Args:
+            question: User's natural language question
+            conversation_context: Whether to send the session's recent exchanges
+            session_id: Conversation the question belongs to
+            page_size: Rows per results event
+            scatter_bins: Draw scatter plots as a density grid with this many
+                bins per axis instead of sampled points
+
+        Yields:
+            Tuples of (event name, event data)
+        """
+        intent_info = await self._plan(question, conversation_context, session_id)
+        yield "intent", {"intent": intent_info["intent"], "field_name": intent_info["field_name"]}
+
+        if intent_info["intent"] == "prescription_map":
+            response = self._prescription_response(question, intent_info)
+        else:
+            yield "sql", {"sql": intent_info["sql"]}
+
+            # Plottable scatter queries never fetch rows; their sampled points
+            # arrive with the summary
+            response = None
+            if intent_info["intent"] == "scatter_plot":
+                response = await self.db.run_in_executor(self._answer_scatter_plot, question, intent_info, scatter_bins)
+
+        if response is None:
+            batches = await self.db.run_in_executor(self._stream_sql, intent_info["sql"], page_size)
+            # Serializes fetches with the final close, which may have to wait
+            # for a fetch still running when the client disconnected
+            batches_lock = threading.Lock()
+
+            def next_batch():
+                with batches_lock:
+                    return next(batches, None)
+
+            def close_batches():
+                with batches_lock:
+                    batches.close()
+
+            first_page = []
+            field_names = set()
+            offset = 0
+            loop = asyncio.get_running_loop()
+            try:
+                while True:
+                    # Not on the database executor: a stream keeps its own
+                    # cursor between fetches and must not hold a worker the
+                    # other queries need
+                    batch = await loop.run_in_executor(None, next_batch)
+                    if batch is None:
+                        break
+                    if not batch.num_rows:
+                        continue
+
+                    page = batch.to_pylist()
+                    if not offset:
+                        first_page = page
+                    if 'field_name' in batch.schema.names:
+                        field_names.update(pc.unique(batch.column('field_name')).to_pylist())
+
+                    # Same rule as the full response: scatter plots don't highlight hexes
+                    with_hex_ids = intent_info["intent"] != "scatter_plot" and 'h3_index' in batch.schema.names
+                    yield "results", {
+                        "offset": offset,
+                        "results": page,
+                        "hex_ids": [row['h3_index'] for row in page] if with_hex_ids else []
+                    }
+                    offset += batch.num_rows
+            finally:
+                # Closes the stream's cursor; runs off the loop and isn't
+                # awaited so it also happens when the stream is cancelled
+                loop.run_in_executor(None, close_batches)
+
+            if not offset:
+                yield "results", {"offset": 0, "results": [], "hex_ids": []}
+
+            response = await self.db.run_in_executor(
+                self._build_query_response, question, intent_info, first_page,
+                count=offset, field_names=list(field_names)
+            )
+
+        await self.db.run_in_executor(self._record_plan, question, intent_info, session_id)
+        yield "summary", {key: value for key, value in response.items() if key not in ("results", "hex_ids")}
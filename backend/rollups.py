@@ -0,0 +1,167 @@
+"""
+Routing of aggregate queries to pre-aggregated H3 rollup tables
+
+data/load_geojson.py builds one table per coarser H3 resolution with a row
+per (parent cell, field): hex_count, summed area and area-weighted means of
+the soil columns. Queries that only need field-level aggregates of those
+columns can be answered from a rollup instead of scanning every hex.
+"""
+from typing import Dict, Optional
+
+import sqlglot
+from sqlglot import exp
+
+# Rollup tables are named <prefix><resolution>, e.g. agricultural_hexes_res9
+ROLLUP_TABLE_PREFIX = "agricultural_hexes_res"
+
+# Base table the rollups are built from
+BASE_TABLE = "agricultural_hexes"
+
+# Columns stored as area-weighted means in every rollup
+ROLLUP_MEAN_COLUMNS = ["pH", "P_in_soil", "K_in_soil", "cec", "yield_target"]
+
+# Columns a rollup-eligible query may reference outside of aggregates
+ROLLUP_GROUP_COLUMNS = {"field_name"}
+
+# Columns selected for map requests, whichever table serves them
+MAP_COLUMNS = ["h3_index", "field_name", "hex_count", "area"] + ROLLUP_MEAN_COLUMNS
+
+
+def parse_rollup_tables(table_names) -> Dict[int, str]:
+    """
+    Map H3 resolution to rollup table name
+
+    Args:
+        table_names: Table names present in the database
+
+    Returns:
+        Dictionary of resolution -> table name for every rollup table
+    """
+    rollups = {}
+    for table_name in table_names:
+        suffix = table_name[len(ROLLUP_TABLE_PREFIX):]
+        if table_name.startswith(ROLLUP_TABLE_PREFIX) and suffix.isdigit():
+            rollups[int(suffix)] = table_name
+    return rollups
+
+
+def _column_name(node: exp.Expression) -> Optional[str]:
+    """Lowercased column name if node is a plain column reference"""
+    return node.name.lower() if isinstance(node, exp.Column) else None
+
+
+def _rewrite_aggregate(node: exp.AggFunc) -> Optional[exp.Expression]:
+    """
+    Translate one aggregate over the base table into its rollup equivalent
+
+    Returns:
+        The replacement expression, or None if the aggregate can't be
+        answered from a rollup
+    """
+    mean_columns = {col.lower(): col for col in ROLLUP_MEAN_COLUMNS}
+    argument = node.this
+
+    # COUNT(*) counts hexes, which the rollup stores per parent cell; SUM
+    # over no rows is NULL where COUNT is 0
+    if isinstance(node, exp.Count) and isinstance(argument, exp.Star):
+        return sqlglot.parse_one("COALESCE(SUM(hex_count), 0)", dialect="duckdb")
+
+    if isinstance(node, exp.Sum):
+        # Summed area and area-weighted totals are exact on rollups
+        if _column_name(argument) == "area":
+            return node.copy()
+        if isinstance(argument, exp.Mul):
+            names = {_column_name(argument.this), _column_name(argument.expression)}
+            if "area" in names and (names - {"area"}) <= set(mean_columns):
+                return node.copy()
+        return None
+
+    if isinstance(node, exp.Avg):
+        name = _column_name(argument)
+        if name == "area":
+            return sqlglot.parse_one("(SUM(area) / SUM(hex_count))", dialect="duckdb")
+        if name in mean_columns:
+            # Area-weighted mean of the parent means; equals the per-hex mean
+            # up to H3's cell-area variation within a resolution. Parents
+            # with no value (all hexes NULL) are left out of the weights, as
+            # AVG leaves out NULL hexes
+            column = mean_columns[name]
+            return sqlglot.parse_one(
+                f"(SUM({column} * area) / SUM(CASE WHEN {column} IS NOT NULL THEN area END))",
+                dialect="duckdb"
+            )
+
+    return None
+
+
+def rewrite_for_rollup(statement: exp.Expression, rollup_table: str) -> Optional[exp.Expression]:
+    """
+    Rewrite a query over agricultural_hexes to read from a rollup table
+
+    Eligible queries are a single SELECT over the base table with no joins,
+    subqueries or window functions, that only filter and group by
+    field_name (output aliases are allowed in HAVING and ORDER BY), alias
+    every aggregate, and only use aggregates with an exact
+    (or area-weighted) rollup equivalent: COUNT(*), SUM(area),
+    SUM(<column> * area), AVG(area) and AVG(<column>).
+
+    Args:
+        statement: Parsed query (not modified)
+        rollup_table: Name of the rollup table to read from
+
+    Returns:
+        The rewritten statement, or None if the query isn't eligible
+    """
+    statement = statement.copy()
+    if not isinstance(statement, exp.Select) or statement.ctes:
+        return None
+    if statement.args.get("joins") or statement.find(exp.Window) or statement.find(exp.TableSample):
+        return None
+    if any(isinstance(node, exp.Select) for node in statement.walk() if node is not statement):
+        return None
+
+    tables = list(statement.find_all(exp.Table))
+    if len(tables) != 1 or tables[0].name.lower() != BASE_TABLE:
+        return None
+
+    aggregates = list(statement.find_all(exp.AggFunc))
+    if not aggregates:
+        return None
+
+    # Aggregates must carry an alias so the result column names don't change
+    for projection in statement.expressions:
+        if projection.find(exp.AggFunc) and not isinstance(projection, exp.Alias):
+            return None
+
+    # Outside of aggregates only the grouping columns may appear, plus output
+    # aliases in HAVING and ORDER BY. Elsewhere (WHERE, GROUP BY) DuckDB
+    # binds a name to the table's column first, and an alias that shadows
+    # one would then mean something else on the rollup.
+    aliases = {projection.alias.lower() for projection in statement.expressions if projection.alias}
+    for node in statement.walk():
+        if isinstance(node, exp.Star) and not isinstance(node.parent, exp.Count):
+            return None
+        if isinstance(node, exp.Column) and not node.find_ancestor(exp.AggFunc):
+            name = node.name.lower()
+            if name in ROLLUP_GROUP_COLUMNS:
+                continue
+            if name in aliases and node.find_ancestor(exp.Having, exp.Order):
+                continue
+            return None
+
+    replacements = []
+    for aggregate in aggregates:
+        if aggregate.find_ancestor(exp.AggFunc):
+            return None
+        replacement = _rewrite_aggregate(aggregate)
+        if replacement is None:
+            return None
+        replacements.append((aggregate, replacement))
+
+    for aggregate, replacement in replacements:
+        aggregate.replace(replacement)
+
+    # Keep the original name as alias so qualified columns still resolve
+    table = tables[0]
+    table.replace(exp.alias_(exp.to_table(rollup_table), table.alias_or_name, table=True))
+    return statement
@@ -6,8 +6,9 @@ import json
 import os
 from pathlib import Path
 
-# API endpoint
+# API endpoints
 API_URL = "http://localhost:8000/api/prescription-map"
+BATCH_API_URL = "http://localhost:8000/api/prescription-map/batch"
 
 # Fields to generate prescription maps for
 FIELDS = [
@@ -26,6 +27,42 @@ def sanitize_filename(name: str) -> str:
     return name.lower().replace(" ", "_")
 
 
+def save_prescription_maps(field_name: str, prescription_maps: list):
+    """
+    Save each pass of a field's prescription maps as a GeoJSON file
+
+    Args:
+        field_name: Name of the field the maps belong to
+        prescription_maps: Passes as returned by the API
+    """
+    # Save each prescription map as a separate GeoJSON
+    field_safe_name = sanitize_filename(field_name)
+
+    for pmap in prescription_maps:
+        pass_name = pmap.get("pass", "unknown")
+        geojson = pmap.get("geojson", {})
+
+        # Create filename
+        pass_safe_name = sanitize_filename(pass_name)
+        filename = f"{field_safe_name}_{pass_safe_name}.geojson"
+        filepath = OUTPUT_DIR / filename
+
+        # Save GeoJSON
+        with open(filepath, 'w') as f:
+            json.dump(geojson, f, indent=2)
+
+        # Get stats from the feature
+        features = geojson.get("features", [])
+        if features:
+            props = features[0].get("properties", {})
+            rate = props.get("rate", 0)
+            unit = props.get("unit", "")
+            print(f"  ✓ Saved: {filename}")
+            print(f"    - Average rate: {rate} {unit}")
+
+    print(f"✓ All files saved to: {OUTPUT_DIR}")
+
+
 def test_prescription_map(field_name: str):
     """
     Call prescription map API and save GeoJSONs
@@ -57,33 +94,51 @@ def test_prescription_map(field_name: str):
         summary = data.get("summary", {})
 
         print(f"✓ Generated {summary.get('total_passes', 0)} prescription passes")
+        save_prescription_maps(field_name, prescription_maps)
 
-        # Save each prescription map as a separate GeoJSON
-        field_safe_name = sanitize_filename(field_name)
+    except requests.exceptions.RequestException as e:
+        print(f"❌ API request failed: {str(e)}")
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
 
-        for pmap in prescription_maps:
-            pass_name = pmap.get("pass", "unknown")
-            geojson = pmap.get("geojson", {})
 
-            # Create filename
-            pass_safe_name = sanitize_filename(pass_name)
-            filename = f"{field_safe_name}_{pass_safe_name}.geojson"
-            filepath = OUTPUT_DIR / filename
+def test_prescription_maps_batch(field_names: list):
+    """
+    Call the batch prescription map API once for all fields and save GeoJSONs
 
-            # Save GeoJSON
-            with open(filepath, 'w') as f:
-                json.dump(geojson, f, indent=2)
+    Results stream back as server-sent events in the order fields finish.
 
-            # Get stats from the feature
-            features = geojson.get("features", [])
-            if features:
-                props = features[0].get("properties", {})
-                rate = props.get("rate", 0)
-                unit = props.get("unit", "")
-                print(f"  ✓ Saved: {filename}")
-                print(f"    - Average rate: {rate} {unit}")
+    Args:
+        field_names: Names of the fields to process
+    """
+    try:
+        response = requests.post(
+            BATCH_API_URL,
+            json={"field_names": field_names},
+            stream=True,
+            timeout=300
+        )
+        response.raise_for_status()
 
-        print(f"✓ All files saved to: {OUTPUT_DIR}")
+        event = None
+        for line in response.iter_lines(decode_unicode=True):
+            if line.startswith("event: "):
+                event = line[len("event: "):]
+                continue
+            if not line.startswith("data: "):
+                continue
+
+            data = json.loads(line[len("data: "):])
+            if event == "result":
+                print(f"\n{'='*60}")
+                print(f"Processed field: {data['field_name']}")
+                print(f"{'='*60}")
+                print(f"✓ Generated {len(data['prescription_maps'])} prescription passes")
+                save_prescription_maps(data["field_name"], data["prescription_maps"])
+            elif event == "error":
+                print(f"❌ {data.get('field_name', 'Batch')}: {data['detail']}")
+            elif event == "done":
+                print(f"\n✓ Batch finished: {data['total'] - data['failed']}/{data['total']} succeeded")
 
     except requests.exceptions.RequestException as e:
         print(f"❌ API request failed: {str(e)}")
@@ -100,9 +155,8 @@ def main():
     print(f"Output directory: {OUTPUT_DIR}")
     print(f"Fields to process: {len(FIELDS)}")
 
-    # Process each field
-    for field_name in FIELDS:
-        test_prescription_map(field_name)
+    # Process every field in one batch request; the server builds them in parallel
+    test_prescription_maps_batch(FIELDS)
 
     print("\n" + "="*60)
     print("✓ Test complete!")
@@ -1,11 +1,22 @@
 """
 Load multiple GeoJSON files into DuckDB with field identifiers
 """
+import argparse
 import duckdb
+import os
 from pathlib import Path
 import sys
 import json
 
+# Coarser H3 resolutions pre-aggregated at load time
+DEFAULT_ROLLUP_RESOLUTIONS = [9, 11, 13]
+
+# Rollup tables are named <prefix><resolution>, e.g. agricultural_hexes_res9
+ROLLUP_TABLE_PREFIX = "agricultural_hexes_res"
+
+# Columns averaged (weighted by hex area) into each parent cell
+ROLLUP_MEAN_COLUMNS = ["pH", "P_in_soil", "K_in_soil", "cec", "yield_target"]
+
 
 def validate_schema_coverage(conn, schema_config_path):
     """
@@ -54,11 +65,256 @@ def validate_schema_coverage(conn, schema_config_path):
         print(f"\n✓ VALIDATION PASSED - All database columns are documented in schema_config.json")
         return True
 
-def load_geojson_files():
-    """Load all GeoJSON files into the database with field names"""
+def select_hexes_sql(file_path, field_name, include_field_name=True):
+    """
+    Build the SELECT that reads one field's GeoJSON into the table layout
+
+    Args:
+        file_path: Path to the GeoJSON file
+        field_name: Field identifier to attach to every hex
+        include_field_name: False for Parquet partitions, where field_name is
+            encoded in the directory name instead of the file
+
+    Returns:
+        SQL string
+    """
+    # DuckDB's ST_Read expands properties as columns; H3 strings are
+    # hex-encoded 64-bit integers, so store them natively as UBIGINT
+    field_name_column = f"'{field_name}' as field_name," if include_field_name else ""
+    return f"""
+        SELECT
+            ('0x' || h3_index)::UBIGINT as h3_index,
+            {field_name_column}
+            area,
+            pH,
+            P_in_soil,
+            K_in_soil,
+            cec,
+            yield_target,
+            calcium,
+            magnesium,
+            N_in_soil,
+            N_to_apply,
+            P_to_apply,
+            K_to_apply,
+            geom as geometry
+        FROM ST_Read('{file_path}')
+    """
+
+
+def write_parquet_partition(conn, file_path, field_name, parquet_dir):
+    """
+    Write one field as a hive partition (<parquet_dir>/field_name=<name>/)
+
+    Only this field's directory is replaced, so adding or reloading a field
+    never rewrites the others. The new data is written beside the old file
+    and renamed over it, so readers (and a crash mid-write) see either the
+    old or the new partition, never a missing one.
+    """
+    partition_dir = Path(parquet_dir) / f"field_name={field_name}"
+    partition_dir.mkdir(parents=True, exist_ok=True)
+
+    # The temporary name doesn't match the *.parquet glob readers use
+    data_path = partition_dir / "data.parquet"
+    temp_path = partition_dir / f"data.parquet.{os.getpid()}.tmp"
+    select_sql = select_hexes_sql(file_path, field_name, include_field_name=False)
+    conn.execute(f"COPY ({select_sql}) TO '{temp_path}' (FORMAT PARQUET);")
+    os.replace(temp_path, data_path)
 
-    # Database path (same directory as script)
-    db_path = str(Path(__file__).parent / "agricultural_data.db")
+    # Drop any other files readers would pick up from an earlier layout
+    for stale in partition_dir.glob("*.parquet"):
+        if stale != data_path:
+            stale.unlink()
+
+
+def load_duckdb_table(conn, geojson_files):
+    """
+    Rebuild the agricultural_hexes table inside the DuckDB database
+
+    Returns:
+        Total number of hexes loaded
+    """
+    # Drop existing table if it exists
+    print("\nDropping existing table...")
+    conn.execute("DROP TABLE IF EXISTS agricultural_hexes;")
+
+    # Create the table with field_name column
+    print("Creating table schema...")
+    conn.execute("""
+        CREATE TABLE agricultural_hexes (
+            h3_index UBIGINT PRIMARY KEY,
+            field_name VARCHAR NOT NULL,
+            area DOUBLE,
+            pH DOUBLE,
+            P_in_soil DOUBLE,
+            K_in_soil DOUBLE,
+            cec DOUBLE,
+            yield_target DOUBLE,
+            calcium DOUBLE,
+            magnesium DOUBLE,
+            N_in_soil DOUBLE,
+            N_to_apply DOUBLE,
+            P_to_apply DOUBLE,
+            K_to_apply DOUBLE,
+            geometry GEOMETRY
+        );
+    """)
+
+    # Load each GeoJSON file
+    total_rows = 0
+    for file_info in geojson_files:
+        file_path = file_info["path"]
+        field_name = file_info["field_name"]
+
+        print(f"\nLoading {field_name} from {Path(file_path).name}...")
+
+        # Check if file exists
+        if not Path(file_path).exists():
+            print(f"  WARNING: File not found: {file_path}")
+            continue
+
+        # Read GeoJSON and insert into table
+        conn.execute(f"INSERT INTO agricultural_hexes {select_hexes_sql(file_path, field_name)};")
+
+        # Get count for this field
+        result = conn.execute(f"""
+            SELECT COUNT(*) as count
+            FROM agricultural_hexes
+            WHERE field_name = '{field_name}'
+        """).fetchone()
+
+        field_count = result[0]
+        total_rows += field_count
+        print(f"  ✓ Loaded {field_count:,} hexes")
+
+    # Create index on field_name for faster queries
+    print("\nCreating indexes...")
+    conn.execute("CREATE INDEX idx_field_name ON agricultural_hexes(field_name);")
+    conn.execute("CREATE INDEX idx_p_in_soil ON agricultural_hexes(P_in_soil);")
+    conn.execute("CREATE INDEX idx_k_in_soil ON agricultural_hexes(K_in_soil);")
+    conn.execute("CREATE INDEX idx_n_in_soil ON agricultural_hexes(N_in_soil);")
+    conn.execute("CREATE INDEX idx_ph ON agricultural_hexes(pH);")
+    conn.execute("CREATE INDEX idx_cec ON agricultural_hexes(cec);")
+    conn.execute("CREATE INDEX idx_calcium ON agricultural_hexes(calcium);")
+    conn.execute("CREATE INDEX idx_magnesium ON agricultural_hexes(magnesium);")
+
+    return total_rows
+
+
+def load_parquet_partitions(conn, geojson_files, parquet_dir):
+    """
+    Write each field to its own Parquet partition and expose them as a view
+
+    The view has the same name and columns as the DuckDB table, so schema
+    validation and the summary below work unchanged.
+
+    Returns:
+        Total number of hexes across all partitions
+    """
+    for file_info in geojson_files:
+        file_path = file_info["path"]
+        field_name = file_info["field_name"]
+
+        print(f"\nWriting {field_name} from {Path(file_path).name}...")
+
+        # Check if file exists
+        if not Path(file_path).exists():
+            print(f"  WARNING: File not found: {file_path}")
+            continue
+
+        write_parquet_partition(conn, file_path, field_name, parquet_dir)
+        print(f"  ✓ Wrote partition field_name={field_name}")
+
+    conn.execute(f"""
+        CREATE VIEW agricultural_hexes AS
+        SELECT * FROM read_parquet('{parquet_dir}/*/*.parquet', hive_partitioning = true);
+    """)
+
+    return conn.execute("SELECT COUNT(*) FROM agricultural_hexes").fetchone()[0]
+
+
+def build_rollups(conn, resolutions):
+    """
+    Build pre-aggregated rollup tables at coarser H3 resolutions
+
+    Each rollup has one row per (parent cell, field) with the hex count, the
+    summed area and area-weighted means of ROLLUP_MEAN_COLUMNS. The backend
+    routes zoomed-out map requests and eligible aggregate queries to them.
+
+    Args:
+        conn: DuckDB connection holding the agricultural_hexes table
+        resolutions: H3 resolutions to build; those not coarser than the
+            data itself are skipped
+    """
+    # Replace any rollups from a previous load
+    existing = conn.execute(f"""
+        SELECT table_name FROM information_schema.tables
+        WHERE table_name LIKE '{ROLLUP_TABLE_PREFIX}%'
+    """).fetchall()
+    for (table_name,) in existing:
+        conn.execute(f"DROP TABLE {table_name};")
+
+    # H3 keeps the resolution in bits 52-55 and one 3-bit digit per finer
+    # resolution below it; a parent has its resolution set and the digits
+    # past it filled with 7 (unused)
+    conn.execute("""
+        CREATE OR REPLACE TEMP MACRO h3_cell_to_parent(cell, res) AS
+            ((cell & ~(15::UBIGINT << 52)) | (res::UBIGINT << 52) | ((1::UBIGINT << (3 * (15 - res))) - 1))::UBIGINT;
+    """)
+    data_resolution = conn.execute(
+        "SELECT MIN((h3_index >> 52) & 15) FROM agricultural_hexes"
+    ).fetchone()[0]
+
+    weighted_means = ",\n".join(
+        f"SUM({col} * area) / SUM(CASE WHEN {col} IS NOT NULL THEN area END) as {col}"
+        for col in ROLLUP_MEAN_COLUMNS
+    )
+
+    print("\nBuilding rollups...")
+    for resolution in sorted(set(resolutions)):
+        if data_resolution is None or resolution >= data_resolution:
+            print(f"  Skipping res {resolution}: data is stored at res {data_resolution}")
+            continue
+
+        table_name = f"{ROLLUP_TABLE_PREFIX}{resolution}"
+        conn.execute(f"""
+            CREATE TABLE {table_name} AS
+            SELECT
+                h3_cell_to_parent(h3_index, {resolution}) as h3_index,
+                field_name,
+                COUNT(*) as hex_count,
+                SUM(area) as area,
+                {weighted_means}
+            FROM agricultural_hexes
+            GROUP BY ALL;
+        """)
+        row_count = conn.execute(f"SELECT COUNT(*) FROM {table_name}").fetchone()[0]
+        print(f"  ✓ {table_name}: {row_count:,} cells")
+
+
+def load_geojson_files(storage="duckdb", parquet_dir=None, only_fields=None, rollup_resolutions=None, db_path=None):
+    """
+    Load all GeoJSON files into the database with field names
+
+    Args:
+        storage: "duckdb" to build agricultural_data.db, "parquet" to write
+            hive-partitioned Parquet files (one partition per field)
+        parquet_dir: Output directory for parquet storage
+        only_fields: Optional list of field names to (re)load. Parquet only.
+        rollup_resolutions: H3 resolutions to pre-aggregate (duckdb storage
+            only). Defaults to DEFAULT_ROLLUP_RESOLUTIONS.
+        db_path: Output database for duckdb storage. A running API keeps its
+            database file locked, so write a new file and switch the API to
+            it with POST /api/reload?database_file=<name>.
+    """
+    if rollup_resolutions is None:
+        rollup_resolutions = DEFAULT_ROLLUP_RESOLUTIONS
+
+    # Database path (default: same directory as script)
+    if db_path is None:
+        db_path = str(Path(__file__).parent / "agricultural_data.db")
+    if parquet_dir is None:
+        parquet_dir = str(Path(__file__).parent / "agricultural_hexes")
 
     # GeoJSON files to load with their field names (in field-geojsons subdirectory)
     geojson_files = [
@@ -76,8 +332,14 @@ def load_geojson_files():
         }
     ]
 
-    # Connect to DuckDB
-    conn = duckdb.connect(db_path)
+    if only_fields:
+        if storage != "parquet":
+            print("✗ Loading individual fields is only supported with parquet storage")
+            sys.exit(1)
+        geojson_files = [f for f in geojson_files if f["field_name"] in only_fields]
+
+    # Connect to DuckDB (parquet storage only needs a scratch in-memory database)
+    conn = duckdb.connect(db_path if storage == "duckdb" else ":memory:")
 
     try:
         # Install and load spatial extension
@@ -85,91 +347,11 @@ def load_geojson_files():
         conn.execute("INSTALL spatial;")
         conn.execute("LOAD spatial;")
 
-        # Drop existing table if it exists
-        print("\nDropping existing table...")
-        conn.execute("DROP TABLE IF EXISTS agricultural_hexes;")
-
-        # Create the table with field_name column
-        print("Creating table schema...")
-        conn.execute("""
-            CREATE TABLE agricultural_hexes (
-                h3_index VARCHAR PRIMARY KEY,
-                field_name VARCHAR NOT NULL,
-                area DOUBLE,
-                pH DOUBLE,
-                P_in_soil DOUBLE,
-                K_in_soil DOUBLE,
-                cec DOUBLE,
-                yield_target DOUBLE,
-                calcium DOUBLE,
-                magnesium DOUBLE,
-                N_in_soil DOUBLE,
-                N_to_apply DOUBLE,
-                P_to_apply DOUBLE,
-                K_to_apply DOUBLE,
-                geometry GEOMETRY
-            );
-        """)
-
-        # Load each GeoJSON file
-        total_rows = 0
-        for file_info in geojson_files:
-            file_path = file_info["path"]
-            field_name = file_info["field_name"]
-
-            print(f"\nLoading {field_name} from {Path(file_path).name}...")
-
-            # Check if file exists
-            if not Path(file_path).exists():
-                print(f"  WARNING: File not found: {file_path}")
-                continue
-
-            # Read GeoJSON and insert into table
-            # DuckDB's ST_Read expands properties as columns
-            insert_sql = f"""
-                INSERT INTO agricultural_hexes
-                SELECT
-                    h3_index,
-                    '{field_name}' as field_name,
-                    area,
-                    pH,
-                    P_in_soil,
-                    K_in_soil,
-                    cec,
-                    yield_target,
-                    calcium,
-                    magnesium,
-                    N_in_soil,
-                    N_to_apply,
-                    P_to_apply,
-                    K_to_apply,
-                    geom as geometry
-                FROM ST_Read('{file_path}');
-            """
-
-            conn.execute(insert_sql)
-
-            # Get count for this field
-            result = conn.execute(f"""
-                SELECT COUNT(*) as count
-                FROM agricultural_hexes
-                WHERE field_name = '{field_name}'
-            """).fetchone()
-
-            field_count = result[0]
-            total_rows += field_count
-            print(f"  ✓ Loaded {field_count:,} hexes")
-
-        # Create index on field_name for faster queries
-        print("\nCreating indexes...")
-        conn.execute("CREATE INDEX idx_field_name ON agricultural_hexes(field_name);")
-        conn.execute("CREATE INDEX idx_p_in_soil ON agricultural_hexes(P_in_soil);")
-        conn.execute("CREATE INDEX idx_k_in_soil ON agricultural_hexes(K_in_soil);")
-        conn.execute("CREATE INDEX idx_n_in_soil ON agricultural_hexes(N_in_soil);")
-        conn.execute("CREATE INDEX idx_ph ON agricultural_hexes(pH);")
-        conn.execute("CREATE INDEX idx_cec ON agricultural_hexes(cec);")
-        conn.execute("CREATE INDEX idx_calcium ON agricultural_hexes(calcium);")
-        conn.execute("CREATE INDEX idx_magnesium ON agricultural_hexes(magnesium);")
+        if storage == "parquet":
+            total_rows = load_parquet_partitions(conn, geojson_files, parquet_dir)
+        else:
+            total_rows = load_duckdb_table(conn, geojson_files)
+            build_rollups(conn, rollup_resolutions)
 
         # Validate schema coverage - FATAL if columns are undocumented
         schema_config_path = Path(__file__).parent.parent / "backend" / "schema_config.json"
@@ -240,7 +422,7 @@ def load_geojson_files():
             print(f"   → {row[0]}: {row[1]:,} hexes")
 
         print("\n✓ Database ready!")
-        print(f"✓ Location: {db_path}")
+        print(f"✓ Location: {db_path if storage == 'duckdb' else parquet_dir}")
 
     except Exception as e:
         print(f"\n✗ Error: {str(e)}")
@@ -250,4 +432,22 @@ def load_geojson_files():
         conn.close()
 
 if __name__ == "__main__":
-    load_geojson_files()
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--storage", choices=["duckdb", "parquet"], default="duckdb",
+                        help="Build agricultural_data.db or hive-partitioned Parquet files")
+    parser.add_argument("--parquet-dir", default=None,
+                        help="Output directory for parquet storage (default: data/agricultural_hexes)")
+    parser.add_argument("--field", action="append", dest="fields",
+                        help="Only (re)load this field; may be repeated. Parquet storage only.")
+    parser.add_argument("--rollup-resolution", action="append", type=int, dest="rollup_resolutions",
+                        help=f"H3 resolution to pre-aggregate; may be repeated (default: {DEFAULT_ROLLUP_RESOLUTIONS})")
+    parser.add_argument("--db-path", default=None,
+                        help="Output database for duckdb storage (default: data/agricultural_data.db)")
+    args = parser.parse_args()
+    load_geojson_files(
+        storage=args.storage,
+        parquet_dir=args.parquet_dir,
+        only_fields=args.fields,
+        rollup_resolutions=args.rollup_resolutions,
+        db_path=args.db_path
+    )
@@ -10,13 +10,19 @@ const BACKEND_URL = process.env.QUERY_SERVICE_API_URL || 'http://localhost:8000'
 export async function POST(request: NextRequest) {
   try {
     const body = await request.json();
-    const { field_name } = body;
+    const { field_name, zones, zoning_method } = body;
 
     // Build URL with query parameter
     const url = new URL(`${BACKEND_URL}/api/prescription-map`);
     if (field_name) {
       url.searchParams.append('field_name', field_name);
     }
+    if (zones) {
+      url.searchParams.append('zones', String(zones));
+    }
+    if (zoning_method) {
+      url.searchParams.append('zoning_method', zoning_method);
+    }
 
     const response = await fetch(url.toString(), {
       method: 'POST',
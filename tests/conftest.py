@@ -0,0 +1,13 @@
+"""
+Shared pytest setup for the backend tests
+
+The backend modules import each other by bare name (as they do when run
+from backend/), so backend/ goes on the import path, along with data/ for
+the loader.
+"""
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT / "data"))
+sys.path.insert(0, str(ROOT / "backend"))
@@ -0,0 +1,107 @@
+"""
+Tests for paginated /api/query results and their cursors
+
+Run with: pytest tests
+"""
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+import query_service
+from query_service import MAX_PAGE_SIZE, AsyncQueryService
+from test_rollups import HEXES, open_database
+
+HEX_IDS = sorted(format(h3_index, "x") for h3_index, *_ in HEXES)
+
+
+class AsyncPlanningClient:
+    """Stands in for the AsyncAnthropic client, always planning the same SQL"""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.messages = self
+
+    async def create(self, **request):
+        plan = {"intent": "query", "field_name": None, "sql": self.sql}
+        return SimpleNamespace(content=[SimpleNamespace(type="tool_use", input=plan)])
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    db = open_database(tmp_path / "agricultural_data.db", HEXES)
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    monkeypatch.setenv("CONVERSATION_STORE", "memory")
+    monkeypatch.setattr(query_service, "get_db", lambda: db)
+    monkeypatch.setattr(main, "get_db", lambda: db)
+    yield db
+    db.close()
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """API client answering every question with all hexes in h3_index order"""
+    service = AsyncQueryService()
+    service.client = AsyncPlanningClient("SELECT h3_index, P_in_soil FROM agricultural_hexes ORDER BY h3_index")
+    monkeypatch.setattr(main, "query_service", service)
+    # Not entered as a context manager, so the startup hooks don't run
+    return TestClient(main.app)
+
+
+def ask(client, page_size):
+    return client.post("/api/query", json={"question": "list the hexes", "page_size": page_size})
+
+
+def test_query_pages_through_every_row(client):
+    first = ask(client, 3).json()
+    assert first["hex_ids"] == HEX_IDS[:3]
+    assert first["count"] == len(HEXES)
+    assert first["next_offset"] == 3
+    assert not first["truncated"]
+
+    hex_ids, offset = first["hex_ids"], first["next_offset"]
+    while offset is not None:
+        page = client.get(f"/api/query/pages/{first['cursor']}", params={"offset": offset, "page_size": 3}).json()
+        assert page["count"] == len(HEXES)
+        hex_ids += page["hex_ids"]
+        offset = page["next_offset"]
+    assert hex_ids == HEX_IDS
+
+
+def test_single_page_results_have_no_cursor(client):
+    response = ask(client, len(HEXES)).json()
+    assert response["hex_ids"] == HEX_IDS
+    assert response["cursor"] is None
+    assert response["next_offset"] is None
+    assert not response["truncated"]
+
+
+@pytest.mark.parametrize("page_size", [0, MAX_PAGE_SIZE + 1])
+def test_page_size_is_capped(client, page_size):
+    assert ask(client, page_size).status_code == 400
+
+    cursor = ask(client, 3).json()["cursor"]
+    assert client.get(f"/api/query/pages/{cursor}", params={"page_size": page_size}).status_code == 400
+    assert client.get(f"/api/query/pages/{cursor}", params={"offset": -1}).status_code == 400
+    assert client.get(f"/api/query/pages/{cursor}", params={"page_size": MAX_PAGE_SIZE}).status_code == 200
+
+
+def test_result_over_cursor_budget_is_truncated(client, db):
+    db.result_cursors.max_bytes = 1
+
+    response = ask(client, 3).json()
+    assert response["hex_ids"] == HEX_IDS[:3]
+    assert response["count"] == len(HEXES)
+    assert response["cursor"] is None
+    assert response["next_offset"] is None
+    assert response["truncated"]
+
+
+def test_deleted_cursor_is_gone(client, db):
+    cursor = ask(client, 3).json()["cursor"]
+
+    assert client.delete(f"/api/query/pages/{cursor}").status_code == 200
+    assert db.result_cursors.current_bytes == 0
+    assert client.get(f"/api/query/pages/{cursor}", params={"offset": 3}).status_code == 404
+    assert client.delete(f"/api/query/pages/{cursor}").status_code == 404
@@ -0,0 +1,168 @@
+"""
+Tests for the in-memory and Redis conversation stores
+
+Run with: pytest tests
+"""
+import pytest
+
+import conversation_store
+from conversation_store import InMemoryConversationStore, RedisConversationStore, create_conversation_store
+
+
+def exchange(number):
+    return [
+        {"role": "user", "content": f"question {number}"},
+        {"role": "assistant", "content": f"SELECT {number}"}
+    ]
+
+
+class Clock:
+    """Replaces time.monotonic in conversation_store"""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(conversation_store.time, "monotonic", clock)
+    return clock
+
+
+class FakeRedis:
+    """The list, expiry and pipeline commands RedisConversationStore uses"""
+
+    def __init__(self):
+        self.lists = {}
+        self.ttls = {}
+
+    def pipeline(self):
+        return FakePipeline(self)
+
+    def rpush(self, key, *values):
+        self.lists.setdefault(key, []).extend(values)
+
+    def ltrim(self, key, start, end):
+        values = self.lists.get(key, [])
+        self.lists[key] = values[start:] if end == -1 else values[start:end + 1]
+
+    def lrange(self, key, start, end):
+        values = self.lists.get(key, [])
+        return values[start:] if end == -1 else values[start:end + 1]
+
+    def expire(self, key, seconds):
+        if key in self.lists:
+            self.ttls[key] = seconds
+
+    def delete(self, key):
+        self.ttls.pop(key, None)
+        return int(self.lists.pop(key, None) is not None)
+
+
+class FakePipeline:
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        return lambda *args: self.commands.append((name, args))
+
+    def execute(self):
+        return [getattr(self.client, name)(*args) for name, args in self.commands]
+
+
+def test_memory_store_keeps_the_latest_messages():
+    store = InMemoryConversationStore(max_messages=4)
+    for number in range(3):
+        store.append("s", exchange(number))
+
+    assert store.get("s") == exchange(1) + exchange(2)
+    assert store.get("other") == []
+
+
+def test_memory_store_returns_copies():
+    store = InMemoryConversationStore()
+    store.append("s", exchange(1))
+    store.get("s").append({"role": "user", "content": "not stored"})
+
+    assert store.get("s") == exchange(1)
+
+
+def test_memory_store_evicts_idle_sessions(clock):
+    store = InMemoryConversationStore(idle_seconds=60)
+    store.append("idle", exchange(1))
+    clock.now += 30
+    store.append("active", exchange(2))
+
+    # Reading renews a session
+    clock.now += 40
+    assert store.get("active") == exchange(2)
+    assert store.get("idle") == []
+    assert store.stats()["sessions"] == 1
+
+    clock.now += 60
+    assert store.stats()["sessions"] == 0
+
+
+def test_memory_store_drops_least_recently_used_sessions():
+    store = InMemoryConversationStore(max_sessions=2)
+    store.append("a", exchange(1))
+    store.append("b", exchange(2))
+    store.get("a")
+    store.append("c", exchange(3))
+
+    assert store.get("b") == []
+    assert store.get("a") == exchange(1)
+    assert store.get("c") == exchange(3)
+
+
+def test_memory_store_clear():
+    store = InMemoryConversationStore()
+    store.append("a", exchange(1))
+    store.append("b", exchange(2))
+    store.clear("a")
+    store.clear("missing")
+
+    assert store.get("a") == []
+    assert store.get("b") == exchange(2)
+
+
+def test_redis_store_keeps_the_latest_messages_and_renews_expiry():
+    client = FakeRedis()
+    store = RedisConversationStore(client, max_messages=4, idle_seconds=90.5)
+    for number in range(3):
+        store.append("s", exchange(number))
+
+    assert store.get("s") == exchange(1) + exchange(2)
+    assert client.ttls == {"conversation:s": 90}
+    assert store.get("other") == []
+    assert "conversation:other" not in client.ttls
+
+
+def test_redis_store_clear():
+    client = FakeRedis()
+    store = RedisConversationStore(client)
+    store.append("a", exchange(1))
+    store.append("b", exchange(2))
+    store.clear("a")
+
+    assert store.get("a") == []
+    assert store.get("b") == exchange(2)
+
+
+def test_create_conversation_store_reads_the_environment(monkeypatch):
+    monkeypatch.setenv("CONVERSATION_STORE", "memory")
+    monkeypatch.setenv("CONVERSATION_MAX_MESSAGES", "2")
+    monkeypatch.setenv("CONVERSATION_IDLE_SECONDS", "5")
+    store = create_conversation_store()
+
+    assert isinstance(store, InMemoryConversationStore)
+    assert (store.max_messages, store.idle_seconds) == (2, 5.0)
+
+    monkeypatch.setenv("CONVERSATION_STORE", "sqlite")
+    with pytest.raises(ValueError):
+        create_conversation_store()
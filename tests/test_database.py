@@ -0,0 +1,413 @@
+"""
+Tests for DatabaseConnection against a small on-disk DuckDB database
+
+Run with: pytest tests
+"""
+import asyncio
+import math
+import threading
+
+import duckdb
+import pyarrow as pa
+import pytest
+
+import database
+from database import DatabaseConnection, ResultCursorStore, QueryResultCache, _as_subquery, _estimate_size, normalize_sql
+
+# (h3_index, field_name, area, P_in_soil, yield_target) per hex
+HEXES = [
+    (0x8c2a1072b59a1ff, "North of Road", 0.5, 30.0, 200.0),
+    (0x8c2a1072b59a3ff, "North of Road", 0.5, 35.0, 220.0),
+    (0x8c2a1072b59a5ff, "South of Road", 0.5, 80.0, 240.0)
+]
+
+
+def write_database(path, hexes=HEXES):
+    """Write an agricultural_hexes table to a new database file"""
+    conn = duckdb.connect(str(path))
+    conn.execute("""
+        CREATE TABLE agricultural_hexes (
+            h3_index UBIGINT, field_name VARCHAR, area DOUBLE, P_in_soil DOUBLE, yield_target DOUBLE
+        )
+    """)
+    conn.executemany("INSERT INTO agricultural_hexes VALUES (?, ?, ?, ?, ?)", hexes)
+    conn.close()
+
+
+@pytest.fixture
+def db(tmp_path):
+    """Pooled read-only connection that never needs the spatial extension"""
+    path = tmp_path / "agricultural_data.db"
+    write_database(path)
+    db = DatabaseConnection(str(path), pool_size=2, result_cache_bytes=0, query_timeout=0, lazy_spatial=True)
+    yield db
+    db.close()
+
+
+def count_hexes(db):
+    return db.execute_query("SELECT COUNT(*) AS count FROM agricultural_hexes")[0]["count"]
+
+
+def test_reload_while_query_running(db):
+    started, release = threading.Event(), threading.Event()
+
+    def slow_query():
+        # Holds an executor thread across the reload, then needs a cursor
+        started.set()
+        release.wait(5)
+        return count_hexes(db)
+
+    async def run():
+        query = asyncio.ensure_future(db.run_in_executor(slow_query))
+        await asyncio.get_running_loop().run_in_executor(None, started.wait, 5)
+
+        reloader = threading.Thread(target=db.reload, daemon=True)
+        reloader.start()
+        reloader.join(5)
+        assert not reloader.is_alive(), "reload() blocked on the running query"
+
+        release.set()
+        return await asyncio.wait_for(query, 5)
+
+    assert asyncio.run(run()) == 3
+    assert count_hexes(db) == 3
+
+
+def test_reload_switches_to_new_file(db, tmp_path):
+    assert count_hexes(db) == 3
+    version = db.get_data_version()
+
+    # The served file stays locked, so the loader writes a new one beside it
+    new_path = tmp_path / "agricultural_data-2.db"
+    write_database(new_path, HEXES[:2])
+
+    db.reload(str(new_path))
+    assert count_hexes(db) == 2
+    assert db.get_data_version() != version
+
+
+def test_reload_missing_file_keeps_serving(db, tmp_path):
+    with pytest.raises(FileNotFoundError):
+        db.reload(str(tmp_path / "missing.db"))
+    assert count_hexes(db) == 3
+
+
+def test_stream_arrow_reads_batches(db):
+    batches = db.stream_arrow("SELECT h3_index FROM agricultural_hexes ORDER BY h3_index", 2)
+    assert [batch.num_rows for batch in batches] == [2, 1]
+
+
+@pytest.mark.parametrize("pool_size", [0, 1])
+def test_open_stream_does_not_block_other_queries(tmp_path, pool_size):
+    path = tmp_path / "agricultural_data.db"
+    write_database(path)
+    db = DatabaseConnection(str(path), pool_size=pool_size, result_cache_bytes=0, query_timeout=0, lazy_spatial=True)
+    batches = db.stream_arrow("SELECT h3_index FROM agricultural_hexes ORDER BY h3_index", 1)
+    try:
+        assert next(batches).num_rows == 1
+
+        # The stream is parked mid-result, as with a slow client; a query on
+        # the executor still gets a connection
+        async def other_query():
+            return await asyncio.wait_for(db.run_in_executor(count_hexes, db), 5)
+
+        assert asyncio.run(other_query()) == 3
+        assert [batch.num_rows for batch in batches] == [1, 1]
+    finally:
+        # Also releases whatever a blocked query is waiting for
+        batches.close()
+        db.close()
+
+
+def test_reload_lets_open_stream_finish(db, tmp_path):
+    batches = db.stream_arrow("SELECT h3_index FROM agricultural_hexes ORDER BY h3_index", 1)
+    assert next(batches).num_rows == 1
+
+    new_path = tmp_path / "agricultural_data-2.db"
+    write_database(new_path, HEXES[:1])
+    db.reload(str(new_path))
+    assert count_hexes(db) == 1
+
+    # The old connection stays open until the stream is done with it
+    assert [batch.num_rows for batch in batches] == [1, 1]
+    retiring = [thread for thread in threading.enumerate() if thread.name == "duckdb-retire"]
+    for thread in retiring:
+        thread.join(5)
+    assert not any(thread.is_alive() for thread in retiring)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM '/etc/passwd'",
+    "SELECT * FROM \"/etc/passwd\"",
+    "SELECT * FROM read_json_objects('/etc/hosts')",
+    "SELECT * FROM parquet_metadata('data.parquet')",
+    "SELECT * FROM sqlite_scan('other.db', 'users')",
+    "SELECT * FROM read_csv('/etc/passwd')",
+    "SELECT * FROM range(10)",
+    "SELECT * FROM information_schema.tables",
+    "SELECT * FROM other_db.main.agricultural_hexes",
+    "SELECT field_name FROM agricultural_hexes WHERE h3_index IN (SELECT h3_index FROM 'hexes.csv')",
+    "WITH inner_scope AS (SELECT * FROM (WITH hidden AS (SELECT 1) SELECT * FROM hidden)) SELECT * FROM hidden"
+])
+def test_validate_sql_rejects_file_and_table_function_reads(db, sql):
+    with pytest.raises(Exception):
+        db.validate_sql(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT field_name, AVG(P_in_soil) AS avg_P_in_soil FROM agricultural_hexes GROUP BY field_name",
+    "SELECT h3_index FROM main.agricultural_hexes WHERE field_name = 'North of Road'",
+    "SELECT field_name, SUM(hex_count) AS hexes FROM agricultural_hexes_res9 GROUP BY field_name",
+    "WITH low AS (SELECT h3_index FROM agricultural_hexes WHERE P_in_soil < 40) SELECT COUNT(*) AS count FROM low",
+    "SELECT h3_index FROM agricultural_hexes UNION ALL SELECT h3_index FROM agricultural_hexes_res11"
+])
+def test_validate_sql_allows_data_tables_and_ctes(db, sql):
+    assert db.validate_sql(sql)
+
+
+def test_duckdb_refuses_file_access(db, tmp_path):
+    csv_path = tmp_path / "hexes.csv"
+    csv_path.write_text("h3_index\n1\n")
+
+    # Locked down from the first connect, even though the fixture is in
+    # lazy spatial mode and never loads the extension
+    setting = db.execute_query("SELECT current_setting('enable_external_access') AS enabled")
+    assert setting == [{"enabled": False}]
+    with pytest.raises(Exception, match="disabled by configuration"):
+        db.execute_query(f"SELECT h3_index FROM '{csv_path}'")
+    assert count_hexes(db) == 3
+
+
+def test_geometry_queries_fail_without_spatial(db):
+    db.connect()
+    if db._spatial_loaded:
+        pytest.skip("spatial is provisioned in this environment")
+    with pytest.raises(Exception, match="spatial extension is not available"):
+        db.execute_query("SELECT ST_Point(0, 0) AS point")
+
+
+def test_result_cache_evicts_least_recently_used():
+    rows = [{"n": 1}]
+    cache = QueryResultCache(max_bytes=2 * _estimate_size(rows))
+    cache.put("a", rows)
+    cache.put("b", [{"n": 2}])
+
+    # Reading "a" makes "b" the least recently used
+    assert cache.get("a") == rows
+    cache.put("c", [{"n": 3}])
+
+    assert cache.get("b") is None
+    assert cache.get("a") == rows
+    assert cache.get("c") == [{"n": 3}]
+    assert cache.stats()["bytes"] <= cache.max_bytes
+
+
+def test_result_cache_skips_values_over_budget():
+    rows = [{"n": 1}]
+    cache = QueryResultCache(max_bytes=_estimate_size(rows))
+    cache.put("a", rows)
+    cache.put("big", [{"n": i} for i in range(100)])
+
+    assert cache.get("big") is None
+    assert cache.get("a") == rows
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 1
+
+
+def test_result_cache_replacing_a_key_keeps_byte_count():
+    cache = QueryResultCache()
+    cache.put("a", [{"n": 1}])
+    size = cache.stats()["bytes"]
+    cache.put("a", [{"n": 1}])
+
+    assert cache.stats()["bytes"] == size
+    assert cache.stats()["entries"] == 1
+
+
+@pytest.mark.parametrize("first, second", [
+    ("SELECT h3_index FROM agricultural_hexes", "select  h3_index\nfrom agricultural_hexes;"),
+    (
+        "SELECT * FROM agricultural_hexes WHERE field_name IN ('b', 'a')",
+        "SELECT * FROM agricultural_hexes WHERE field_name IN ('a', 'b')"
+    )
+])
+def test_normalize_sql_shares_keys_for_equivalent_queries(first, second):
+    assert normalize_sql(first) == normalize_sql(second)
+
+
+@pytest.mark.parametrize("first, second", [
+    # Identifier casing names the result columns
+    ("SELECT area AS Area FROM agricultural_hexes", "SELECT area AS area FROM agricultural_hexes"),
+    ("SELECT * FROM agricultural_hexes WHERE field_name = 'a'", "SELECT * FROM agricultural_hexes WHERE field_name = 'A'"),
+    ("SELECT * FROM agricultural_hexes LIMIT 1", "SELECT * FROM agricultural_hexes LIMIT 10")
+])
+def test_normalize_sql_keeps_different_queries_apart(first, second):
+    assert normalize_sql(first) != normalize_sql(second)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT * FROM agricultural_hexes ORDER BY random() LIMIT 1",
+    "SELECT current_date",
+    "SELECT * FROM agricultural_hexes USING SAMPLE 10",
+    "SELECT 1; SELECT 2",
+    "SELECT FROM WHERE"
+])
+def test_normalize_sql_refuses_uncacheable_queries(sql):
+    assert normalize_sql(sql) is None
+
+
+def test_cached_results_are_not_served_after_reload(tmp_path):
+    path = tmp_path / "agricultural_data.db"
+    write_database(path)
+    db = DatabaseConnection(str(path), pool_size=1, query_timeout=0, lazy_spatial=True)
+    try:
+        assert count_hexes(db) == 3
+        assert count_hexes(db) == 3
+        assert db.result_cache.stats()["hits"] == 1
+
+        # The new file is a new data version; the old count must not come back
+        new_path = tmp_path / "agricultural_data-2.db"
+        write_database(new_path, HEXES[:1])
+        db.reload(str(new_path))
+        assert count_hexes(db) == 1
+    finally:
+        db.close()
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT P_in_soil, yield_target FROM agricultural_hexes -- soil vs yield",
+    "SELECT P_in_soil, yield_target FROM agricultural_hexes;  -- soil vs yield\n",
+    "SELECT P_in_soil, yield_target -- soil\nFROM agricultural_hexes;"
+])
+def test_sample_points_accepts_trailing_comments(db, sql):
+    points = db.sample_points(sql, "P_in_soil", "yield_target", 10)
+    assert sorted(zip(points["x"], points["y"])) == [(30.0, 200.0), (35.0, 220.0), (80.0, 240.0)]
+    assert points["total_points"] == 3
+
+
+def test_sample_points_counts_pairs_beyond_the_sample(db):
+    points = db.sample_points("SELECT P_in_soil, yield_target FROM agricultural_hexes", "P_in_soil", "yield_target", 2)
+    assert len(points["x"]) == 2
+    assert points["total_points"] == 3
+
+
+def test_as_subquery_keeps_unparseable_sql_on_its_own_line():
+    assert _as_subquery("SELECT FROM WHERE; ") == "SELECT FROM WHERE\n"
+
+
+def open_points(tmp_path, points):
+    """Serve (P_in_soil, yield_target) pairs, one hex each"""
+    path = tmp_path / "points.db"
+    write_database(path, [(i, "North of Road", 0.5, x, y) for i, (x, y) in enumerate(points)])
+    return DatabaseConnection(str(path), result_cache_bytes=0, query_timeout=0, lazy_spatial=True)
+
+
+def test_bin_points_averages_tied_ranks(tmp_path):
+    db = open_points(tmp_path, [(1.0, 1.0), (2.0, 3.0), (2.0, 2.0), (3.0, 4.0)])
+    try:
+        bins = db.bin_points("SELECT P_in_soil, yield_target FROM agricultural_hexes", "P_in_soil", "yield_target", 2, 3)
+    finally:
+        db.close()
+
+    # x ranks 1, 2.5, 2.5, 4 against y ranks 1, 3, 2, 4
+    assert bins["spearman"] == pytest.approx(4.5 / math.sqrt(4.5 * 5))
+    assert bins["pearson"] == pytest.approx(bins["spearman"])
+    assert bins["slope"] == pytest.approx(1.5)
+    assert bins["intercept"] == pytest.approx(-0.5)
+    assert bins["x_edges"] == pytest.approx([1.0, 2.0, 3.0])
+    assert bins["y_edges"] == pytest.approx([1.0, 2.0, 3.0, 4.0])
+    # The maximum lands in the last bin rather than one past it
+    assert bins["counts"] == [[1, 0], [0, 1], [0, 2]]
+    assert bins["total_points"] == 4
+
+
+def test_bin_points_constant_column_has_no_correlation(tmp_path):
+    db = open_points(tmp_path, [(5.0, 1.0), (5.0, 2.0), (5.0, 3.0)])
+    try:
+        bins = db.bin_points("SELECT P_in_soil, yield_target FROM agricultural_hexes", "P_in_soil", "yield_target", 4, 3)
+    finally:
+        db.close()
+
+    assert bins["pearson"] is None
+    assert bins["spearman"] is None
+    assert bins["slope"] is None
+    assert bins["intercept"] is None
+    assert bins["x_edges"] == [5.0] * 5
+    assert bins["counts"] == [[1, 0, 0, 0], [1, 0, 0, 0], [1, 0, 0, 0]]
+    assert bins["total_points"] == 3
+
+
+def test_bin_points_leaves_out_rows_missing_a_value(tmp_path):
+    db = open_points(tmp_path, [(1.0, 2.0), (None, 5.0), (3.0, None), (None, None), (2.0, 4.0)])
+    try:
+        bins = db.bin_points(
+            "SELECT P_in_soil, yield_target FROM agricultural_hexes -- soil vs yield",
+            "P_in_soil", "yield_target", 2, 2
+        )
+        assert db.bin_points(
+            "SELECT P_in_soil, yield_target FROM agricultural_hexes WHERE P_in_soil IS NULL",
+            "P_in_soil", "yield_target", 2, 2
+        ) is None
+    finally:
+        db.close()
+
+    assert bins["total_points"] == 2
+    assert bins["counts"] == [[1, 0], [0, 1]]
+    assert bins["pearson"] == pytest.approx(1.0)
+    assert bins["spearman"] == pytest.approx(1.0)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Monotonic clock the test advances by hand"""
+    clock = lambda: clock.now
+    clock.now = 1000.0
+    monkeypatch.setattr(database.time, "monotonic", clock)
+    return clock
+
+
+def rows(n):
+    return pa.table({"h3_index": pa.array(range(n), pa.uint64())})
+
+
+def test_result_cursors_expire_after_idle_ttl(clock):
+    store = ResultCursorStore(max_bytes=10_000, ttl_seconds=60)
+    cursor = store.open(rows(10))
+
+    clock.now += 59
+    assert store.get(cursor).num_rows == 10
+    # Reading renewed the TTL
+    clock.now += 59
+    assert store.get(cursor) is not None
+    clock.now += 60
+    assert store.get(cursor) is None
+    assert store.current_bytes == 0
+
+
+def test_result_cursors_evict_least_recently_read():
+    table = rows(10)
+    store = ResultCursorStore(max_bytes=table.nbytes * 2, ttl_seconds=60)
+    first, second = store.open(table), store.open(table)
+
+    store.get(first)
+    third = store.open(table)
+
+    assert store.get(second) is None
+    assert store.get(first) is not None and store.get(third) is not None
+    assert store.current_bytes == table.nbytes * 2
+
+
+def test_result_cursors_refuse_results_over_budget():
+    table = rows(10)
+    store = ResultCursorStore(max_bytes=table.nbytes - 1)
+    assert store.open(table) is None
+    assert store.current_bytes == 0
+
+
+def test_result_cursors_close():
+    store = ResultCursorStore()
+    cursor = store.open(rows(10))
+
+    assert store.close(cursor)
+    assert not store.close(cursor)
+    assert store.get(cursor) is None
+    assert store.current_bytes == 0
@@ -0,0 +1,100 @@
+"""
+Tests for the per-field footprint LRU and its on-disk spill
+
+Run with: pytest tests
+"""
+import h3.api.basic_int as h3
+import numpy as np
+import shapely
+
+from footprint_cache import FieldFootprint, FootprintCache
+from hex_geometry import cell_boundaries
+from zoning import hex_edges
+
+CENTER = 0x8c26084a598c1ff
+
+
+def footprint(k=1, with_edges=True):
+    """Footprint of the cells within k steps of CENTER"""
+    cells = np.array(sorted(h3.grid_disk(CENTER, k)), dtype=np.uint64)
+    boundaries = cell_boundaries(cells.tolist())
+    return FieldFootprint(
+        h3_indices=cells,
+        boundary=shapely.convex_hull(shapely.union_all(shapely.polygons(boundaries))),
+        edges=hex_edges(boundaries) if with_edges else None
+    )
+
+
+def test_evicts_least_recently_used():
+    cache = FootprintCache(max_entries=2)
+    first, second, third = footprint(1), footprint(2), footprint(3)
+    cache.put("North of Road", "v1", first)
+    cache.put("South of Road", "v1", second)
+
+    assert cache.get("North of Road", "v1") is first
+    cache.put("Railroad Pivot", "v1", third)
+
+    assert cache.get("South of Road", "v1") is None
+    assert cache.get("North of Road", "v1") is first
+    assert cache.get("Railroad Pivot", "v1") is third
+    assert cache.stats() == {
+        "entries": 2, "max_entries": 2, "spill_dir": None, "hits": 3, "misses": 1
+    }
+
+
+def test_versions_are_cached_separately():
+    cache = FootprintCache()
+    cache.put("North of Road", "v1", footprint(1))
+
+    assert cache.get("North of Road", "v2") is None
+    assert cache.get("North of Road", "v1") is not None
+
+
+def test_spilled_footprint_loads_in_a_new_cache(tmp_path):
+    original = footprint(2)
+    FootprintCache(spill_dir=str(tmp_path)).put("North / South", "v1", original)
+
+    # A restarted worker starts with an empty LRU
+    cache = FootprintCache(spill_dir=str(tmp_path))
+    loaded = cache.get("North / South", "v1")
+
+    assert np.array_equal(loaded.h3_indices, original.h3_indices)
+    assert shapely.equals(loaded.boundary, original.boundary)
+    assert np.array_equal(loaded.edges.twins, original.edges.twins)
+    assert np.array_equal(loaded.edges.vertices, original.edges.vertices)
+    assert loaded.edges.ccw == original.edges.ccw
+    # Now served from memory
+    assert cache.get("North / South", "v1") is loaded
+    assert cache.stats()["hits"] == 2
+
+
+def test_evicted_footprint_reloads_from_spill(tmp_path):
+    cache = FootprintCache(max_entries=1, spill_dir=str(tmp_path))
+    cache.put("North of Road", "v1", footprint(1, with_edges=False))
+    cache.put("South of Road", "v1", footprint(2, with_edges=False))
+
+    assert cache.stats()["entries"] == 1
+    reloaded = cache.get("North of Road", "v1")
+    assert len(reloaded.h3_indices) == 7
+    assert reloaded.edges is None
+
+
+def test_new_version_replaces_spilled_file(tmp_path):
+    cache = FootprintCache(spill_dir=str(tmp_path))
+    cache.put("North of Road", "v1", footprint(1))
+    cache.put("North of Road", "v2", footprint(2))
+    cache.put("South of Road", "v1", footprint(1))
+
+    assert len(list(tmp_path.glob("*.pkl"))) == 2
+    assert FootprintCache(spill_dir=str(tmp_path)).get("North of Road", "v1") is None
+
+
+def test_unreadable_spill_is_a_miss(tmp_path):
+    cache = FootprintCache(spill_dir=str(tmp_path))
+    cache.put("North of Road", "v1", footprint(1))
+    for path in tmp_path.glob("*.pkl"):
+        path.write_bytes(b"not a pickle")
+
+    cache = FootprintCache(spill_dir=str(tmp_path))
+    assert cache.get("North of Road", "v1") is None
+    assert cache.stats()["misses"] == 1
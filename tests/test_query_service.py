@@ -0,0 +1,118 @@
+"""
+Tests for the query service's local intent shortcut, plan caching and usage counters
+
+Run with: pytest tests
+"""
+from types import SimpleNamespace
+
+import pytest
+
+import query_service
+from query_service import PRESCRIPTION_REQUEST_PATTERN, QueryService
+from test_rollups import HEXES, open_database
+
+
+@pytest.mark.parametrize("question", [
+    "Create a prescription map for North of Road",
+    "make me a prescription",
+    "Generate rx map for South of Road",
+    "build prescriptions for every field",
+    "give me a variable-rate map",
+    "Please draw a VRA map",
+    "can you make a new prescription map for Railroad Pivot?",
+    "Could you please create the variable rate application map"
+])
+def test_prescription_requests_skip_the_model(question):
+    assert PRESCRIPTION_REQUEST_PATTERN.search(question)
+
+
+@pytest.mark.parametrize("question", [
+    "how much nitrogen do I need on the variable-rate zones?",
+    "which fields need work before I build prescriptions?",
+    "I need a prescription map",
+    "make sure hexes with low P get a higher rx rate",
+    "show hexes where the variable rate is above 100",
+    "create a table of average phosphorus by field",
+    "what did the last prescription map recommend for potassium?",
+    "get me the hexes that need the most nitrogen for the rx"
+])
+def test_other_questions_go_to_the_model(question):
+    assert not PRESCRIPTION_REQUEST_PATTERN.search(question)
+
+
+def test_usage_stats_total_model_calls(monkeypatch):
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    monkeypatch.setattr(query_service, "get_db", lambda: None)
+    service = QueryService()
+
+    usage = SimpleNamespace(input_tokens=3000, output_tokens=40, cache_read_input_tokens=2900)
+    service._log_usage("plan", SimpleNamespace(usage=usage))
+    service._log_usage("plan", SimpleNamespace(usage=usage))
+
+    stats = service.usage_stats()
+    assert stats["model_calls"] == {
+        "plan": {
+            "calls": 2,
+            "input_tokens": 6000,
+            "output_tokens": 80,
+            "cache_read_input_tokens": 5800,
+            "cache_creation_input_tokens": 0
+        }
+    }
+    assert stats["translation_cache"]["hits"] == 0
+
+
+class PlanningClient:
+    """Stands in for the Anthropic client, always planning the same SQL"""
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.messages = self
+
+    def create(self, **request):
+        self.calls += 1
+        plan = {"intent": "query", "field_name": None, "sql": self.sql}
+        return SimpleNamespace(content=[SimpleNamespace(type="tool_use", input=plan)])
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    db = open_database(tmp_path / "agricultural_data.db", HEXES)
+    monkeypatch.setenv("ANTHROPIC_API_KEY", "test")
+    monkeypatch.setenv("CONVERSATION_STORE", "memory")
+    monkeypatch.setattr(query_service, "get_db", lambda: db)
+    yield QueryService()
+    db.close()
+
+
+def test_failed_plans_are_not_cached_or_remembered(service):
+    service.client = PlanningClient("SELECT missing_column FROM agricultural_hexes")
+
+    for _ in range(2):
+        with pytest.raises(Exception, match="missing_column"):
+            service.execute_natural_language_query("how many hexes?", session_id="s")
+
+    assert service.client.calls == 2
+    assert service.conversations.get("s") == []
+
+
+def test_answered_plans_are_cached_and_remembered(service):
+    service.client = PlanningClient("SELECT COUNT(*) AS n FROM agricultural_hexes")
+
+    for _ in range(2):
+        assert service.execute_natural_language_query("how many hexes?", session_id="s")["count"] == 1
+
+    assert service.client.calls == 1
+    assert [message["role"] for message in service.conversations.get("s")] == ["user", "assistant"] * 2
+
+
+def test_local_prescription_shortcut_skips_the_model(service):
+    service.client = PlanningClient("SELECT 1")
+
+    response = service.execute_natural_language_query("create a prescription map for North of Road", session_id="s")
+
+    assert response["intent"] == "prescription_map"
+    assert response["field_name"] == "North of Road"
+    assert service.client.calls == 0
+    assert service.conversations.get("s") == []
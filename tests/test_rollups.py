@@ -0,0 +1,114 @@
+"""
+Tests that queries routed to a rollup table return what the base table does
+
+Run with: pytest tests
+"""
+import duckdb
+import pytest
+
+from database import DatabaseConnection, _parse_sql
+from load_geojson import build_rollups
+from rollups import rewrite_for_rollup
+
+# Resolution 12 hexes sharing one resolution 9 parent:
+# (h3_index, field_name, area, P_in_soil, yield_target)
+HEXES = [
+    (0x8c26084a598c1ff, "North of Road", 0.2, 30.0, 200.0),
+    (0x8c26084a598c3ff, "North of Road", 0.2, 35.0, 220.0),
+    (0x8c26084a598c9ff, "North of Road", 0.2, 38.0, 240.0),
+    (0x8c26084a598cbff, "North of Road", 0.2, 90.0, 240.0),
+    (0x8c26084a598ddff, "South of Road", 0.2, 20.0, 175.0),
+    (0x8c26084a59ab5ff, "South of Road", 0.2, 25.0, 175.0),
+    (0x8c26084a59ab7ff, "South of Road", 0.2, 85.0, 240.0)
+]
+
+
+# Resolution 12 hexes under a second resolution 9 parent with no P_in_soil
+HEXES_WITHOUT_P = [
+    (0x8c260858b6c01ff, "North of Road", 0.5, None, 200.0),
+    (0x8c260858b6c03ff, "North of Road", 0.5, None, 200.0)
+]
+
+
+def open_database(path, hexes):
+    """Write hexes and their res 9 rollup, then serve them"""
+    conn = duckdb.connect(str(path))
+    conn.execute("""
+        CREATE TABLE agricultural_hexes (
+            h3_index UBIGINT, field_name VARCHAR, area DOUBLE, pH DOUBLE, P_in_soil DOUBLE,
+            K_in_soil DOUBLE, cec DOUBLE, yield_target DOUBLE, N_in_soil DOUBLE
+        )
+    """)
+    conn.executemany(
+        "INSERT INTO agricultural_hexes VALUES (?, ?, ?, 6.5, ?, 150, 15, ?, 10)",
+        hexes
+    )
+    build_rollups(conn, [9])
+    conn.close()
+
+    return DatabaseConnection(str(path), result_cache_bytes=0, query_timeout=0, lazy_spatial=True)
+
+
+@pytest.fixture
+def db(tmp_path):
+    db = open_database(tmp_path / "agricultural_data.db", HEXES)
+    yield db
+    db.close()
+
+
+def rollup_rewrite(sql):
+    return rewrite_for_rollup(_parse_sql(sql)[0], "agricultural_hexes_res9")
+
+
+@pytest.mark.parametrize("sql", [
+    # The aliases shadow base columns, which WHERE reads per hex
+    """
+    SELECT field_name, COUNT(*) AS hexes, AVG(P_in_soil) AS P_in_soil
+    FROM agricultural_hexes WHERE P_in_soil < 40 GROUP BY field_name ORDER BY field_name
+    """,
+    """
+    SELECT field_name, COUNT(*) AS yield_target
+    FROM agricultural_hexes WHERE yield_target > 210 GROUP BY field_name ORDER BY field_name
+    """
+])
+def test_where_on_shadowing_alias_reads_base_table(db, sql):
+    assert rollup_rewrite(sql) is None
+    assert db.route_query(sql) == sql
+    assert db.execute_query(db.route_query(sql)) == db.execute_query(sql)
+    assert db.execute_query(sql)
+
+
+@pytest.mark.parametrize("sql", [
+    "SELECT field_name, ROUND(AVG(P_in_soil), 2) AS avg_P FROM agricultural_hexes GROUP BY field_name HAVING avg_P < 50 ORDER BY avg_P",
+    "SELECT field_name, COUNT(*) AS hexes FROM agricultural_hexes WHERE field_name = 'North of Road' GROUP BY field_name"
+])
+def test_eligible_queries_match_base_table(db, sql):
+    routed = db.route_query(sql)
+    assert "agricultural_hexes_res9" in routed
+    assert db.execute_query(routed) == db.execute_query(sql)
+
+
+def test_count_of_no_rows_is_zero(db):
+    sql = "SELECT COUNT(*) AS n FROM agricultural_hexes WHERE field_name = 'Nowhere'"
+    routed = db.route_query(sql)
+    assert "agricultural_hexes_res9" in routed
+    assert db.execute_query(routed) == db.execute_query(sql) == [{"n": 0}]
+
+
+def test_average_leaves_out_parents_without_values(tmp_path):
+    db = open_database(tmp_path / "agricultural_data.db", HEXES + HEXES_WITHOUT_P)
+    try:
+        sql = """
+        SELECT field_name, ROUND(AVG(P_in_soil), 6) AS avg_P
+        FROM agricultural_hexes GROUP BY field_name ORDER BY field_name
+        """
+        routed = db.route_query(sql)
+        assert "agricultural_hexes_res9" in routed
+        assert db.execute_query(routed) == db.execute_query(sql)
+    finally:
+        db.close()
+
+
+def test_ineligible_queries_are_not_rewritten():
+    assert rollup_rewrite("SELECT field_name, AVG(P_in_soil) AS p FROM agricultural_hexes GROUP BY field_name, p") is None
+    assert rollup_rewrite("WITH t AS (SELECT 1) SELECT COUNT(*) AS n FROM agricultural_hexes") is None
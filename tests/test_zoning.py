@@ -0,0 +1,94 @@
+"""
+Tests that the edge-based zone dissolve matches a generic polygon union
+
+Run with: pytest tests
+"""
+import h3.api.basic_int as h3
+import numpy as np
+import pytest
+import shapely
+
+from hex_geometry import cell_boundaries
+from zoning import _assemble_zones, dissolve_zones, hex_edges
+
+CENTER = 0x8c26084a598c1ff
+
+
+def disk(k):
+    """Cells within k steps of CENTER, with their distance from it"""
+    cells = np.array(sorted(h3.grid_disk(CENTER, k)), dtype=np.uint64)
+    distances = np.array([h3.grid_distance(CENTER, int(cell)) for cell in cells])
+    return cells, distances
+
+
+def assert_matches_union(cells, labels, zones):
+    """Each dissolved zone covers exactly its hexes, with as many parts"""
+    boundaries = cell_boundaries(cells.tolist())
+    hexes = shapely.polygons(boundaries)
+    dissolved = dissolve_zones(hex_edges(boundaries), labels)[:zones]
+
+    assert len(dissolved) == zones
+    for zone, geometry in enumerate(dissolved):
+        expected = shapely.union_all(hexes[labels == zone])
+        assert shapely.is_valid(geometry), shapely.is_valid_reason(geometry)
+        assert shapely.symmetric_difference(geometry, expected).area < 1e-9 * expected.area
+        assert len(geometry.geoms) == len(getattr(expected, "geoms", [expected]))
+        assert sum(len(part.interiors) for part in geometry.geoms) == sum(
+            len(part.interiors) for part in getattr(expected, "geoms", [expected])
+        )
+
+
+def test_ring_zone_has_a_hole_with_an_island_in_it():
+    cells, distances = disk(4)
+    # Zone 0 is the center plus an outer ring around zone 1, so its outer
+    # part has a hole and the center is an island inside that hole
+    labels = np.where((distances >= 1) & (distances <= 2), 1, 0)
+    assert_matches_union(cells, labels, 2)
+
+
+def test_missing_hexes_leave_holes():
+    cells, distances = disk(4)
+    rng = np.random.default_rng(0)
+    kept = (distances != 2) | (rng.random(len(cells)) < 0.5)
+    cells, distances = cells[kept], distances[kept]
+    assert_matches_union(cells, (distances % 2).astype(np.intp), 2)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_excluded_hexes_are_left_out(seed):
+    cells, _ = disk(6)
+    rng = np.random.default_rng(seed)
+    # Hexes without a rate are dissolved as an extra zone and dropped, as
+    # the prescription service does
+    labels = rng.integers(0, 3, len(cells))
+    labels[rng.random(len(cells)) < 0.2] = 3
+    assert_matches_union(cells, labels, 3)
+
+
+def test_hole_touching_its_shell_at_a_pinch_point():
+    # Hexes can't meet at a lone vertex, so the pinch is built by hand: a
+    # triangular hole whose first vertex is on the square shell's outline
+    square = shapely.linearrings([(0, 0), (4, 0), (4, 4), (0, 4)])
+    pinched_hole = shapely.linearrings([(0, 2), (2, 3), (2, 1)])
+    other_square = shapely.linearrings([(10, 0), (12, 0), (12, 2), (10, 2)])
+    other_zone = shapely.linearrings([(20, 0), (22, 0), (22, 2), (20, 2)])
+    rings = np.array([square, pinched_hole, other_square, other_zone])
+
+    zones = _assemble_zones(rings, np.array([0, 0, 0, 1]), hexes_ccw=True)
+
+    expected = shapely.MultiPolygon([
+        shapely.Polygon(square, holes=[pinched_hole]),
+        shapely.Polygon(other_square)
+    ])
+    assert shapely.is_valid(zones[0])
+    assert shapely.equals(zones[0], expected)
+    assert shapely.equals(zones[1], shapely.MultiPolygon([shapely.Polygon(other_zone)]))
+
+
+def test_hole_without_a_shell_is_dropped():
+    square = shapely.linearrings([(0, 0), (4, 0), (4, 4), (0, 4)])
+    stray_hole = shapely.linearrings([(10, 0), (10, 2), (12, 2), (12, 0)])
+
+    zones = _assemble_zones(np.array([square, stray_hole]), np.array([0, 0]), hexes_ccw=True)
+
+    assert shapely.equals(zones[0], shapely.MultiPolygon([shapely.Polygon(square)]))